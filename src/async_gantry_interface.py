@@ -0,0 +1,313 @@
+import asyncio
+import time
+import uuid
+from typing import Optional
+
+import aiohttp
+
+from gantry_errors import GantryResponseError
+from gantry_interface import GantryState, StateCache, STATE_ENDPOINTS
+from request_stats import REQUEST_STATS
+
+
+class AsyncGantryInterface:
+    """asyncio counterpart to GantryInterface.
+
+    Every method is a coroutine with the same name, arguments and return value
+    as the blocking version, so many gantries can be driven from one event loop.
+    """
+
+    def __init__(
+        self,
+        name: str = None,
+        pool_maxsize: int = 6,
+        session: Optional[aiohttp.ClientSession] = None,
+        cache_setters: bool = True,
+        request_deadline: float = 2.0,
+    ):
+        self.name = name
+        self.server_url = None
+        self.session_id = None
+        self.connected = False
+
+        # Connections are kept alive and capped per gantry. A session can also
+        # be shared across a fleet, in which case it is owned by the caller.
+        self.pool_maxsize = pool_maxsize
+        self._session = session
+        self._owns_session = session is None
+        # A request gives up after `request_deadline` seconds, like a blocking
+        # call with its retries, so a silent gantry can't hold a coroutine forever
+        self.request_deadline = request_deadline
+        self._timeout = aiohttp.ClientTimeout(total=request_deadline)
+
+        self._urls = {}
+        self._headers = {}
+        # Whether the firmware serves the combined /state endpoint, None until probed
+        self.has_state_endpoint = None
+
+        # Last written mode, speeds, multipliers, waypoint and PID/LPF values
+        self.state_cache = StateCache(enabled=cache_setters)
+
+    def _url(self, endpoint: str) -> str:
+        url = self._urls.get(endpoint)
+        if url is None:
+            # Strip leading slash from endpoint
+            url = f"{self.server_url}/{endpoint.lstrip('/')}"
+            self._urls[endpoint] = url
+        return url
+
+    async def _send_request(self, method, endpoint, data=None):
+        _, response = await self._request_with_status(method, endpoint, data)
+        return response
+
+    async def _request_with_status(self, method, endpoint, data=None) -> tuple:
+        """Send a request and return (status, response).
+
+        The response is None unless the status is 200, and the status is None
+        if no answer came back at all.
+        """
+        url = self._url(endpoint)
+        status = None
+        start = time.perf_counter()
+        try:
+            async with self._session.request(
+                method, url, json=data, headers=self._headers, timeout=self._timeout
+            ) as response:
+                status = response.status
+                if response.status != 200:
+                    text = await response.text()
+                    print(
+                        f"Request to {endpoint} failed with status {response.status}: {text}"
+                    )
+                    return status, None
+
+                # Check if JSON response
+                if response.headers.get("content-type") == "application/json":
+                    return status, await response.json(content_type=None)
+                else:
+                    return status, await response.text()
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Failed to send {method} request to {endpoint}. Error: {e}")
+            return None, None
+
+        finally:
+            REQUEST_STATS.record(
+                self.name or self.server_url,
+                method,
+                endpoint,
+                time.perf_counter() - start,
+                status,
+            )
+
+    async def connect(self, ip: str, port: int = 8080) -> bool:
+        """Connect to the ESP32 web server."""
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_maxsize)
+            )
+
+        self.server_url = f"http://{ip}:{port}"
+        self._urls = {}
+        self.has_state_endpoint = None
+        # A new session may be a rebooted gantry, nothing we wrote before is known
+        self.state_cache.invalidate()
+        self.session_id = str(uuid.uuid4())[:8]
+        self._headers = {"session_id": self.session_id}
+        print(f"Session ID: {self.session_id}")
+
+        response = await self._send_request(
+            "POST", "/session", {"session_id": self.session_id}
+        )
+
+        # Check for 200 response
+        if response:
+            self.connected = True
+            return True
+        else:
+            print("Failed to connect to the server.")
+            return False
+
+    async def disconnect(self) -> None:
+        """Disconnect from the server and release pooled connections."""
+        self.connected = False
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+        print("Disconnected from gantry.")
+
+    async def _set_value(self, endpoint: str, value) -> None:
+        """POST a value unless the gantry is already known to hold it."""
+        if self.state_cache.is_current(endpoint, value):
+            return
+
+        response = await self._send_request("POST", endpoint, {"value": value})
+        self.state_cache.update(endpoint, value, response is not None)
+
+    async def _get_number(self, endpoint: str, kind=float):
+        """GET an endpoint that answers with a bare number."""
+        response = await self._send_request("GET", endpoint)
+        try:
+            return kind(response)
+        except (TypeError, ValueError) as e:
+            raise GantryResponseError(
+                self.name, endpoint, f"expected a number, got {response!r}"
+            ) from e
+
+    async def _get_pair(self, endpoint: str) -> tuple[float, float]:
+        # Both axes are requested at once rather than one after another
+        return tuple(
+            await asyncio.gather(
+                self._get_number(f"{endpoint}/q0"), self._get_number(f"{endpoint}/q1")
+            )
+        )
+
+    async def set_pid_position_p_channel_0(self, value: float) -> None:
+        """Set the position/p PID value on the ESP32 web server for channel 0."""
+        await self._set_value("/ch0/position/p", value)
+
+    async def set_pid_position_p_channel_1(self, value: float) -> None:
+        """Set the position/p PID value on the ESP32 web server for channel 1."""
+        await self._set_value("/ch1/position/p", value)
+
+    # ... for channel 0
+    async def set_pid_position_i_channel_0(self, value: float) -> None:
+        await self._set_value("/ch0/position/i", value)
+
+    async def set_pid_position_d_channel_0(self, value: float) -> None:
+        await self._set_value("/ch0/position/d", value)
+
+    async def set_pid_position_lpf_channel_0(self, value: float) -> None:
+        await self._set_value("/ch0/position/lpf", value)
+
+    async def set_pid_velocity_p_channel_0(self, value: float) -> None:
+        await self._set_value("/ch0/velocity/p", value)
+
+    async def set_pid_velocity_i_channel_0(self, value: float) -> None:
+        await self._set_value("/ch0/velocity/i", value)
+
+    async def set_pid_velocity_d_channel_0(self, value: float) -> None:
+        await self._set_value("/ch0/velocity/d", value)
+
+    async def set_pid_velocity_lpf_channel_0(self, value: float) -> None:
+        await self._set_value("/ch0/velocity/lpf", value)
+
+    # ... for channel 1
+    async def set_pid_position_i_channel_1(self, value: float) -> None:
+        await self._set_value("/ch1/position/i", value)
+
+    async def set_pid_position_d_channel_1(self, value: float) -> None:
+        await self._set_value("/ch1/position/d", value)
+
+    async def set_pid_position_lpf_channel_1(self, value: float) -> None:
+        await self._set_value("/ch1/position/lpf", value)
+
+    async def set_pid_velocity_p_channel_1(self, value: float) -> None:
+        await self._set_value("/ch1/velocity/p", value)
+
+    async def set_pid_velocity_i_channel_1(self, value: float) -> None:
+        await self._set_value("/ch1/velocity/i", value)
+
+    async def set_pid_velocity_d_channel_1(self, value: float) -> None:
+        await self._set_value("/ch1/velocity/d", value)
+
+    async def set_pid_velocity_lpf_channel_1(self, value: float) -> None:
+        await self._set_value("/ch1/velocity/lpf", value)
+
+    async def set_target_waypoint(self, value: int) -> None:
+        await self._set_value("/target_waypoint", value)
+
+    async def get_target_waypoint(self) -> int:
+        return await self._get_number("/target_waypoint", int)
+
+    async def set_mode(self, value: int) -> None:
+        if self.state_cache.get("/mode") != value:
+            # The firmware may reset its target when switching modes
+            self.state_cache.invalidate("/target_waypoint")
+        await self._set_value("/mode", value)
+
+    async def get_position(self) -> tuple[float, float]:
+        return await self._get_pair("/position")
+
+    async def add_waypoint(self) -> bool:
+        response = await self._send_request("GET", "/add_waypoint")
+
+        return bool(response)
+
+    async def save_trajectory(self) -> bool:
+        response = await self._send_request("GET", "/save_trajectory")
+
+        return bool(response)
+
+    async def set_target_speed(self, value: float) -> None:
+        await self._set_value("/target_speed", value)
+
+    async def set_speed_multipler(self, q0: float, q1: float) -> None:
+        await asyncio.gather(
+            self._set_value("/speed_multiplier/q0", q0),
+            self._set_value("/speed_multiplier/q1", q1),
+        )
+
+    async def get_next_waypoint(self) -> tuple[float, float]:
+        return await self._get_pair("/next_waypoint")
+
+    async def get_previous_waypoint(self) -> tuple[float, float]:
+        return await self._get_pair("/previous_waypoint")
+
+    async def get_trajectory_length(self) -> int:
+        return await self._get_number("/trajectory_length", int)
+
+    async def _timed_get(self, endpoint: str) -> tuple[object, float]:
+        start = time.time()
+        response = await self._send_request("GET", endpoint)
+        return response, (start + time.time()) / 2
+
+    async def _optional_get(self, endpoint: str) -> tuple[bool, object]:
+        """GET an endpoint that only some firmware serves.
+
+        Returns (served, response). `served` is False only if the gantry says
+        the endpoint doesn't exist, and None if the gantry couldn't be asked.
+        """
+        status, response = await self._request_with_status("GET", endpoint)
+        if status == 404:
+            return False, None
+        if status != 200:
+            return None, None
+        return isinstance(response, dict), response
+
+    async def get_state(self) -> GantryState:
+        """Read position, next and previous waypoint as one snapshot."""
+        if self.has_state_endpoint is not False:
+            start = time.time()
+            served, response = await self._optional_get("/state")
+            timestamp = (start + time.time()) / 2
+            if served is not None:
+                self.has_state_endpoint = served
+            if served:
+                return GantryState(
+                    tuple(map(float, response["position"])),
+                    tuple(map(float, response["next_waypoint"])),
+                    tuple(map(float, response["previous_waypoint"])),
+                    timestamp,
+                    0.0,
+                )
+
+        names = list(STATE_ENDPOINTS)
+        samples = await asyncio.gather(
+            *(self._timed_get(e) for name in names for e in STATE_ENDPOINTS[name])
+        )
+        values = {}
+        for i, name in enumerate(names):
+            try:
+                values[name] = (float(samples[2 * i][0]), float(samples[2 * i + 1][0]))
+            except (TypeError, ValueError) as e:
+                raise GantryResponseError(self.name, name, "expected numbers") from e
+        times = [sample_time for _, sample_time in samples]
+
+        return GantryState(
+            values["position"],
+            values["next_waypoint"],
+            values["previous_waypoint"],
+            sum(times) / len(times),
+            max(times) - min(times),
+        )
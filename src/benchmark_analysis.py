@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import record_gantry
+from benchmark_playback import playback_headless, record_headless, start_emulated_fleet
+from gantry_fleet import GantryFleet
+from telemetry import TelemetryFile
+from telemetry_analysis import analyze, analyze_files
+
+
+def step_response(t: np.ndarray, zeta: float, omega: float) -> np.ndarray:
+    """Fraction of a step still to go at `t` for an underdamped second-order axis."""
+    t = np.maximum(t, 0.0)
+    damped = omega * math.sqrt(1 - zeta**2)
+    return np.exp(-zeta * omega * t) * (
+        np.cos(damped * t) + zeta / math.sqrt(1 - zeta**2) * np.sin(damped * t)
+    )
+
+
+def synthetic_fleet(args) -> tuple:
+    """Hours of telemetry for gantries that respond alike but start late by known amounts.
+
+    Both axes step by the same distance each segment, q1 starting `axis_delay`
+    after q0 and every gantry `gantry_delay` after the one before. Every axis
+    stops `bias` short of its waypoint.
+    """
+    rng = np.random.default_rng(args.seed)
+    per_segment = int(args.segment * args.rate)
+    segments = int(args.hours * 3600 / args.segment)
+    distance = rng.uniform(5, 20, (segments, 1))
+    steps = rng.choice([-1.0, 1.0], (segments, 2)) * distance
+    targets = np.cumsum(steps, axis=0)
+    previous = np.vstack(([0.0, 0.0], targets[:-1]))
+    since_command = np.arange(per_segment) / args.rate
+
+    telemetry, trajectories = {}, {}
+    for index in range(args.gantries):
+        delays = index * args.gantry_delay + np.array([0.0, args.axis_delay])
+        remaining = step_response(since_command[:, None] - delays, args.zeta, args.omega)
+        position = (
+            targets[:, None, :]
+            + (previous - targets)[:, None, :] * remaining
+            - args.bias * np.sign(steps)[:, None, :]
+            + rng.normal(0, args.noise, (segments, per_segment, 2))
+        ).reshape(-1, 2)
+        name = f"gantry-{index}"
+        telemetry[name] = {
+            "time": 1.7e9 + np.arange(len(position)) / args.rate,
+            "q0": position[:, 0],
+            "q1": position[:, 1],
+            "waypoint": np.repeat(np.arange(segments, dtype=np.int32), per_segment),
+        }
+        trajectories[name] = targets.T
+    return telemetry, trajectories, distance[:, 0], np.sign(steps)
+
+
+def within_samples(measured: np.ndarray, expected: float, sample: float) -> float:
+    """Fraction of `measured` within two samples of `expected`."""
+    return float(np.mean(np.abs(measured - expected) <= 2 * sample + 1e-9))
+
+
+def synthetic_benchmark(args) -> dict:
+    telemetry, trajectories, distance, direction = synthetic_fleet(args)
+    rows = sum(len(columns["time"]) for columns in telemetry.values())
+
+    start = time.perf_counter()
+    report = analyze(telemetry, trajectories, args.tolerance)
+    summary = report.summary()
+    elapsed = time.perf_counter() - start
+
+    # Peak of an underdamped step past its target, less the bias it stops short by
+    peak = math.exp(-args.zeta * math.pi / math.sqrt(1 - args.zeta**2))
+    expected_overshoot = distance[:, None] * peak - args.bias
+    sample = 1.0 / args.rate
+    for name, segments in report.segments.items():
+        assert len(segments["start"]) == len(distance), f"{name} lost segments"
+        assert not np.isnan(segments["settling"]).any(), f"{name} has unsettled segments"
+        overshoot_error = np.abs(segments["overshoot"] - expected_overshoot).max()
+        assert overshoot_error < 5 * args.noise + 1e-3, f"{name} overshoot off by {overshoot_error}"
+        steady = -segments["steady_state_error"] * direction
+        assert np.abs(steady - args.bias).max() < 5 * args.noise, f"{name} steady-state error"
+        # Where the undershoot after an overshoot only just reaches the band, noise
+        # can make one axis arrive half an oscillation before the other
+        close = within_samples(segments["axis_skew"], args.axis_delay, sample)
+        assert close > 0.95, f"{name} axis skew right in only {close:.1%} of segments"
+    close = within_samples(report.gantry_skew, (args.gantries - 1) * args.gantry_delay, sample)
+    assert close > 0.95, f"gantry skew right in only {close:.1%} of segments"
+
+    return {
+        "rows": rows,
+        "segments": sum(len(s["start"]) for s in report.segments.values()),
+        "analysis_s": elapsed,
+        "rows_per_s": rows / elapsed,
+        "summary": summary,
+    }
+
+
+def emulated_benchmark(args, directory: str) -> dict:
+    """Record a step-by-step playback on emulated gantries and compare against their own logs."""
+    rng = random.Random(args.seed)
+    waypoints = [(rng.uniform(-20, 20), rng.uniform(-20, 20)) for _ in range(args.waypoints)]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        servers, emulators, gantry_data = start_emulated_fleet(
+            args.emulated_gantries, args.latency, args.jitter, args.seed
+        )
+        fleet = GantryFleet(gantry_data)
+        record_gantry.fleet = fleet
+        record_gantry.trajectory_dir = None
+        record_gantry.telemetry_dir = directory
+        record_gantry.telemetry_rate = args.emulated_rate
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            record_headless(emulators, gantry_data, waypoints)
+            fleet.set_target_speed(args.target_speed)
+            playback_headless(emulators, gantry_data, args.waypoints - 1)
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fleet.close()
+            for gantry in gantry_data.values():
+                gantry["interface"].disconnect()
+            for server in servers:
+                server.stop()
+
+    [path] = [
+        os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".gtlm")
+    ]
+    report = analyze_files(path, tolerance=args.tolerance)
+    recording = TelemetryFile(path)
+
+    worst = 0.0
+    for name, emulator in emulators.items():
+        segments = report.segments[name]
+        # Both ends of a segment are seen up to a sample late, and the stand-ins
+        # can't always be sampled as fast as asked
+        allowed = 2 * np.diff(recording.columns(name)["time"]).max() + 0.01
+        # The emulator logs the playback's segments, recording opens on waypoint 0
+        logged = [s for s in emulator.segments if None not in s["arrived"]][-args.waypoints + 1 :]
+        measured = {int(w): a for w, a in zip(segments["waypoint"], segments["arrival"])}
+        for segment in logged:
+            for axis in (0, 1):
+                actual = segment["arrived"][axis] - segment["commanded"]
+                error = abs(measured[segment["waypoint"]][axis] - actual)
+                worst = max(worst, error)
+                assert error <= allowed, f"{name} arrival at {segment['waypoint']} off by {error}"
+
+    return {"worst_arrival_error_ms": worst * 1000, "report": report.format()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check and time tracking analysis on synthetic and emulated recordings"
+    )
+    parser.add_argument("--gantries", type=int, default=8)
+    parser.add_argument("--hours", type=float, default=2.0)
+    parser.add_argument("--rate", type=float, default=200.0)
+    parser.add_argument("--segment", type=float, default=2.0, help="Seconds per waypoint")
+    parser.add_argument("--zeta", type=float, default=0.6)
+    parser.add_argument("--omega", type=float, default=20.0)
+    parser.add_argument("--bias", type=float, default=0.01)
+    parser.add_argument("--noise", type=float, default=0.001)
+    parser.add_argument("--axis-delay", type=float, default=0.01)
+    parser.add_argument("--gantry-delay", type=float, default=0.005)
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--emulated-gantries", type=int, default=3)
+    parser.add_argument("--emulated-rate", type=float, default=200.0)
+    parser.add_argument("--waypoints", type=int, default=8)
+    parser.add_argument("--target-speed", type=float, default=60.0)
+    parser.add_argument("--latency", type=float, default=0.0005)
+    parser.add_argument("--jitter", type=float, default=0.0002)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="analysis_results.json")
+    args = parser.parse_args()
+
+    synthetic = synthetic_benchmark(args)
+    with tempfile.TemporaryDirectory() as directory:
+        emulated = emulated_benchmark(args, directory)
+
+    print(f"Synthetic: {args.gantries} gantries x {args.hours:g} h at {args.rate:g} Hz, "
+          f"{synthetic['rows']:,} rows and {synthetic['segments']:,} segments")
+    print(f"Analysed in {synthetic['analysis_s']:.2f} s ({synthetic['rows_per_s']:,.0f} rows/s), "
+          f"overshoot, steady-state error and skews match the model")
+    print(f"Emulated: arrivals within {emulated['worst_arrival_error_ms']:.1f} ms "
+          f"of the emulators' own logs")
+    print(emulated["report"])
+
+    results = {key: value for key, value in synthetic.items()}
+    results["emulated_worst_arrival_error_ms"] = emulated["worst_arrival_error_ms"]
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
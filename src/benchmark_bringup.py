@@ -0,0 +1,124 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import tempfile
+import time
+from threading import Thread
+
+from zeroconf import ServiceInfo, Zeroconf
+
+from fleet_bringup import FleetBringUp
+from gantry_discovery import SERVICE_TYPE, GantryDiscovery
+from gantry_interface import GantryInterface
+from gantry_stub_server import GantryStubServer
+
+
+def announce(zeroconf: Zeroconf, servers: list, stagger: float) -> list:
+    """Register each stand-in over mDNS, `stagger` seconds apart, in the background."""
+    infos = []
+    for index, server in enumerate(servers):
+        ip, port = server.address
+        infos.append(
+            ServiceInfo(
+                SERVICE_TYPE,
+                f"gantry-bench-{index}.{SERVICE_TYPE}",
+                addresses=[socket.inet_aton(ip)],
+                port=port,
+                properties={"gantry": f"gantry-{index}"},
+                server=f"gantry-bench-{index}.local.",
+            )
+        )
+
+    def run():
+        for info in infos:
+            Thread(target=zeroconf.register_service, args=(info,), daemon=True).start()
+            time.sleep(stagger)
+
+    Thread(target=run, daemon=True).start()
+    return infos
+
+
+def staged(count: int, cache_path: str) -> tuple[float, dict]:
+    """Discover everything first, then connect and set the mode one gantry at a time."""
+    start = time.monotonic()
+    discovery = GantryDiscovery(cache_path=cache_path)
+    gantries = discovery.wait(count=count, timeout=30)
+    for name, gantry in gantries.items():
+        gantry["interface"] = GantryInterface(name)
+        gantry["interface"].connect(gantry["addresses"], gantry["port"], warm_up=2)
+        gantry["interface"].set_mode(0)
+    elapsed = time.monotonic() - start
+    discovery.close()
+    return elapsed, gantries
+
+
+def streaming(count: int, cache_path: str) -> tuple[float, dict, dict]:
+    """Bring each gantry up as soon as mDNS reports it."""
+    discovery = GantryDiscovery(cache_path=cache_path)
+    bringup = FleetBringUp(mode=0)
+    discovery.listener.on_change(bringup.on_change)
+    discovery.start()
+    bringup.wait_ready(count=count, timeout=30)
+    discovery.close()
+    bringup.close()
+    report = bringup.report()
+    return report["time_to_ready"], bringup.gantry_data, report
+
+
+def run_scenario(name: str, args, function):
+    servers = [GantryStubServer(latency=args.latency) for _ in range(args.gantries)]
+    for server in servers:
+        server.start()
+    zeroconf = Zeroconf()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            announce(zeroconf, servers, args.stagger)
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = function(args.gantries, os.path.join(directory, "cache.json"))
+                for gantry in result[1].values():
+                    gantry["interface"].disconnect()
+    finally:
+        zeroconf.close()
+        for server in servers:
+            server.stop()
+    print(f"{name:<10} fleet ready after {result[0]:.3f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare staged and streaming fleet bring-up against stand-ins announced over mDNS"
+    )
+    parser.add_argument("--gantries", type=int, default=6)
+    parser.add_argument("--stagger", type=float, default=0.2)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--output", default="bringup_results.json")
+    args = parser.parse_args()
+
+    staged_time, _ = run_scenario("staged", args, staged)
+    streaming_time, _, report = run_scenario("streaming", args, streaming)
+    for name, record in sorted(report["gantries"].items()):
+        print(
+            f"  {name:<12} found at {record['discovered']:6.3f} s, "
+            f"ready {record['latency'] * 1000:7.1f} ms later"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "config": vars(args),
+                "staged_s": staged_time,
+                "streaming_s": streaming_time,
+                "streaming_report": report,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
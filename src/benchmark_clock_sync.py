@@ -0,0 +1,132 @@
+import argparse
+import contextlib
+import io
+import json
+import random
+import statistics
+import time
+
+from gantry_fleet import GantryFleet
+from gantry_interface import GantryInterface
+from gantry_stub_server import GantryStubServer, StandInGantry
+
+
+def start_fleet(args):
+    """Stand-ins whose clocks are offset and drift, behind a jittery network."""
+    rng = random.Random(args.seed)
+    servers, gantries, gantry_data = [], {}, {}
+    for index in range(args.gantries):
+        name = f"gantry-{index}"
+        gantry = StandInGantry(
+            name,
+            clock_offset=rng.uniform(-1000, 1000),
+            clock_drift=rng.uniform(-args.drift, args.drift),
+        )
+        server = GantryStubServer(
+            gantry=gantry,
+            latency=args.latency,
+            jitter=args.jitter,
+            scheduled_start_endpoint=True,
+        )
+        server.start()
+        servers.append(server)
+        gantries[name] = gantry
+
+        ip, port = server.address
+        interface = GantryInterface(name, heartbeat_interval=args.heartbeat)
+        interface.connect(ip, port, warm_up=2)
+        gantry_data[name] = {"addresses": ip, "port": port, "interface": interface}
+    return servers, gantries, gantry_data
+
+
+def true_skew(gantries: dict, waypoint: int):
+    """Spread of the moments the gantries actually changed target, on our clock."""
+    times = [
+        gantry.started["local_time"]
+        for gantry in gantries.values()
+        if gantry.started is not None and gantry.started["waypoint"] == waypoint
+    ]
+    if len(times) != len(gantries):
+        return None, times
+    return max(times) - min(times), times
+
+
+def summarize(values: list) -> dict:
+    values = sorted(values)
+    return {
+        "median_ms": statistics.median(values) * 1000,
+        "p95_ms": values[int(0.95 * (len(values) - 1))] * 1000,
+        "max_ms": values[-1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare fan-out and clock-synchronized start skew against stand-ins"
+    )
+    parser.add_argument("--gantries", type=int, default=4)
+    parser.add_argument("--trials", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--jitter", type=float, default=0.008)
+    parser.add_argument("--drift", type=float, default=50e-6, help="Max clock drift, s/s")
+    parser.add_argument("--heartbeat", type=float, default=0.25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="clock_sync_results.json")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        servers, gantries, gantry_data = start_fleet(args)
+    fleet = GantryFleet(gantry_data)
+    # Let a few heartbeats refine the offsets
+    time.sleep(args.heartbeat * 8)
+
+    fanout, synced, reported, bounds, late = [], [], [], [], []
+    try:
+        for trial in range(args.trials):
+            waypoint = 2 * trial + 1
+            fleet.set_target_waypoint(waypoint)
+            skew, _ = true_skew(gantries, waypoint)
+            assert skew is not None, "every gantry should take the fan-out command"
+            fanout.append(skew)
+
+            waypoint += 1
+            measured = fleet.measure_start_skew(waypoint)
+            skew, times = true_skew(gantries, waypoint)
+            assert skew is not None, f"scheduled start missed: {measured}"
+            assert len(measured["starts"]) == len(gantries), "every gantry should report its start"
+            synced.append(skew)
+            reported.append(measured["skew"])
+            bounds.append(measured["error_bound"])
+            late.append(max(times) - measured["scheduled"])
+            time.sleep(random.uniform(0, args.heartbeat))
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for gantry in gantry_data.values():
+                gantry["interface"].disconnect()
+        for server in servers:
+            server.stop()
+        fleet.close()
+
+    # The reported skew can only be trusted to within the clocks' error bound
+    for measured, actual, bound in zip(reported, synced, bounds):
+        assert abs(measured - actual) <= bound + 1e-3, "reported skew outside its error bound"
+
+    results = {
+        "fanout_skew": summarize(fanout),
+        "synchronized_skew": summarize(synced),
+        "reported_skew": summarize(reported),
+        "error_bound": summarize(bounds),
+        "last_start_after_schedule": summarize(late),
+    }
+    print(f"{args.gantries} gantries, {args.latency * 1000:.0f} ms +/- {args.jitter * 1000:.0f} ms")
+    print(f"{'':<28} {'median ms':>10} {'p95 ms':>8} {'max ms':>8}")
+    for name, row in results.items():
+        print(f"{name:<28} {row['median_ms']:>10.3f} {row['p95_ms']:>8.3f} {row['max_ms']:>8.3f}")
+
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import contextlib
+import io
+import json
+import time
+
+from gantry_fleet import GantryFleet
+from gantry_interface import GantryInterface
+from gantry_stub_server import GantryStubServer, StandInGantry
+
+
+class LoggingGantry(StandInGantry):
+    """Stand-in that remembers every target waypoint it was sent, in arrival order."""
+
+    def __init__(self):
+        super().__init__()
+        self.received = []
+
+    def post(self, path: str, data: dict):
+        if path == "/target_waypoint":
+            with self.lock:
+                self.received.append(int(data["value"]))
+        return super().post(path, data)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check ordering and time blocking vs queued commands against stand-ins"
+    )
+    parser.add_argument("--gantries", type=int, default=4)
+    parser.add_argument("--commands", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--output", default="command_queue_results.json")
+    args = parser.parse_args()
+
+    servers, gantries, gantry_data = [], {}, {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in range(args.gantries):
+            name = f"gantry-{index}"
+            gantries[name] = LoggingGantry()
+            server = GantryStubServer(
+                gantry=gantries[name], latency=args.latency, jitter=args.jitter
+            )
+            server.start()
+            servers.append(server)
+            ip, port = server.address
+            interface = GantryInterface(name)
+            interface.connect(ip, port, warm_up=2)
+            gantry_data[name] = {"addresses": ip, "port": port, "interface": interface}
+    fleet = GantryFleet(gantry_data)
+    values = list(range(1, args.commands + 1))
+
+    try:
+        # Blocking: the caller waits for every round trip
+        start = time.perf_counter()
+        for value in values:
+            fleet.set_target_waypoint(value)
+        blocking = time.perf_counter() - start
+
+        for gantry in gantries.values():
+            gantry.received.clear()
+        fleet.set_target_waypoint(0)
+
+        # Queued: the caller only pays for handing each command over
+        start = time.perf_counter()
+        futures = [fleet.submit("set_target_waypoint", value) for value in values]
+        queued_caller = time.perf_counter() - start
+        peak = max(fleet.queue_depth().values())
+        fleet.flush()
+        queued_total = time.perf_counter() - start
+
+        assert all(f.done() and f.exception() is None for batch in futures for f in batch.values())
+        for name, gantry in gantries.items():
+            assert gantry.received[-len(values):] == values, f"{name} got commands out of order"
+        assert all(depth == 0 for depth in fleet.queue_depth().values()), "flush left commands"
+        wait_p95 = max(
+            interface.commands.wait_times.percentile(95) for interface in fleet.interfaces.values()
+        )
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for gantry in gantry_data.values():
+                gantry["interface"].disconnect()
+            for server in servers:
+                server.stop()
+            fleet.close()
+
+    results = {
+        "blocking_caller_s": blocking,
+        "queued_caller_s": queued_caller,
+        "queued_drain_s": queued_total,
+        "peak_queue_depth": peak,
+        "queue_wait_p95_s": wait_p95,
+    }
+    print(f"Every gantry received all {args.commands} commands in order")
+    print(f"Blocking calls held the caller for   {blocking * 1000:8.1f} ms")
+    print(f"Queued calls held the caller for     {queued_caller * 1000:8.1f} ms")
+    print(f"Queued calls had all gone out after  {queued_total * 1000:8.1f} ms")
+    print(f"Peak queue depth {peak}, p95 wait in queue {wait_p95 * 1000:.1f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
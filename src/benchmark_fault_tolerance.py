@@ -0,0 +1,121 @@
+import argparse
+import contextlib
+import io
+import json
+import time
+
+from gantry_errors import GantryError, GantryUnavailable
+from gantry_fleet import GantryFleet
+from gantry_interface import GantryInterface
+from gantry_stub_server import GantryStubServer
+
+
+def timed_broadcast(fleet: GantryFleet, method: str):
+    start = time.perf_counter()
+    result = fleet.broadcast(method)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time fleet reads while one stand-in hangs, then recovers"
+    )
+    parser.add_argument("--gantries", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--request-timeout", type=float, default=0.3)
+    parser.add_argument("--request-deadline", type=float, default=0.5)
+    parser.add_argument("--fleet-timeout", type=float, default=None)
+    parser.add_argument("--reads", type=int, default=20)
+    parser.add_argument("--output", default="fault_tolerance_results.json")
+    args = parser.parse_args()
+
+    servers, gantry_data = [], {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index in range(args.gantries):
+            name = f"gantry-{index}"
+            server = GantryStubServer(latency=args.latency)
+            server.start()
+            servers.append(server)
+            ip, port = server.address
+            interface = GantryInterface(
+                name,
+                request_timeout=args.request_timeout,
+                request_deadline=args.request_deadline,
+                heartbeat_interval=0.5,
+                heartbeat_timeout=0.2,
+            )
+            interface.connect(ip, port, warm_up=2)
+            gantry_data[name] = {"addresses": ip, "port": port, "interface": interface}
+    fleet = GantryFleet(gantry_data, timeout=args.fleet_timeout)
+    hung_name, hung = "gantry-0", servers[0]
+    phases = {}
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            elapsed, result = timed_broadcast(fleet, "get_position")
+            assert result.ok, result.errors
+            phases["healthy"] = [elapsed]
+
+            hung.hang()
+            phases["hung"] = []
+            errors = []
+            for _ in range(args.reads):
+                elapsed, result = timed_broadcast(fleet, "get_position")
+                phases["hung"].append(elapsed)
+                errors.append(result.errors.get(hung_name))
+                others = {name: value for name, value in result.results.items()}
+                assert len(others) == args.gantries - 1, "healthy gantries should still answer"
+
+            hung.resume()
+            # The heartbeat closes the breaker on its first answer
+            deadline = time.monotonic() + 5
+            while gantry_data[hung_name]["interface"].breaker.is_open:
+                assert time.monotonic() < deadline, "breaker never closed again"
+                time.sleep(0.01)
+            recovered_after = time.monotonic() - (deadline - 5)
+            elapsed, result = timed_broadcast(fleet, "get_position")
+            assert result.ok, result.errors
+            phases["recovered"] = [elapsed]
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for server in servers:
+                server.resume()
+            for gantry in gantry_data.values():
+                gantry["interface"].disconnect()
+            for server in servers:
+                server.stop()
+            fleet.close()
+
+    assert all(isinstance(e, GantryError) for e in errors), "hung gantry should give typed errors"
+    fast = [t for t, e in zip(phases["hung"], errors) if isinstance(e, GantryUnavailable)]
+    assert fast, "breaker never opened"
+    # Two reads per get_position, each bounded by the request deadline
+    assert max(phases["hung"]) <= 2 * args.request_deadline + 0.2, "a read outlived its deadline"
+
+    results = {
+        "healthy_s": phases["healthy"][0],
+        "hung_worst_s": max(phases["hung"]),
+        "hung_after_breaker_open_s": max(fast),
+        "breaker_open_reads": len(fast),
+        "error_types": sorted({type(e).__name__ for e in errors}),
+        "breaker_closed_after_resume_s": recovered_after,
+        "recovered_s": phases["recovered"][0],
+        "log_lines": len(log.getvalue().splitlines()),
+    }
+    print(f"Healthy fleet read:                 {results['healthy_s'] * 1000:8.1f} ms")
+    print(f"Worst read with one gantry hung:    {results['hung_worst_s'] * 1000:8.1f} ms")
+    print(
+        f"Worst read once its breaker opened: {results['hung_after_breaker_open_s'] * 1000:8.1f} ms"
+        f" ({len(fast)} of {args.reads} reads)"
+    )
+    print(f"Errors seen for the hung gantry:    {', '.join(results['error_types'])}")
+    print(f"Breaker closed {recovered_after * 1000:.0f} ms after the gantry came back")
+    print(f"Read after recovery:                {results['recovered_s'] * 1000:8.1f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+
+import record_gantry
+from gantry_emulator import GantryEmulator, segment_metrics
+from gantry_fleet import GantryFleet
+from gantry_interface import GantryInterface
+from gantry_stub_server import GantryStubServer
+from playback_engine import PlaybackEngine
+from trajectory_retiming import retime
+
+
+def start_emulated_fleet(count: int, latency: float, jitter: float, seed: int):
+    """Start `count` emulated gantries, each with slightly different axis limits."""
+    rng = random.Random(seed)
+    servers, emulators, gantry_data = [], {}, {}
+    for index in range(count):
+        name = f"gantry-{index}"
+        emulator = GantryEmulator(
+            max_velocity=(rng.uniform(80, 120), rng.uniform(80, 120)),
+            max_acceleration=(rng.uniform(300, 500), rng.uniform(300, 500)),
+        )
+        server = GantryStubServer(gantry=emulator, latency=latency, jitter=jitter)
+        server.start()
+        servers.append(server)
+        emulators[name] = emulator
+
+        ip, port = server.address
+        gantry_data[name] = {"addresses": ip, "port": port}
+        gantry_data[name]["interface"] = GantryInterface(name)
+        gantry_data[name]["interface"].connect(ip, port)
+
+    return servers, emulators, gantry_data
+
+
+def wait_until(condition, timeout: float = 10.0, poll: float = 0.001) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(poll)
+    return True
+
+
+def record_headless(emulators: dict, gantry_data: dict, waypoints: list) -> None:
+    """Run record_gantry.record_trajectory, moving the gantries by hand between presses."""
+    moves = iter(waypoints)
+
+    def getch():
+        waypoint = next(moves, None)
+        if waypoint is None:
+            return "\r"
+
+        # Each gantry is pushed to its own copy of the path, then recorded, once
+        # the previous press has reached the gantries
+        record_gantry.fleet.flush()
+        for emulator in emulators.values():
+            emulator.move_by_hand(*waypoint)
+        wait_until(
+            lambda: all(
+                abs(e.position[0] - waypoint[0]) < 1e-6
+                and abs(e.position[1] - waypoint[1]) < 1e-6
+                for e in emulators.values()
+            )
+        )
+        return " "
+
+    record_gantry.getch = getch
+    record_gantry.record_trajectory(gantry_data)
+
+
+def playback_headless(emulators: dict, gantry_data: dict, steps: int, continuous: bool = False) -> None:
+    """Run record_gantry.trajectory_playback, pressing d as soon as every gantry arrives.
+
+    With `continuous`, press c once instead and let the playback engine run the
+    whole trajectory.
+    """
+    presses = iter(["c", "q"] if continuous else ["d"] * steps + ["q"])
+
+    def getch():
+        # The last press goes out queued, wait for it to reach the gantries first
+        record_gantry.fleet.flush()
+        wait_until(lambda: all(e.arrived() for e in emulators.values()))
+        return next(presses)
+
+    record_gantry.getch = getch
+    record_gantry.trajectory_playback(gantry_data)
+
+
+def playback_retimed(emulators: dict, gantry_data: dict, fleet: GantryFleet) -> float:
+    """Play the trajectory with per-segment speeds retimed to each emulator's limits.
+
+    Returns the cycle time the retiming predicted, which starts at waypoint 0
+    and so leaves out the homing move there.
+    """
+    names = list(gantry_data)
+    retiming = retime(
+        [emulators[name].trajectory for name in names],
+        [emulators[name].max_velocity for name in names],
+        [emulators[name].max_acceleration for name in names],
+    )
+    plan = retiming.plan(names)
+
+    fleet.set_mode(2)
+    PlaybackEngine(fleet, plan=plan).run(len(plan))
+    # The engine returns on approach, let the last segment arrive as well
+    wait_until(lambda: all(e.arrived() for e in emulators.values()))
+    return retiming.cycle_time
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Record and play back a trajectory on emulated gantries and measure it"
+    )
+    parser.add_argument("--gantries", type=int, default=3)
+    parser.add_argument("--waypoints", type=int, default=10)
+    parser.add_argument("--target-speed", type=float, default=60.0)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--jitter", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--continuous",
+        action="store_true",
+        help="Play back with the auto-advance engine instead of one key press per waypoint",
+    )
+    parser.add_argument(
+        "--retime",
+        action="store_true",
+        help="Play back continuously with speeds retimed to the emulated axis limits",
+    )
+    parser.add_argument("--output", default="playback_results.json")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    waypoints = [
+        (rng.uniform(-20, 20), rng.uniform(-20, 20)) for _ in range(args.waypoints)
+    ]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        servers, emulators, gantry_data = start_emulated_fleet(
+            args.gantries, args.latency, args.jitter, args.seed
+        )
+        fleet = GantryFleet(gantry_data)
+        record_gantry.fleet = fleet
+        record_gantry.trajectory_dir = None
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            record_headless(emulators, gantry_data, waypoints)
+            fleet.set_target_speed(args.target_speed)
+            if args.retime:
+                predicted = playback_retimed(emulators, gantry_data, fleet)
+            else:
+                playback_headless(
+                    emulators, gantry_data, args.waypoints - 1, args.continuous
+                )
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fleet.close()
+            for gantry in gantry_data.values():
+                gantry["interface"].disconnect()
+            for server in servers:
+                server.stop()
+
+    metrics = segment_metrics(emulators)
+    print(f"Segments played:     {len(metrics['segments'])}")
+    print(f"Cycle time:          {metrics['cycle_time']:.3f} s")
+    if args.retime:
+        # Segment 0 is the homing move, which the prediction doesn't cover
+        played = metrics["segments"][1:]
+        metrics["retimed_cycle_time"] = played[-1]["arrived"] - played[0]["commanded"]
+        print(f"Retimed cycle:       {metrics['retimed_cycle_time']:.3f} s")
+        print(f"Predicted cycle:     {predicted:.3f} s")
+    print(f"Total idle time:     {metrics['total_idle'] * 1000:.1f} ms")
+    print(f"Mean idle / segment: {metrics['mean_idle'] * 1000:.1f} ms")
+    print(f"Max axis skew:       {metrics['max_axis_skew'] * 1000:.1f} ms")
+    print(f"Max gantry skew:     {metrics['max_gantry_skew'] * 1000:.1f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "metrics": metrics}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import statistics
+import time
+
+import requests
+
+from gantry_errors import GantryConnectionError
+from gantry_interface import GantryInterface
+from gantry_stub_server import GantryStubServer
+
+
+class UnpooledGantryInterface(GantryInterface):
+    """Old behaviour: a brand new connection for every request."""
+
+    def _attempt(self, method, endpoint, data, timeout):
+        url = self._url(endpoint)
+        headers = {"session_id": self.session_id}
+        try:
+            if method == "GET":
+                response = requests.get(url, headers=headers, timeout=timeout)
+            elif method == "POST":
+                response = requests.post(url, json=data, headers=headers, timeout=timeout)
+            return response.text
+        except requests.RequestException as e:
+            raise GantryConnectionError(self.name, endpoint, str(e)) from e
+
+
+def run(gantry: GantryInterface, iterations: int) -> dict:
+    # One get_position() is two round trips
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        gantry.get_position()
+        latencies.append((time.perf_counter() - t0) / 2)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "requests_per_s": 2 * iterations / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare pooled and unpooled request latency against a stub gantry"
+    )
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--warm-up", type=int, default=1)
+    args = parser.parse_args()
+
+    server = GantryStubServer()
+    server.start()
+    ip, port = server.address
+
+    try:
+        for name, gantry_cls in [
+            ("unpooled", UnpooledGantryInterface),
+            ("pooled", GantryInterface),
+        ]:
+            gantry = gantry_cls()
+            gantry.connect(ip, port, warm_up=args.warm_up)
+            result = run(gantry, args.iterations)
+            gantry.disconnect()
+
+            print(
+                f"{name:>9}: mean {result['mean_ms']:.3f} ms  "
+                f"p50 {result['p50_ms']:.3f} ms  "
+                f"p99 {result['p99_ms']:.3f} ms  "
+                f"{result['requests_per_s']:.0f} req/s"
+            )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
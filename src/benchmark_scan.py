@@ -0,0 +1,121 @@
+import argparse
+import json
+import random
+import socket
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+from gantry_scan import GantryScanner
+from gantry_stub_server import GantryStubServer, StandInGantry
+
+
+class _DecoyHandler(BaseHTTPRequestHandler):
+    """Some other web server on the gantry port, which the scan must not pick up."""
+
+    def do_GET(self):
+        body = b"<html>not a gantry</html>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fleet(count: int, silent: int, latency: float, seed: int):
+    """Stand-ins on random 127.0.0.x addresses sharing one port, plus a decoy.
+
+    `silent` more addresses accept connections and never answer, like a host
+    behind a firewall, so their probes run into the timeout.
+    """
+    rng = random.Random(seed)
+    hosts = rng.sample(range(2, 255), count + 1 + silent)
+
+    # Let the first stand-in pick a free port, then put the rest on the same one
+    first = GantryStubServer(f"127.0.0.{hosts[0]}", gantry=StandInGantry("gantry-0"), latency=latency)
+    servers = [first]
+    port = first.address[1]
+    for index, host in enumerate(hosts[1:count], start=1):
+        # Every other gantry runs firmware without /name
+        gantry = StandInGantry(f"gantry-{index}" if index % 2 == 0 else None)
+        servers.append(GantryStubServer(f"127.0.0.{host}", port, gantry=gantry, latency=latency))
+    for server in servers:
+        server.start()
+
+    decoy = ThreadingHTTPServer((f"127.0.0.{hosts[count]}", port), _DecoyHandler)
+    decoy.daemon_threads = True
+    Thread(target=decoy.serve_forever, daemon=True).start()
+
+    sinks = []
+    for host in hosts[count + 1 :]:
+        sink = socket.create_server((f"127.0.0.{host}", port), backlog=64)
+        sinks.append(sink)
+    return servers, decoy, sinks, port
+
+
+def expected_names(servers: list) -> set:
+    names = set()
+    for server in servers:
+        ip, port = server.address
+        names.add(server.gantry.name or f"{ip}:{port}")
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check and time the subnet scan against stand-ins on loopback addresses"
+    )
+    parser.add_argument("--gantries", type=int, default=8)
+    parser.add_argument("--silent", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--subnet",
+        default=None,
+        help="Also time a scan of a real subnet (e.g. 192.168.0.0/24) on port 8080",
+    )
+    parser.add_argument("--output", default="scan_results.json")
+    args = parser.parse_args()
+
+    servers, decoy, sinks, port = start_fleet(args.gantries, args.silent, args.latency, args.seed)
+    expected = expected_names(servers)
+    results = {}
+    try:
+        for concurrency in args.concurrency:
+            scanner = GantryScanner(concurrency=concurrency, timeout=args.timeout)
+            added = []
+            scanner.on_change(lambda event, name, data: added.append(name))
+            start = time.monotonic()
+            found = scanner.scan("127.0.0.0/24", ports=[port])
+            elapsed = time.monotonic() - start
+            assert set(found) == expected, f"found {sorted(found)}, expected {sorted(expected)}"
+            assert sorted(added) == sorted(expected), "every gantry should be announced once"
+            results[f"loopback_c{concurrency}"] = {"seconds": elapsed, "found": len(found)}
+    finally:
+        decoy.shutdown()
+        decoy.server_close()
+        for sink in sinks:
+            sink.close()
+        for server in servers:
+            server.stop()
+    print(f"Found all {len(expected)} stand-ins, skipped the decoy and {args.silent} silent hosts")
+
+    if args.subnet:
+        start = time.monotonic()
+        found = GantryScanner(timeout=args.timeout).scan(args.subnet)
+        results["subnet"] = {"seconds": time.monotonic() - start, "found": len(found)}
+
+    for name, result in results.items():
+        print(f"{name:<16} {result['seconds']:.3f} s, {result['found']} gantries")
+
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import time
+
+import run_gantry
+from gantry_fleet import GantryFleet
+from gantry_interface import GantryInterface
+from gantry_stub_server import GantryStubServer
+from trajectory_planner import MultiplierPlan
+
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[int(len(samples) * 0.95)] * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def timed(function, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def start_fleet(count: int, trajectory_length: int, **server_options):
+    """Start `count` stand-in gantries with a trajectory loaded and connect to them."""
+    servers = []
+    gantry_data = {}
+    for index in range(count):
+        server = GantryStubServer(**server_options)
+        server.gantry.trajectory = [
+            [float(i), float(2 * i)] for i in range(trajectory_length)
+        ]
+        server.start()
+        servers.append(server)
+
+        ip, port = server.address
+        name = f"gantry-{index}"
+        gantry_data[name] = {"addresses": ip, "port": port}
+        gantry_data[name]["interface"] = GantryInterface(name)
+        gantry_data[name]["interface"].connect(ip, port, warm_up=2)
+
+    return servers, gantry_data, GantryFleet(gantry_data)
+
+
+def stop_fleet(servers, gantry_data, fleet) -> None:
+    fleet.close()
+    for gantry in gantry_data.values():
+        gantry["interface"].disconnect()
+    for server in servers:
+        server.stop()
+
+
+def forget_setters(gantry_data) -> None:
+    """Clear every gantry's setter cache, so the next commands all go out."""
+    for gantry in gantry_data.values():
+        gantry["interface"].state_cache.invalidate()
+
+
+def bench_scenario(args, **server_options) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        servers, gantry_data, fleet = start_fleet(
+            args.gantries, args.trajectory_length, **server_options
+        )
+    gantry = next(iter(gantry_data.values()))["interface"]
+
+    results = {}
+    try:
+        results["get_position"] = timed(gantry.get_position, args.iterations)
+        results["get_state"] = timed(gantry.get_state, args.iterations)
+        # Alternate values so the setter cache doesn't skip the request
+        values = iter(range(10**9))
+        results["set_mode"] = timed(
+            lambda: gantry.set_mode(next(values) % 3), args.iterations
+        )
+        results["fleet_set_mode"] = timed(
+            lambda: fleet.set_mode(next(values) % 3), args.iterations
+        )
+
+        # Start skew is reported alongside the fan-out time
+        skews = [fleet.set_target_speed(float(i)).start_skew for i in range(args.iterations)]
+        results["fleet_start_skew"] = summarize(skews)
+
+        if server_options.get("upload_endpoint"):
+            # Deploying a whole path to every gantry at once
+            trajectories = {
+                name: ([float(i) for i in range(args.upload_points)],) * 2
+                for name in gantry_data
+            }
+            with contextlib.redirect_stdout(io.StringIO()):
+                results["fleet_upload"] = timed(
+                    lambda: fleet.upload_trajectory(trajectories), 5
+                )
+
+        # End-to-end cost of one playback step, always from the same waypoint.
+        # Repeating it would otherwise leave nothing for the setter cache to send
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_gantry.fleet = fleet
+            fleet.set_mode(2)
+            fleet.broadcast("load_trajectory")
+            samples = []
+            for _ in range(args.iterations):
+                run_gantry.cur_waypoint = 1
+                fleet.set_target_waypoint(1)
+                forget_setters(gantry_data)
+                start = time.perf_counter()
+                run_gantry.go_to_next(gantry_data)
+                fleet.flush()
+                samples.append(time.perf_counter() - start)
+        results["go_to_next"] = summarize(samples)
+
+        # The same step with multipliers from a precomputed plan, when the
+        # trajectory is known locally
+        run_gantry.plan = MultiplierPlan.from_fleet(fleet)
+        if run_gantry.plan is not None:
+            with contextlib.redirect_stdout(io.StringIO()):
+                samples, returned = [], []
+                for _ in range(args.iterations):
+                    run_gantry.cur_waypoint = 1
+                    fleet.set_target_waypoint(1)
+                    forget_setters(gantry_data)
+                    start = time.perf_counter()
+                    run_gantry.go_to_next(gantry_data)
+                    # How long the keyboard loop is held up, the rest goes out queued
+                    returned.append(time.perf_counter() - start)
+                    fleet.flush()
+                    samples.append(time.perf_counter() - start)
+            results["go_to_next_planned"] = summarize(samples)
+            results["go_to_next_planned_caller"] = summarize(returned)
+    finally:
+        run_gantry.plan = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            stop_fleet(servers, gantry_data, fleet)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the gantry client stack against local stand-in servers"
+    )
+    parser.add_argument("--gantries", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--trajectory-length", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--jitter", type=float, default=0.001)
+    parser.add_argument("--max-connections", type=int, default=7)
+    parser.add_argument("--upload-points", type=int, default=5000)
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    server_options = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "max_connections": args.max_connections,
+    }
+    report = {
+        "timestamp": time.time(),
+        "config": vars(args),
+        "scenarios": {
+            "current_firmware": bench_scenario(args, **server_options),
+            "state_and_trajectory_endpoints": bench_scenario(
+                args,
+                state_endpoint=True,
+                trajectory_endpoint=True,
+                upload_endpoint=True,
+                **server_options,
+            ),
+        },
+    }
+
+    for scenario, results in report["scenarios"].items():
+        print(f"\033[92m{scenario}\033[0m")
+        for name, result in results.items():
+            print(
+                f"  {name:<18} mean {result['mean_ms']:8.3f} ms  "
+                f"p50 {result['p50_ms']:8.3f} ms  p95 {result['p95_ms']:8.3f} ms"
+            )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+from threading import Thread
+
+import numpy as np
+
+import record_gantry
+from benchmark_playback import playback_headless, record_headless, start_emulated_fleet
+from gantry_fleet import GantryFleet
+from telemetry import COLUMNS, TelemetryFile, TelemetryRecorder
+
+
+def synthetic_rows(rows: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    return {
+        "time": np.cumsum(rng.uniform(0.004, 0.006, rows)) + 1.7e9,
+        "q0": rng.normal(0, 20, rows),
+        "q1": rng.normal(0, 20, rows),
+        "waypoint": np.repeat(np.arange(rows // 50 + 1, dtype=np.int32), 50)[:rows],
+        "multiplier_q0": rng.uniform(0.5, 1.0, rows).astype(np.float32),
+        "multiplier_q1": rng.uniform(0.5, 1.0, rows).astype(np.float32),
+        "target_speed": np.full(rows, 60.0, dtype=np.float32),
+    }
+
+
+def record_rows(
+    recorder: TelemetryRecorder, gantry: str, data: dict, latencies: list, rate: float = None
+) -> None:
+    """Record `data` one row at a time, at `rate` Hz as a control loop would or flat out.
+
+    The time every record() call took is added to `latencies`.
+    """
+    columns = [data[column].tolist() for column, _ in COLUMNS]
+    next_row = time.perf_counter()
+    for row in zip(*columns):
+        start = time.perf_counter()
+        recorder.record(gantry, *row)
+        latencies.append(time.perf_counter() - start)
+        if rate:
+            next_row += 1.0 / rate
+            time.sleep(max(0.0, next_row - time.perf_counter()))
+
+
+def check_round_trip(path: str, written: dict) -> None:
+    telemetry = TelemetryFile(path)
+    assert sorted(telemetry.gantries) == sorted(written), "gantries missing from the file"
+    for gantry, data in written.items():
+        columns = telemetry.columns(gantry)
+        for column, dtype in COLUMNS:
+            assert columns[column].dtype == dtype, f"{gantry} {column} has the wrong type"
+            assert np.array_equal(
+                columns[column], data[column].astype(dtype), equal_nan=True
+            ), f"{gantry} {column} didn't round trip"
+
+
+def bulk_benchmark(args, directory: str) -> dict:
+    """Many gantries recording at once, as fast as they can."""
+    path = os.path.join(directory, "bulk.gtlm")
+    written = {
+        f"gantry-{index}": synthetic_rows(args.rows, args.seed + index)
+        for index in range(args.gantries)
+    }
+
+    recorder = TelemetryRecorder(path, chunk_rows=args.chunk_rows)
+    # Flat out, call times mostly measure waiting on the other threads for the GIL
+    threads = [
+        Thread(target=record_rows, args=(recorder, gantry, data, []))
+        for gantry, data in written.items()
+    ]
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    recorded = time.perf_counter() - start
+    recorder.close()
+    cpu = time.process_time() - cpu_start
+    total = time.perf_counter() - start
+    assert recorder.dropped == 0, f"{recorder.dropped} rows dropped"
+    assert recorder.rows_written == args.rows * args.gantries
+
+    start = time.perf_counter()
+    check_round_trip(path, written)
+    read = time.perf_counter() - start
+
+    rows = args.rows * args.gantries
+    return {
+        "rows": rows,
+        "chunks": recorder.chunks_written,
+        "file_mb": os.path.getsize(path) / 1e6,
+        "record_rows_per_s": rows / recorded,
+        "cpu_us_per_row": cpu / rows * 1e6,
+        "write_total_s": total,
+        "read_and_compare_s": read,
+    }
+
+
+def paced_benchmark(args, directory: str) -> dict:
+    """Gantries recording at a steady rate, timing how long each record() call holds them up."""
+    path = os.path.join(directory, "paced.gtlm")
+    rows = int(args.rate * args.duration)
+    written = {
+        f"gantry-{index}": synthetic_rows(rows, args.seed + index) for index in range(args.gantries)
+    }
+
+    # Small chunks so plenty of hand-overs and writes happen while recording
+    recorder = TelemetryRecorder(path, chunk_rows=256)
+    latencies = []
+    threads = [
+        Thread(target=record_rows, args=(recorder, gantry, data, latencies, args.rate))
+        for gantry, data in written.items()
+    ]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    recorder.close()
+    cpu = time.process_time() - cpu_start
+    assert recorder.dropped == 0, f"{recorder.dropped} rows dropped"
+    check_round_trip(path, written)
+
+    latencies.sort()
+    return {
+        "rows": len(latencies),
+        "cpu_percent": cpu / elapsed * 100,
+        "record_call_us": {
+            "median": latencies[len(latencies) // 2] * 1e6,
+            "p99": latencies[int(0.99 * (len(latencies) - 1))] * 1e6,
+            "max": latencies[-1] * 1e6,
+        },
+    }
+
+
+def playback_benchmark(args, directory: str) -> dict:
+    """Record a continuous playback on emulated gantries and check what was captured."""
+    rng = random.Random(args.seed)
+    waypoints = [(rng.uniform(-20, 20), rng.uniform(-20, 20)) for _ in range(args.waypoints)]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        servers, emulators, gantry_data = start_emulated_fleet(
+            args.playback_gantries, args.latency, args.jitter, args.seed
+        )
+        fleet = GantryFleet(gantry_data)
+        record_gantry.fleet = fleet
+        record_gantry.trajectory_dir = None
+        record_gantry.telemetry_dir = directory
+        record_gantry.telemetry_rate = args.rate
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            record_headless(emulators, gantry_data, waypoints)
+            fleet.set_target_speed(args.target_speed)
+            start = time.perf_counter()
+            playback_headless(emulators, gantry_data, args.waypoints - 1, continuous=True)
+            elapsed = time.perf_counter() - start
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fleet.close()
+            for gantry in gantry_data.values():
+                gantry["interface"].disconnect()
+            for server in servers:
+                server.stop()
+
+    [path] = [
+        os.path.join(directory, f)
+        for f in os.listdir(directory)
+        if f.startswith("playback") and f.endswith(".gtlm")
+    ]
+    telemetry = TelemetryFile(path)
+    assert sorted(telemetry.gantries) == sorted(emulators), "a gantry recorded nothing"
+    rates = []
+    for name, emulator in emulators.items():
+        columns = telemetry.columns(name)
+        assert np.all(np.diff(columns["time"]) > 0), f"{name} samples out of order"
+        played = set(np.unique(columns["waypoint"]).tolist()) - {-1}
+        assert played == set(range(args.waypoints)), f"{name} missed commanded waypoints"
+        # The last samples are taken once the gantry has arrived
+        final = emulator.trajectory[-1]
+        for axis in (0, 1):
+            error = abs(columns[f"q{axis}"][-1] - final[axis])
+            assert error <= emulator.tolerance, f"{name} q{axis} ended {error} from the end"
+        assert np.all(columns["target_speed"] == np.float32(args.target_speed))
+        rates.append(len(columns["time"]) / (columns["time"][-1] - columns["time"][0]))
+
+    return {
+        "gantries": len(emulators),
+        "playback_s": elapsed,
+        "samples": len(telemetry),
+        "sample_rate_hz": {"requested": args.rate, "achieved_min": min(rates)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the telemetry recorder and check recordings round trip"
+    )
+    parser.add_argument("--gantries", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=200_000, help="Rows per gantry")
+    parser.add_argument("--chunk-rows", type=int, default=4096)
+    parser.add_argument("--duration", type=float, default=3.0, help="Paced recording, s")
+    parser.add_argument("--playback-gantries", type=int, default=3)
+    parser.add_argument("--waypoints", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=200.0, help="Playback sample rate, Hz")
+    parser.add_argument("--target-speed", type=float, default=60.0)
+    parser.add_argument("--latency", type=float, default=0.0005)
+    parser.add_argument("--jitter", type=float, default=0.0002)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="telemetry_results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bulk = bulk_benchmark(args, directory)
+        paced = paced_benchmark(args, directory)
+        playback = playback_benchmark(args, directory)
+
+    print(f"{bulk['rows']} rows from {args.gantries} threads in {bulk['chunks']} chunks, "
+          f"{bulk['file_mb']:.1f} MB")
+    print(f"Recorded {bulk['record_rows_per_s']:,.0f} rows/s, "
+          f"{bulk['cpu_us_per_row']:.2f} us CPU per row written")
+    print(f"Mapped back and compared in {bulk['read_and_compare_s'] * 1000:.1f} ms")
+    calls = paced["record_call_us"]
+    print(f"At {args.rate:.0f} Hz x {args.gantries} gantries: {paced['cpu_percent']:.1f}% CPU, "
+          f"record() median {calls['median']:.1f} us, p99 {calls['p99']:.1f} us, "
+          f"max {calls['max']:.0f} us")
+    print(f"Playback on {playback['gantries']} emulated gantries recorded "
+          f"{playback['samples']} samples, at least "
+          f"{playback['sample_rate_hz']['achieved_min']:.0f} Hz per gantry")
+
+    with open(args.output, "w") as f:
+        results = {"bulk": bulk, "paced": paced, "playback": playback}
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
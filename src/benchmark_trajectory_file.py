@@ -0,0 +1,150 @@
+import argparse
+import csv
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from trajectory_file import load_trajectories, save_trajectories
+
+
+def make_trajectories(gantries: int, points: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    return {
+        f"gantry-{index}": tuple(np.cumsum(rng.normal(size=(2, points)), axis=1))
+        for index in range(gantries)
+    }
+
+
+def save_json(path: str, trajectories: dict) -> None:
+    with open(path, "w") as f:
+        json.dump(
+            {name: {"q0": list(q0), "q1": list(q1)} for name, (q0, q1) in trajectories.items()},
+            f,
+        )
+
+
+def load_json(path: str) -> dict:
+    with open(path) as f:
+        data = json.load(f)
+    return {name: np.array([axes["q0"], axes["q1"]]) for name, axes in data.items()}
+
+
+def save_csv(path: str, trajectories: dict) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["gantry", "q0", "q1"])
+        for name, (q0, q1) in trajectories.items():
+            writer.writerows((name, a, b) for a, b in zip(q0, q1))
+
+
+def load_csv(path: str) -> dict:
+    rows = {}
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for name, q0, q1 in reader:
+            rows.setdefault(name, []).append((float(q0), float(q1)))
+    return {name: np.array(points).T for name, points in rows.items()}
+
+
+def check_round_trip(directory: str) -> None:
+    """Write awkward trajectories in both precisions and make sure they read back."""
+    cases = {
+        "empty": ([], []),
+        "single": ([1.5], [-2.25]),
+        "gantry-é": (np.linspace(-1e6, 1e6, 1001), np.geomspace(1e-9, 1e9, 1001)),
+        "special": ([np.inf, -np.inf, 0.0, -0.0], [np.nan, 1e-30, 1e30, 1 / 3]),
+    }
+    path = os.path.join(directory, "round_trip.gtrj")
+    for dtype in (np.float64, np.float32):
+        save_trajectories(path, cases, dtype=dtype)
+        loaded = load_trajectories(path)
+        assert list(loaded) == list(cases), "gantry names or order changed"
+        for name, (q0, q1) in cases.items():
+            expected = np.array([q0, q1], dtype=dtype).reshape(2, -1)
+            assert loaded[name].dtype == expected.dtype, f"{name}: dtype changed"
+            assert np.array_equal(loaded[name], expected, equal_nan=True), f"{name}: values changed"
+            assert not loaded[name].flags.writeable, f"{name}: view should be read-only"
+
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) // 2)
+    try:
+        load_trajectories(path)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("truncated file was not rejected")
+
+
+def timed(function, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check and benchmark the binary trajectory format against JSON and CSV"
+    )
+    parser.add_argument("--gantries", type=int, default=3)
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="trajectory_file_results.json")
+    args = parser.parse_args()
+
+    trajectories = make_trajectories(args.gantries, args.points, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        check_round_trip(directory)
+        print("Round trip OK")
+
+        formats = {
+            "binary_f64": (
+                lambda path: save_trajectories(path, trajectories),
+                load_trajectories,
+            ),
+            "binary_f32": (
+                lambda path: save_trajectories(path, trajectories, dtype=np.float32),
+                load_trajectories,
+            ),
+            "json": (lambda path: save_json(path, trajectories), load_json),
+            "csv": (lambda path: save_csv(path, trajectories), load_csv),
+        }
+        for name, (save, load) in formats.items():
+            path = os.path.join(directory, name)
+            save_time = timed(lambda: save(path), 1)
+            open_time = timed(lambda: load(path), args.repeats)
+            # Time to get at every value, which for the binary files includes paging them in
+            read_time = timed(
+                lambda: sum(float(array.sum()) for array in load(path).values()),
+                args.repeats,
+            )
+            results[name] = {
+                "size_mb": os.path.getsize(path) / 1e6,
+                "save_s": save_time,
+                "open_s": open_time,
+                "open_and_read_s": read_time,
+            }
+
+    print(f"{args.gantries} gantries x {args.points} waypoints")
+    print(f"{'format':<12} {'size MB':>9} {'save s':>9} {'open ms':>10} {'read all ms':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:<12} {result['size_mb']:>9.1f} {result['save_s']:>9.3f} "
+            f"{result['open_s'] * 1000:>10.3f} {result['open_and_read_s'] * 1000:>12.1f}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread, current_thread
+
+from request_stats import LatencyHistogram
+
+
+class CommandQueue:
+    """Runs submitted calls one at a time, in order, on a background worker.
+
+    `submit()` returns a Future straight away, so an interactive loop never
+    waits on the network; calls for one gantry still reach it in the order
+    they were submitted. `depth` counts calls not yet finished (including the
+    one running), `peak_depth` the most there have been at once, and
+    `wait_times` how long calls sat in the queue before starting.
+    """
+
+    def __init__(self, name: str = None):
+        self.name = name
+        self._pending = deque()
+        self._running = 0
+        self._changed = Condition()
+        self._worker = None
+        self._closed = False
+
+        self.peak_depth = 0
+        self.wait_times = LatencyHistogram()
+
+    @property
+    def depth(self) -> int:
+        with self._changed:
+            return len(self._pending) + self._running
+
+    def submit(self, function, *args, **kwargs) -> Future:
+        future = Future()
+        with self._changed:
+            if self._closed:
+                raise RuntimeError(f"Command queue {self.name} is closed")
+            self._pending.append((future, time.perf_counter(), function, args, kwargs))
+            self.peak_depth = max(self.peak_depth, len(self._pending) + self._running)
+            if self._worker is None:
+                self._worker = Thread(
+                    target=self._run, name=f"gantry-commands-{self.name}", daemon=True
+                )
+                self._worker.start()
+            self._changed.notify_all()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    self._worker = None
+                    return
+                future, queued, function, args, kwargs = self._pending.popleft()
+                self._running = 1
+
+            if future.set_running_or_notify_cancel():
+                self.wait_times.record(time.perf_counter() - queued)
+                try:
+                    future.set_result(function(*args, **kwargs))
+                except Exception as e:
+                    future.set_exception(e)
+
+            with self._changed:
+                self._running = 0
+                self._changed.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait until every call submitted so far has finished.
+
+        Returns False if `timeout` seconds pass first.
+        """
+        with self._changed:
+            return self._changed.wait_for(
+                lambda: not self._pending and not self._running, timeout
+            )
+
+    def close(self, cancel: bool = True) -> None:
+        """Stop the worker after the call in progress, cancelling the rest unless `cancel` is False.
+
+        The queue can be used again after reopen().
+        """
+        with self._changed:
+            if cancel:
+                while self._pending:
+                    self._pending.popleft()[0].cancel()
+            self._closed = True
+            worker = self._worker
+            self._changed.notify_all()
+        # A queued command may itself close the queue, e.g. a disconnect
+        if worker is not None and worker is not current_thread():
+            worker.join()
+
+    def reopen(self) -> None:
+        with self._changed:
+            self._closed = False
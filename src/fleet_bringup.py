@@ -0,0 +1,157 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition
+
+from gantry_interface import GantryInterface
+
+
+def _address(data: dict) -> tuple:
+    return data["addresses"], data["port"]
+
+
+class FleetBringUp:
+    """Connects gantries as soon as they are discovered, in parallel.
+
+    Each gantry passed to `add()` (or announced to `on_change()`, which can be
+    registered on a GantryListener) is handed to a worker that opens its
+    session, warms up `warm_up` pooled connections and sets `mode`. Ready
+    gantries appear in `gantry_data` with their "interface", in the same shape
+    as GantryListener.gantry_data, so a GantryFleet built on it picks up late
+    arrivals too. A gantry announced at a new address while it is still coming
+    up, say because it was added from a stale cache, is retried there if the
+    old address fails.
+
+    Times in `report()` are seconds since the bring-up started.
+    """
+
+    def __init__(
+        self,
+        gantry_data: dict = None,
+        mode: int = 0,
+        warm_up: int = 2,
+        max_workers: int = 16,
+    ):
+        self.gantry_data = gantry_data if gantry_data is not None else {}
+        self.mode = mode
+        self.warm_up = warm_up
+
+        self.started = time.monotonic()
+        # name -> {"discovered", "connected", "ready", "error"}
+        self.records = {}
+        # name -> newest data announced while that gantry was coming up
+        self._announced = {}
+        self._changed = Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gantry-bringup"
+        )
+
+    def _now(self) -> float:
+        return time.monotonic() - self.started
+
+    def add(self, name: str, data: dict) -> None:
+        """Start bringing up a gantry, unless it is already up or on its way."""
+        with self._changed:
+            record = self.records.get(name)
+            if record is not None and record["error"] is None:
+                if record["ready"] is None:
+                    self._announced[name] = dict(data)
+                return
+            self.records[name] = {
+                "discovered": self._now(),
+                "connected": None,
+                "ready": None,
+                "error": None,
+            }
+        self._executor.submit(self._bring_up, name, dict(data))
+
+    def on_change(self, event: str, name: str, data: dict) -> None:
+        if event in ("added", "updated"):
+            self.add(name, data)
+
+    def _bring_up(self, name: str, data: dict) -> None:
+        record = self.records[name]
+        interface = GantryInterface(name)
+        try:
+            if not interface.connect(data["addresses"], data["port"], warm_up=self.warm_up):
+                raise ConnectionError(f"Could not open a session on {name}")
+            record["connected"] = self._now()
+            interface.set_mode(self.mode)
+        except Exception as e:
+            # Stop anything a half-finished connect left running
+            interface.disconnect()
+            with self._changed:
+                announced = self._announced.pop(name, None)
+                if announced is None or _address(announced) == _address(data):
+                    record["error"] = e
+                    self._changed.notify_all()
+                    return
+            print(f"Gantry {name} not reachable at {_address(data)}, trying {_address(announced)}")
+            self._executor.submit(self._bring_up, name, announced)
+            return
+
+        with self._changed:
+            self._announced.pop(name, None)
+            record["ready"] = self._now()
+            self.gantry_data[name] = {**data, "interface": interface}
+            self._changed.notify_all()
+
+    def wait_ready(self, count: int = None, names=None, timeout: float = None) -> bool:
+        """Wait until `count` gantries, or all of `names`, are ready.
+
+        Gantries named in `names` that failed to come up stop the wait early.
+        Returns True only if everything asked for is ready.
+        """
+        names = set(names or ())
+        count = count if count is not None else 0
+
+        def settled():
+            finished = {
+                name
+                for name, record in self.records.items()
+                if record["ready"] is not None or record["error"] is not None
+            }
+            return len(self.gantry_data) >= count and names <= finished
+
+        with self._changed:
+            self._changed.wait_for(settled, timeout)
+            return len(self.gantry_data) >= count and names <= self.gantry_data.keys()
+
+    def report(self) -> dict:
+        """Time until every gantry so far was ready, and each one's bring-up latency."""
+        with self._changed:
+            records = {name: dict(record) for name, record in self.records.items()}
+
+        ready = [record["ready"] for record in records.values() if record["ready"] is not None]
+        return {
+            "time_to_ready": max(ready) if ready else None,
+            "gantries": {
+                name: {
+                    **record,
+                    "error": None if record["error"] is None else str(record["error"]),
+                    "latency": (
+                        None
+                        if record["ready"] is None
+                        else record["ready"] - record["discovered"]
+                    ),
+                }
+                for name, record in records.items()
+            },
+        }
+
+    def print_report(self) -> None:
+        report = self.report()
+        for name, record in sorted(report["gantries"].items()):
+            if record["error"] is not None:
+                print(f"  {name:<16} failed: {record['error']}")
+            elif record["latency"] is None:
+                print(f"  {name:<16} still coming up")
+            else:
+                print(
+                    f"  {name:<16} found at {record['discovered']:6.3f} s, "
+                    f"ready in {record['latency'] * 1000:7.1f} ms"
+                )
+        if report["time_to_ready"] is not None:
+            print(f"Fleet ready after {report['time_to_ready']:.3f} s")
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
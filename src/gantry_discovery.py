@@ -0,0 +1,173 @@
+import json
+import os
+import time
+from threading import Lock, Thread
+
+from zeroconf import ServiceBrowser, Zeroconf
+
+from gantry_listener import GantryListener
+
+SERVICE_TYPE = "_http._tcp.local."
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".gantry_cache.json")
+
+
+class DiscoveryCache:
+    """Last-known name -> (address, port) of every gantry, kept in a JSON file."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+
+    def load(self) -> dict:
+        """{name: {"addresses", "port", "last_seen"}}, empty if there is no usable cache."""
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {
+            name: entry
+            for name, entry in entries.items()
+            if isinstance(entry, dict) and "addresses" in entry and "port" in entry
+        }
+
+    def save(self, gantry_data: dict) -> None:
+        """Replace the cache with `gantry_data`, so gantries that are gone drop out of it."""
+        now = time.time()
+        entries = {
+            name: {"addresses": data["addresses"], "port": data["port"], "last_seen": now}
+            for name, data in gantry_data.items()
+        }
+
+        # Write then rename, so a crash never leaves half a file behind
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(entries, f, indent=2)
+        os.replace(temporary, self.path)
+
+
+class GantryDiscovery:
+    """mDNS discovery that returns as soon as the expected gantries are found.
+
+    `wait()` returns once `count` gantries or every name in `names` has
+    answered, or at the deadline. `cached()` returns the gantries found on a
+    previous run straight from disk, so they can be connected right away while
+    `revalidate()` checks them in the background and refreshes the cache.
+    Only gantries seen this session, or passed to `remember()` once they were
+    brought up, are written back, so one that is gone isn't tried again next
+    time. Browsing carries on until `close()`, and `follow()` keeps connected
+    interfaces pointed at wherever their gantry is announced.
+    """
+
+    def __init__(self, cache_path: str = DEFAULT_CACHE_PATH, service_type: str = SERVICE_TYPE):
+        self.cache = DiscoveryCache(cache_path)
+        self.service_type = service_type
+        self.listener = GantryListener()
+
+        # Cached gantries whose address mDNS reported differently, and those it
+        # didn't report at all, after revalidation
+        self.moved = {}
+        self.missing = set()
+
+        # Gantries seen or brought up this session, what the cache is rewritten with
+        self._current = {}
+        self._save_lock = Lock()
+
+        self._zeroconf = None
+        self._browser = None
+        self._revalidator = None
+
+    def start(self) -> None:
+        if self._zeroconf is None:
+            self._zeroconf = Zeroconf()
+            self._browser = ServiceBrowser(self._zeroconf, self.service_type, self.listener)
+
+    def found(self) -> dict:
+        """Gantries seen on the network so far, as {name: {"addresses", "port"}}."""
+        with self.listener.changed:
+            return {name: dict(data) for name, data in self.listener.gantry_data.items()}
+
+    def cached(self) -> dict:
+        return {
+            name: {"addresses": entry["addresses"], "port": entry["port"]}
+            for name, entry in self.cache.load().items()
+        }
+
+    def _save(self, gantries: dict) -> None:
+        # Revalidation saves from its own thread
+        with self._save_lock:
+            self._current.update(
+                {
+                    name: {"addresses": data["addresses"], "port": data["port"]}
+                    for name, data in gantries.items()
+                }
+            )
+            self.cache.save(self._current)
+
+    def remember(self, gantries: dict) -> None:
+        """Keep gantries that were brought up in the cache, even if mDNS never saw them."""
+        if gantries:
+            self._save(gantries)
+
+    def wait(self, count: int = None, names=None, timeout: float = 10.0) -> dict:
+        """Browse until the expected gantries are found or `timeout` passes, and cache them."""
+        self.start()
+        if not self.listener.wait_for(count, names, timeout):
+            print(f"Discovery deadline passed with {len(self.listener.gantry_data)} gantries found")
+        found = self.found()
+        if found:
+            self._save(found)
+        return found
+
+    def follow(self, gantries: dict) -> None:
+        """Re-point each gantry's "interface" when mDNS reports it at a new address."""
+
+        def moved(event, gantry_name, data):
+            gantry = gantries.get(gantry_name)
+            if event == "removed" or gantry is None:
+                return
+            gantry["addresses"], gantry["port"] = data["addresses"], data["port"]
+            if "interface" in gantry:
+                gantry["interface"].repoint(data["addresses"], data["port"])
+
+        self.listener.on_change(moved)
+        # Catch up on anything announced before we subscribed
+        for gantry_name, data in self.found().items():
+            moved("added", gantry_name, data)
+        self.start()
+
+    def revalidate(self, names=None, timeout: float = 10.0) -> None:
+        """Check cached gantries over mDNS in the background.
+
+        Runs until every one of `names` (default: everything in the cache) has
+        been seen again, or for `timeout` seconds. Address changes end up in
+        `moved`, gantries that never answered in `missing`.
+        """
+        cached = self.cached()
+        names = set(cached if names is None else names)
+        if not names:
+            return
+        self.start()
+
+        def run():
+            self.listener.wait_for(names=names, timeout=timeout)
+            found = self.found()
+            self.moved = {
+                name: data
+                for name, data in found.items()
+                if name in cached and data != cached[name]
+            }
+            self.missing = names - found.keys()
+            if found:
+                self._save(found)
+            for name in self.missing:
+                print(f"Cached gantry {name} was not found on the network")
+
+        self._revalidator = Thread(target=run, daemon=True)
+        self._revalidator.start()
+
+    def close(self) -> None:
+        # May be called from the revalidation thread and the caller at once
+        zeroconf, self._zeroconf, self._browser = self._zeroconf, None, None
+        if zeroconf is not None:
+            zeroconf.close()
+            self.listener.close()
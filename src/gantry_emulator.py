@@ -0,0 +1,207 @@
+import math
+import time
+
+from gantry_stub_server import StandInGantry
+
+# Modes as used by the firmware and the scripts
+MODE_IDLE = 0
+MODE_RECORD = 1
+MODE_PLAYBACK = 2
+
+
+class GantryEmulator(StandInGantry):
+    """StandInGantry whose axes actually move.
+
+    Each axis tracks its target with a velocity- and acceleration-limited
+    (trapezoidal) profile. In playback mode the target is the current trajectory
+    waypoint and each axis is capped at target_speed * its speed multiplier; in
+    record mode the axes follow `move_by_hand()`; in idle mode they brake to a
+    stop. The model is integrated in `dt` steps on a simulation clock that runs
+    `time_scale` times faster than wall time and catches up lazily whenever the
+    gantry is queried, so no thread is needed.
+
+    Every target_waypoint command opens a segment in `segments`, recording when
+    it was commanded and when each axis arrived within `tolerance`.
+    """
+
+    def __init__(
+        self,
+        max_velocity: tuple = (100.0, 100.0),
+        max_acceleration: tuple = (400.0, 400.0),
+        tolerance: float = 0.05,
+        dt: float = 0.001,
+        time_scale: float = 1.0,
+    ):
+        super().__init__()
+        self.max_velocity = list(max_velocity)
+        self.max_acceleration = list(max_acceleration)
+        self.tolerance = tolerance
+        self.dt = dt
+        self.time_scale = time_scale
+
+        self.velocity = [0.0, 0.0]
+        self.sim_time = 0.0
+        self._hand_target = None
+        self._wall_start = time.monotonic()
+
+        self.segments = []
+
+    def now(self) -> float:
+        """Current simulation time in seconds."""
+        return (time.monotonic() - self._wall_start) * self.time_scale
+
+    def move_by_hand(self, q0: float, q1: float) -> None:
+        """Push the gantry towards a position, as an operator does in record mode."""
+        with self.lock:
+            self._advance()
+            self._hand_target = [q0, q1]
+
+    def _axis_target(self, axis: int):
+        """Position an axis is heading for and its speed cap, or None to brake."""
+        if self.mode == MODE_PLAYBACK and self.trajectory:
+            speed = self.target_speed * self.speed_multiplier[axis]
+            return self._waypoint(self.target_waypoint)[axis], speed
+        if self.mode == MODE_RECORD and self._hand_target is not None:
+            return self._hand_target[axis], self.max_velocity[axis]
+        return None
+
+    def _step_axis(self, axis: int, dt: float) -> None:
+        velocity = self.velocity[axis]
+        accel = self.max_acceleration[axis]
+        target = self._axis_target(axis)
+
+        if target is None:
+            desired = 0.0
+        else:
+            position, speed = target
+            error = position - self.position[axis]
+            speed = min(abs(speed), self.max_velocity[axis])
+            # Fastest speed we can still stop from before the target
+            desired = math.copysign(min(speed, math.sqrt(2 * accel * abs(error))), error)
+
+            if abs(error) <= abs(velocity) * dt and abs(velocity) <= accel * dt:
+                self.position[axis] = position
+                self.velocity[axis] = 0.0
+                return
+
+        change = max(-accel * dt, min(accel * dt, desired - velocity))
+        self.velocity[axis] = velocity + change
+        self.position[axis] += self.velocity[axis] * dt
+
+    def _advance(self) -> None:
+        """Integrate the model up to the current simulation time."""
+        now = self.now()
+        while self.sim_time + self.dt <= now:
+            self.sim_time += self.dt
+            for axis in (0, 1):
+                self._step_axis(axis, self.dt)
+            self._check_arrival()
+
+    def _check_arrival(self) -> None:
+        if not self.segments or self.mode != MODE_PLAYBACK or not self.trajectory:
+            return
+
+        segment = self.segments[-1]
+        waypoint = self._waypoint(segment["waypoint"])
+        for axis in (0, 1):
+            if segment["arrived"][axis] is None and (
+                abs(self.position[axis] - waypoint[axis]) <= self.tolerance
+                and abs(self.velocity[axis]) <= self.max_acceleration[axis] * self.dt
+            ):
+                segment["arrived"][axis] = self.sim_time
+
+    def arrived(self) -> bool:
+        """True once both axes have reached the most recently commanded waypoint."""
+        with self.lock:
+            self._advance()
+            return bool(self.segments) and None not in self.segments[-1]["arrived"]
+
+    def get(self, path: str):
+        with self.lock:
+            self._advance()
+            return super().get(path)
+
+    def get_state(self) -> dict:
+        with self.lock:
+            self._advance()
+            return super().get_state()
+
+    def post(self, path: str, data: dict):
+        with self.lock:
+            self._advance()
+            status, body = super().post(path, data)
+            if status == 200 and path == "/target_waypoint":
+                self.segments.append(
+                    {
+                        "waypoint": self.target_waypoint,
+                        "commanded": self.sim_time,
+                        "start": list(self.position),
+                        "arrived": [None, None],
+                    }
+                )
+            elif status == 200 and path == "/mode":
+                self._hand_target = None
+            return status, body
+
+
+def _axis_skew(segment: dict, emulator: GantryEmulator) -> float:
+    """Gap between the two axes' arrivals, if both actually had to move and settled."""
+    if None in segment["arrived"]:
+        return 0.0
+    waypoint = emulator.trajectory[segment["waypoint"]]
+    moved = [
+        abs(waypoint[axis] - segment["start"][axis]) > emulator.tolerance
+        for axis in (0, 1)
+    ]
+    if not all(moved):
+        return 0.0
+    return abs(segment["arrived"][0] - segment["arrived"][1])
+
+
+def segment_metrics(emulators: dict) -> dict:
+    """Cycle time, arrival skew and idle time from the segments of several emulators.
+
+    Segments are matched across gantries by their position in each log, so
+    every emulator should have been sent the same sequence of waypoints. A
+    segment that was superseded before the gantry settled on its waypoint
+    counts as arriving when the next one was commanded, with no idle time.
+    """
+    count = min(len(emulator.segments) for emulator in emulators.values())
+    per_segment = []
+    for index in range(count):
+        segments = {name: e.segments[index] for name, e in emulators.items()}
+        arrivals = {}
+        for name, segment in segments.items():
+            if None not in segment["arrived"]:
+                arrivals[name] = max(segment["arrived"])
+            elif index + 1 < len(emulators[name].segments):
+                arrivals[name] = emulators[name].segments[index + 1]["commanded"]
+        if len(arrivals) < len(segments):
+            break
+
+        row = {
+            "waypoint": next(iter(segments.values()))["waypoint"],
+            "commanded": min(s["commanded"] for s in segments.values()),
+            "arrived": max(arrivals.values()),
+            "axis_skew": max(
+                _axis_skew(s, emulators[name]) for name, s in segments.items()
+            ),
+            "gantry_skew": max(arrivals.values()) - min(arrivals.values()),
+        }
+        if per_segment:
+            # Time every gantry sat at the previous waypoint before moving again
+            row["idle"] = max(0.0, row["commanded"] - per_segment[-1]["arrived"])
+        per_segment.append(row)
+
+    if not per_segment:
+        return {"segments": []}
+
+    idle = [row["idle"] for row in per_segment if "idle" in row]
+    return {
+        "segments": per_segment,
+        "cycle_time": per_segment[-1]["arrived"] - per_segment[0]["commanded"],
+        "max_axis_skew": max(row["axis_skew"] for row in per_segment),
+        "max_gantry_skew": max(row["gantry_skew"] for row in per_segment),
+        "total_idle": sum(idle),
+        "mean_idle": sum(idle) / len(idle) if idle else 0.0,
+    }
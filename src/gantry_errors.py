@@ -0,0 +1,42 @@
+class GantryError(Exception):
+    """A request to a gantry that didn't produce a usable answer.
+
+    `retryable` says whether sending the same request again could help.
+    """
+
+    retryable = False
+
+    def __init__(self, gantry: str, endpoint: str, message: str):
+        super().__init__(f"Gantry {gantry}: {endpoint}: {message}")
+        self.gantry = gantry
+        self.endpoint = endpoint
+
+
+class GantryTimeout(GantryError, TimeoutError):
+    """No answer before the request's deadline."""
+
+    retryable = True
+
+
+class GantryConnectionError(GantryError, ConnectionError):
+    """The connection was refused or dropped."""
+
+    retryable = True
+
+
+class GantryUnavailable(GantryError, ConnectionError):
+    """Not sent at all, the gantry's circuit breaker is open."""
+
+
+class GantryHTTPError(GantryError):
+    """The gantry answered with an error status."""
+
+    def __init__(self, gantry: str, endpoint: str, status: int, body: str):
+        super().__init__(gantry, endpoint, f"status {status}: {body}")
+        self.status = status
+        # Busy or crashed firmware may do better next time, a missing endpoint won't
+        self.retryable = status >= 500
+
+
+class GantryResponseError(GantryError):
+    """The gantry answered, but not with what was asked for."""
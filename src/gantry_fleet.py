@@ -0,0 +1,312 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Barrier, BrokenBarrierError
+
+from gantry_errors import GantryTimeout
+
+
+class FleetResult:
+    """Per-gantry outcome of a fleet-wide command."""
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.start_times = {}
+        self.end_times = {}
+        # Our time.monotonic() at which a synchronized start was scheduled
+        self.start_time = None
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    @property
+    def start_skew(self) -> float:
+        """Seconds between the first and last gantry's request going out."""
+        if not self.start_times:
+            return 0.0
+        return max(self.start_times.values()) - min(self.start_times.values())
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds from the first request going out to the last one returning."""
+        if not self.start_times:
+            return 0.0
+        return max(self.end_times.values()) - min(self.start_times.values())
+
+    def __repr__(self):
+        return (
+            f"FleetResult(ok={self.ok}, start_skew={self.start_skew * 1000:.2f}ms, "
+            f"elapsed={self.elapsed * 1000:.2f}ms, errors={self.errors})"
+        )
+
+
+class GantryFleet:
+    """Sends commands to every gantry in a GantryListener.gantry_data registry at once.
+
+    Each gantry gets its own worker thread, and workers are released together
+    so that all requests leave within one round trip of each other. With a
+    `timeout`, a fleet command returns after at most that many seconds, and
+    gantries that hadn't finished are reported with a GantryTimeout; otherwise
+    the interfaces' own request deadlines bound it.
+    """
+
+    def __init__(self, gantry_data: dict, timeout: float = None):
+        self.gantry_data = gantry_data
+        self.timeout = timeout
+        self._executor = None
+        self._workers = 0
+
+    @property
+    def responsive(self) -> list:
+        """Names of gantries whose heartbeat is currently answering."""
+        return [
+            name
+            for name, interface in self.interfaces.items()
+            if getattr(interface, "connected", True)
+        ]
+
+    @property
+    def interfaces(self) -> dict:
+        return {
+            name: gantry["interface"]
+            # Copy first, gantries may be added while we look
+            for name, gantry in list(self.gantry_data.items())
+            if "interface" in gantry
+        }
+
+    def __len__(self):
+        return len(self.gantry_data)
+
+    def _ensure_workers(self, count: int) -> None:
+        # Every call needs its own thread, otherwise the barrier can never trip
+        if count > self._workers:
+            if self._executor:
+                self._executor.shutdown(wait=True)
+            self._executor = ThreadPoolExecutor(
+                max_workers=count, thread_name_prefix="gantry-fleet"
+            )
+            self._workers = count
+
+    def _run(self, calls: dict) -> FleetResult:
+        """Run {name: (interface, method, args, kwargs)} concurrently and collect the results.
+
+        Gantries whose heartbeat has gone silent are not sent anything and are
+        reported with a ConnectionError instead.
+        """
+        result = FleetResult()
+        for name, (interface, _, _, _) in list(calls.items()):
+            if not getattr(interface, "connected", True):
+                result.errors[name] = ConnectionError(f"Gantry {name} is not responding")
+                del calls[name]
+
+        if not calls:
+            return result
+
+        self._ensure_workers(len(calls))
+        barrier = Barrier(len(calls))
+
+        def worker(name, interface, method, args, kwargs):
+            try:
+                barrier.wait(timeout=1.0)
+            except BrokenBarrierError:
+                pass  # Go anyway, skew will show in the result
+
+            start = time.perf_counter()
+            try:
+                return getattr(interface, method)(*args, **kwargs), None, start, time.perf_counter()
+            except Exception as e:
+                return None, e, start, time.perf_counter()
+
+        futures = {
+            name: self._executor.submit(worker, name, *call) for name, call in calls.items()
+        }
+        _, late = wait(futures.values(), timeout=self.timeout)
+
+        for name, future in futures.items():
+            if future in late:
+                result.errors[name] = GantryTimeout(
+                    name, calls[name][1], f"did not finish within {self.timeout} s"
+                )
+                continue
+            value, error, result.start_times[name], result.end_times[name] = future.result()
+            if error is None:
+                result.results[name] = value
+            else:
+                result.errors[name] = error
+
+        if late:
+            # Leave the stuck workers behind, the next command gets fresh ones
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._workers = 0
+
+        return result
+
+    def broadcast(self, method: str, *args, **kwargs) -> FleetResult:
+        """Call the same interface method with the same arguments on every gantry."""
+        return self._run(
+            {
+                name: (interface, method, args, kwargs)
+                for name, interface in self.interfaces.items()
+            }
+        )
+
+    def broadcast_each(self, method: str, args_by_name: dict) -> FleetResult:
+        """Call an interface method on each named gantry with its own argument tuple."""
+        interfaces = self.interfaces
+        return self._run(
+            {
+                name: (interfaces[name], method, tuple(args), {})
+                for name, args in args_by_name.items()
+            }
+        )
+
+    def submit(self, method: str, *args, **kwargs) -> dict:
+        """Queue the same call on every gantry without waiting; returns {name: Future}."""
+        return {
+            name: interface.submit(method, *args, **kwargs)
+            for name, interface in self.interfaces.items()
+        }
+
+    def submit_each(self, method: str, args_by_name: dict) -> dict:
+        """Queue a call on each named gantry with its own argument tuple; returns {name: Future}."""
+        interfaces = self.interfaces
+        return {
+            name: interfaces[name].submit(method, *args) for name, args in args_by_name.items()
+        }
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait for every gantry's queued commands to finish. False if `timeout` passed first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return all(
+            interface.flush(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            for interface in self.interfaces.values()
+        )
+
+    def queue_depth(self) -> dict:
+        """Queued commands not yet finished, per gantry."""
+        return {name: interface.queue_depth for name, interface in self.interfaces.items()}
+
+    def start_sampling(self, rate: float, recorder=None) -> None:
+        """Sample every gantry's position at `rate` Hz, also into `recorder` if given."""
+        for interface in self.interfaces.values():
+            interface.start_sampling(rate, recorder)
+
+    def stop_sampling(self) -> None:
+        for interface in self.interfaces.values():
+            interface.stop_sampling()
+
+    def set_mode(self, value: int) -> FleetResult:
+        return self.broadcast("set_mode", value)
+
+    def set_target_waypoint(self, value: int) -> FleetResult:
+        return self.broadcast("set_target_waypoint", value)
+
+    def start_lead(self) -> float:
+        """Seconds ahead a synchronized start must be scheduled to reach every gantry in time."""
+        worst = max(
+            (
+                interface.rtt.srtt + 4 * interface.rtt.rttvar
+                for interface in self.interfaces.values()
+                if getattr(interface, "rtt", None) is not None and interface.rtt.srtt is not None
+            ),
+            default=0.0,
+        )
+        # Fan-out skew and a slow request on top of the worst usual round trip
+        return max(2 * worst, 0.02)
+
+    def set_target_waypoint_synchronized(self, value: int, lead: float = None) -> FleetResult:
+        """Have every gantry start towards waypoint `value` at the same moment.
+
+        The start is scheduled `lead` seconds from now (by default
+        `start_lead()`) on each gantry's own clock, so network jitter no longer
+        shows up as start skew. Gantries whose clock isn't known are sent the
+        waypoint at that moment instead, and if none know it this is just
+        set_target_waypoint(). `results` holds whether each gantry was
+        scheduled, and `start_time` our time.monotonic() of the start.
+        """
+        if not any(
+            getattr(interface, "clock", None) is not None and interface.clock.synced
+            for interface in self.interfaces.values()
+        ):
+            result = self.set_target_waypoint(value)
+            result.start_time = time.monotonic()
+            return result
+
+        at = time.monotonic() + (self.start_lead() if lead is None else lead)
+        result = self.broadcast("start_target_waypoint_at", value, at)
+        result.start_time = at
+        return result
+
+    def submit_target_waypoint_synchronized(self, value: int, lead: float = None) -> dict:
+        """Queue a synchronized start of waypoint `value` without waiting; returns {name: Future}.
+
+        The start is pushed back by however long the longest queue should take
+        to drain, so it doesn't pass before the command gets out.
+        """
+        interfaces = self.interfaces
+        if not any(
+            getattr(interface, "clock", None) is not None and interface.clock.synced
+            for interface in interfaces.values()
+        ):
+            return self.submit("set_target_waypoint", value)
+
+        backlog = max(
+            interface.queue_depth * (interface.rtt.srtt or interface.heartbeat_timeout)
+            for interface in interfaces.values()
+        )
+        at = time.monotonic() + backlog + (self.start_lead() if lead is None else lead)
+        return self.submit("start_target_waypoint_at", value, at)
+
+    def measure_start_skew(self, value: int, lead: float = None, settle: float = 0.05) -> dict:
+        """Do a synchronized start and report when each gantry says it started.
+
+        Gantry start times are mapped back to our clock with each one's offset
+        estimate, so the reported skew is only as good as `error_bound`, the
+        sum of the two largest offset errors.
+        """
+        result = self.set_target_waypoint_synchronized(value, lead)
+        time.sleep(max(0.0, result.start_time - time.monotonic()) + settle)
+
+        starts = self.broadcast("get_last_start").results
+        starts = {
+            name: start["time"]
+            for name, start in starts.items()
+            if start is not None and start["waypoint"] == value
+        }
+        errors = sorted(
+            (
+                interface.clock.error
+                for interface in self.interfaces.values()
+                if interface.clock.synced
+            ),
+            reverse=True,
+        )
+        return {
+            "scheduled": result.start_time,
+            "starts": starts,
+            "skew": max(starts.values()) - min(starts.values()) if starts else None,
+            "late": {name: t - result.start_time for name, t in starts.items()},
+            "error_bound": sum(errors[:2]),
+            "errors": result.errors,
+        }
+
+    def set_target_speed(self, value: float) -> FleetResult:
+        return self.broadcast("set_target_speed", value)
+
+    def set_speed_multipler(self, q0: float, q1: float) -> FleetResult:
+        return self.broadcast("set_speed_multipler", q0, q1)
+
+    def upload_trajectory(self, trajectories: dict, chunk_size: int = 256) -> FleetResult:
+        """Upload {name: (q0, q1)} waypoints to each named gantry in parallel."""
+        return self.broadcast_each(
+            "upload_trajectory",
+            {name: (q0, q1, chunk_size) for name, (q0, q1) in trajectories.items()},
+        )
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._workers = 0
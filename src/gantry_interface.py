@@ -1,66 +1,593 @@
 import requests
-from threading import Thread, Event
+from requests.adapters import HTTPAdapter
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event, Lock
+import math
+import random
 import uuid
 import time
+import zlib
 
+from command_queue import CommandQueue
+from gantry_errors import (
+    GantryConnectionError,
+    GantryError,
+    GantryHTTPError,
+    GantryResponseError,
+    GantryTimeout,
+    GantryUnavailable,
+)
+from request_stats import REQUEST_STATS
+from telemetry import PositionRingBuffer
+
+
+# GETs that change the gantry's state, and so must never be sent twice
+NON_IDEMPOTENT_GETS = {"/add_waypoint", "/save_trajectory"}
+
+# How far a mirrored waypoint may be from the one the gantry stored and still
+# match. Without /trajectory the mirror holds positions read back after each
+# add_waypoint(), which pick up encoder noise and any hand still on the gantry.
+MIRROR_TOLERANCE = 0.05
+
+# Reads that make up a full state snapshot, one GET per axis
+STATE_ENDPOINTS = {
+    "position": ("/position/q0", "/position/q1"),
+    "next_waypoint": ("/next_waypoint/q0", "/next_waypoint/q1"),
+    "previous_waypoint": ("/previous_waypoint/q0", "/previous_waypoint/q1"),
+}
+
+
+def trajectory_checksum(q0, q1) -> int:
+    """CRC-32 of a trajectory as the gantry stores it: float32 q0 values, then q1."""
+    return zlib.crc32(array("f", q1).tobytes(), zlib.crc32(array("f", q0).tobytes()))
+
+
+class GantryState:
+    """Position and neighbouring waypoints sampled together.
+
+    `timestamp` is the wall-clock midpoint of the samples and `sample_spread` is
+    how far apart in seconds the individual axis samples were taken.
+    """
+
+    def __init__(
+        self,
+        position: tuple[float, float],
+        next_waypoint: tuple[float, float],
+        previous_waypoint: tuple[float, float],
+        timestamp: float,
+        sample_spread: float,
+    ):
+        self.position = position
+        self.next_waypoint = next_waypoint
+        self.previous_waypoint = previous_waypoint
+        self.timestamp = timestamp
+        self.sample_spread = sample_spread
+
+    def __repr__(self):
+        return (
+            f"GantryState(position={self.position}, next_waypoint={self.next_waypoint}, "
+            f"previous_waypoint={self.previous_waypoint}, timestamp={self.timestamp:.3f}, "
+            f"sample_spread={self.sample_spread * 1000:.2f}ms)"
+        )
+
+
+class StateCache:
+    """Client-side shadow of the values last written to a gantry.
+
+    Setters check here first and skip the request when the gantry already holds
+    the value. Anything that might make the shadow stale (a reconnect, a failed
+    write) must invalidate it.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._values = {}
+        self.requests_saved = 0
+        self.saved_by_endpoint = {}
+
+    def is_current(self, endpoint: str, value) -> bool:
+        """True if `value` is already on the gantry; counts the skipped request."""
+        if not self.enabled or endpoint not in self._values:
+            return False
+        if self._values[endpoint] != value:
+            return False
+
+        self.requests_saved += 1
+        self.saved_by_endpoint[endpoint] = self.saved_by_endpoint.get(endpoint, 0) + 1
+        return True
+
+    def update(self, endpoint: str, value, ok: bool) -> None:
+        if ok:
+            self._values[endpoint] = value
+        else:
+            # The write may or may not have landed
+            self._values.pop(endpoint, None)
+
+    def get(self, endpoint: str, default=None):
+        return self._values.get(endpoint, default)
+
+    def invalidate(self, endpoint: str = None) -> None:
+        if endpoint is None:
+            self._values.clear()
+        else:
+            self._values.pop(endpoint, None)
+
+
+class TrajectoryMirror:
+    """Indexed local copy of the trajectory stored on a gantry.
+
+    The heartbeat may clear it while another thread reads, so both axes are
+    swapped in as one tuple and `lookup()` checks and reads the same pair.
+    """
 
-class GantryInterface:
     def __init__(self):
+        self._axes = (array("d"), array("d"))
+        self.valid = False
+
+    @property
+    def q0(self) -> array:
+        return self._axes[0]
+
+    @property
+    def q1(self) -> array:
+        return self._axes[1]
+
+    def __len__(self):
+        return len(self._axes[0])
+
+    def append(self, q0: float, q1: float) -> None:
+        axes = self._axes
+        axes[0].append(q0)
+        axes[1].append(q1)
+
+    def replace(self, q0, q1) -> None:
+        self._axes = (array("d", q0), array("d", q1))
+
+    def clear(self) -> None:
+        self._axes = (array("d"), array("d"))
+        self.valid = False
+
+    def waypoint(self, index: int) -> tuple[float, float]:
+        q0, q1 = self._axes
+        return q0[index], q1[index]
+
+    def lookup(self, index: int):
+        """Waypoint `index`, or None if the mirror isn't valid or doesn't hold it."""
+        q0, q1 = self._axes
+        if not self.valid or not 0 <= index < min(len(q0), len(q1)):
+            return None
+        return q0[index], q1[index]
+
+
+class RttEstimator:
+    """Smoothed round-trip time and jitter, as TCP computes them (RFC 6298)."""
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.last = None
+
+    def update(self, rtt: float) -> None:
+        self.last = rtt
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += self.BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += self.ALPHA * (rtt - self.srtt)
+
+    @property
+    def jitter(self) -> float:
+        return self.rttvar
+
+    def is_slow(self, rtt: float) -> bool:
+        """True if `rtt` is well outside what this gantry normally answers in."""
+        if self.srtt is None:
+            return False
+        return rtt > self.srtt + 4 * self.rttvar
+
+    def reset(self) -> None:
+        self.srtt = None
+        self.rttvar = None
+        self.last = None
+
+
+class CircuitBreaker:
+    """Fails requests fast while a gantry is down.
+
+    After `failure_threshold` requests in a row time out or lose their
+    connection the breaker opens, and `allow()` turns requests away without
+    touching the network. Heartbeats keep probing in the background and close
+    it on their first answer; failing that, one request is let through as a
+    trial every `reset_timeout` seconds.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 1.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        # Times the breaker has opened
+        self.trips = 0
+        self._lock = Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let this one through, and no other until it has had time to fail
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self) -> bool:
+        """Returns True if this closed the breaker."""
+        with self._lock:
+            was_open = self.opened_at is not None
+            self.failures = 0
+            self.opened_at = None
+            return was_open
+
+    def record_failure(self) -> bool:
+        """Returns True if this opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            if self.opened_at is not None:
+                # A failed trial, wait a full reset_timeout before the next
+                self.opened_at = time.monotonic()
+                return False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self.trips += 1
+                return True
+            return False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+
+class ClockSync:
+    """Offset of the gantry's clock from ours, estimated NTP style.
+
+    Each exchange gives our send and receive times around one reading of the
+    gantry clock. If the request and response take equally long, the gantry
+    read its clock halfway through, so offset = gantry - (sent + received) / 2
+    and is wrong by at most half the round trip, plus however far the clocks
+    may have drifted apart since (MAX_DRIFT). Of the last `window` exchanges
+    the one with the smallest such bound is trusted. That is usually the
+    shortest round trip, since queueing is what makes the two directions differ.
+    """
+
+    MAX_DRIFT = 100e-6
+
+    def __init__(self, window: int = 32):
+        # (round trip, offset, local time of the exchange)
+        self.samples = deque(maxlen=window)
+
+    def update(self, sent: float, gantry_time: float, received: float) -> None:
+        self.samples.append(
+            (received - sent, gantry_time - (sent + received) / 2, (sent + received) / 2)
+        )
+
+    @property
+    def synced(self) -> bool:
+        return bool(self.samples)
+
+    def _best(self) -> tuple:
+        """(error bound, offset) of the most trustworthy exchange."""
+        now = time.monotonic()
+        return min(
+            (rtt / 2 + self.MAX_DRIFT * (now - measured), offset)
+            for rtt, offset, measured in self.samples
+        )
+
+    @property
+    def offset(self) -> float:
+        """Seconds to add to our time.monotonic() to get the gantry's clock."""
+        return self._best()[1]
+
+    @property
+    def error(self) -> float:
+        """Bound on how far `offset` may be off right now, in seconds."""
+        return self._best()[0]
+
+    def to_gantry(self, local_time: float) -> float:
+        return local_time + self.offset
+
+    def to_local(self, gantry_time: float) -> float:
+        return gantry_time - self.offset
+
+    def reset(self) -> None:
+        self.samples.clear()
+
+
+class GantryInterface:
+    def __init__(
+        self,
+        name: str = None,
+        pool_maxsize: int = 6,
+        cache_setters: bool = True,
+        sample_rate: float = 0.0,
+        sample_capacity: int = 4096,
+        heartbeat_interval: float = 1.0,
+        heartbeat_min_interval: float = 0.1,
+        heartbeat_timeout: float = 0.5,
+        request_timeout: float = 1.0,
+        request_deadline: float = 2.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.02,
+        backoff_cap: float = 0.2,
+        failure_threshold: int = 3,
+        reset_timeout: float = 1.0,
+    ):
+        self.name = name
         self.server_url = None
+        self.session_id = None
         self._stop_event = Event()
         self._listener_thread = None
+        self._sampler_thread = None
+        self._sampler_stop = Event()
         self.connected = False
 
         self.heartbeat_failure_count = 0
         self.MAX_HEARTBEAT_FAILURES = 5
 
-    def _send_request(self, method, endpoint, data=None):
-        headers = {"session_id": self.session_id}
+        # Heartbeats run every `heartbeat_interval` seconds while the gantry answers
+        # promptly, and drop to `heartbeat_min_interval` as soon as one is slow or
+        # missed. A dead gantry is therefore flagged within `detection_time`.
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_min_interval = heartbeat_min_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self._current_interval = heartbeat_interval
+        self.rtt = RttEstimator()
+        # Firmware that reports its clock on heartbeats can be told to act at a set time
+        self.clock = ClockSync()
+        self._connection_callbacks = []
+
+        # Each attempt gives up after `request_timeout` seconds and a whole call,
+        # retries and backoff included, after `request_deadline`. Idempotent
+        # GETs are retried up to `max_retries` times with jittered exponential
+        # backoff. A breaker stops requests going out while the gantry is down.
+        self.request_timeout = request_timeout
+        self.request_deadline = request_deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        # Keep-alive session shared by every request to this gantry. The pool is
+        # bounded so a burst of calls can't open more sockets than the ESP32 can
+        # serve; extra callers wait for a free connection instead.
+        self.pool_maxsize = pool_maxsize
+        self._session = self._make_session()
+
+        # Full URLs are built once per endpoint and reused
+        self._urls = {}
+
+        # Workers for reads that are issued in parallel, created on first use
+        self._read_executor = None
+        # Commands submitted without waiting, sent in order by a worker of their own
+        self.commands = CommandQueue(name)
+        # Whether the firmware serves the combined /state endpoint, None until probed
+        self.has_state_endpoint = None
 
-        # Strip leading slash from endpoint
-        if endpoint.startswith("/"):
-            endpoint = endpoint[1:]
+        # Last written mode, speeds, multipliers, waypoint and PID/LPF values
+        self.state_cache = StateCache(enabled=cache_setters)
 
-        # print(f"Sending {method} request to {endpoint} with data: {data}")
+        # Local copy of the gantry's trajectory, the waypoints this client has
+        # added since the last save, and those it saved last
+        self.trajectory = TrajectoryMirror()
+        self._recorded = TrajectoryMirror()
+        self._saved = TrajectoryMirror()
+        self.has_trajectory_endpoint = None
 
-        url = f"{self.server_url}/{endpoint}"
+        # Positions sampled in the background at `sample_rate` Hz (0 disables)
+        self.sample_rate = sample_rate
+        self.positions = PositionRingBuffer(sample_capacity)
+        # Also recorded with the commanded values into a TelemetryRecorder, if set
+        self.telemetry = None
+        # Waypoint commanded before and after our time.monotonic() `at`
+        self._commanded = (-1, -1, 0.0)
+
+    def _make_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_maxsize, pool_block=True
+        )
+        session.mount("http://", adapter)
+        return session
+
+    def _url(self, endpoint: str) -> str:
+        url = self._urls.get(endpoint)
+        if url is None:
+            # Strip leading slash from endpoint
+            url = f"{self.server_url}/{endpoint.lstrip('/')}"
+            self._urls[endpoint] = url
+        return url
+
+    def _attempt(self, method, endpoint, data, timeout):
+        """Send one request and return the parsed body, or raise a GantryError."""
+        url = self._url(endpoint)
+        status = None
+        start = time.perf_counter()
         try:
             if method == "GET":
-                response = requests.get(url, headers=headers)
+                response = self._session.get(url, timeout=timeout)
             elif method == "POST":
-                response = requests.post(url, json=data, headers=headers)
+                response = self._session.post(url, json=data, timeout=timeout)
+            status = response.status_code
 
-            if response.status_code != 200:
-                print(
-                    f"Request to {endpoint} failed with status {response.status_code}: {response.text}"
-                )
-                return None
+        except requests.Timeout as e:
+            self._request_failed()
+            raise GantryTimeout(self.name, endpoint, f"no answer within {timeout:.3f} s") from e
 
-            # Check if JSON response
-            if response.headers.get("content-type") == "application/json":
+        except requests.RequestException as e:
+            self._request_failed()
+            raise GantryConnectionError(self.name, endpoint, str(e)) from e
+
+        finally:
+            REQUEST_STATS.record(
+                self.name or self.server_url,
+                method,
+                endpoint,
+                time.perf_counter() - start,
+                status,
+            )
+
+        # Any answer at all shows the gantry is up, though it may have rebooted
+        if self.breaker.record_success():
+            print(f"Gantry {self.name} is answering again")
+            self._forget_gantry_state()
+
+        if response.status_code != 200:
+            raise GantryHTTPError(self.name, endpoint, response.status_code, response.text)
+
+        # Check if JSON response
+        if response.headers.get("content-type") == "application/json":
+            try:
                 return response.json()
-            else:
-                return response.text
+            except ValueError as e:
+                raise GantryResponseError(self.name, endpoint, "malformed JSON") from e
+        else:
+            return response.text
 
-        except requests.RequestException as e:
+    def _request_failed(self) -> None:
+        if self.breaker.record_failure():
+            print(f"Gantry {self.name} is not answering, failing requests fast")
+            # Have the heartbeat check on it promptly
+            self._current_interval = self.heartbeat_min_interval
+
+    def _request(self, method, endpoint, data=None, timeout=None, retry=None, probe=False):
+        """Send a request and return the parsed body, or raise a GantryError.
+
+        Each attempt times out after `timeout` (default `request_timeout`), and
+        the call as a whole, retries included, gives up at `request_deadline`.
+        Idempotent GETs (`retry` defaults to that) are retried after a timeout,
+        a dropped connection or a 5xx. While the breaker is open this fails at
+        once with GantryUnavailable, unless it is a `probe` such as a heartbeat.
+        """
+        if not probe and not self.breaker.allow():
+            raise GantryUnavailable(self.name, endpoint, "not answering, request not sent")
+        if retry is None:
+            retry = method == "GET" and endpoint not in NON_IDEMPOTENT_GETS
+        timeout = timeout or self.request_timeout
+        deadline = time.monotonic() + max(self.request_deadline, timeout)
+
+        attempt = 0
+        while True:
+            try:
+                return self._attempt(
+                    method, endpoint, data, min(timeout, deadline - time.monotonic())
+                )
+            except GantryError as e:
+                if not (retry and e.retryable and attempt < self.max_retries):
+                    raise
+                # Full jitter, so gantries that failed together don't retry together
+                backoff = random.uniform(
+                    0, min(self.backoff_cap, self.backoff_base * 2**attempt)
+                )
+                if time.monotonic() + backoff >= deadline or (
+                    not probe and self.breaker.is_open
+                ):
+                    raise
+                time.sleep(backoff)
+                attempt += 1
+
+    def _send_request(self, method, endpoint, data=None, timeout=None, retry=None, probe=False):
+        """Like _request(), but prints the error and returns None on failure."""
+        try:
+            return self._request(method, endpoint, data, timeout, retry, probe)
+        except GantryUnavailable:
+            return None  # Already reported when the breaker opened
+        except GantryError as e:
             print(f"Failed to send {method} request to {endpoint}. Error: {e}")
             return None
 
-    def connect(self, ip: str, port: int = 8080) -> bool:
-        """Connect to the ESP32 web server."""
+    def _get_number(self, endpoint: str, kind=float, retry=None):
+        """GET an endpoint that answers with a bare number."""
+        response = self._request("GET", endpoint, retry=retry)
+        try:
+            return kind(response)
+        except (TypeError, ValueError) as e:
+            raise GantryResponseError(
+                self.name, endpoint, f"expected a number, got {response!r}"
+            ) from e
+
+    def _set_value(self, endpoint: str, value) -> None:
+        """POST a value unless the gantry is already known to hold it."""
+        if self.state_cache.is_current(endpoint, value):
+            return
+
+        response = self._send_request("POST", endpoint, {"value": value})
+        self.state_cache.update(endpoint, value, response is not None)
+
+    def _warm_up(self, count: int) -> None:
+        """Open up to `count` pooled connections ahead of the first real command."""
+        count = min(count, self.pool_maxsize)
+        threads = [
+            Thread(target=self._send_request, args=("GET", "/session"))
+            for _ in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def connect(self, ip: str, port: int = 8080, warm_up: int = 0) -> bool:
+        """Connect to the ESP32 web server.
+
+        If `warm_up` is non-zero, that many keep-alive connections are opened
+        up front so the first commands don't pay for a TCP handshake.
+        """
         self.server_url = f"http://{ip}:{port}"
+        self._urls = {}
+        self.has_state_endpoint = None
+        # A new session may be a rebooted gantry, nothing we wrote before is known
+        self.state_cache.invalidate()
+        self.trajectory.clear()
+        self._recorded.clear()
+        self._saved.clear()
+        self.has_trajectory_endpoint = None
+        self.positions.clear()
         self.session_id = str(uuid.uuid4())[:8]
+        self._session.headers["session_id"] = self.session_id
+        self.commands.reopen()
+        self.breaker.reset()
         print(f"Session ID: {self.session_id}")
 
         response = self._send_request(
-            "POST", "/session", {"session_id": self.session_id}
+            "POST", "/session", {"session_id": self.session_id}, probe=True
         )
 
         # Check for 200 response
         if response:
-            self._listener_thread = Thread(target=self._heartbeat)
+            if warm_up:
+                self._warm_up(warm_up)
+
+            self._stop_event.clear()
+            self.heartbeat_failure_count = 0
+            self._current_interval = self.heartbeat_interval
+            self.rtt.reset()
+            self.clock.reset()
+            # A few quick readings so a scheduled start works before the first heartbeat
+            self.sync_clock(4)
+            self._set_connected(True)
+
+            self._listener_thread = Thread(target=self._heartbeat, daemon=True)
             self._listener_thread.start()
-            self.connected = True
+            self._start_sampler()
 
             return True
         else:
@@ -68,133 +595,628 @@ class GantryInterface:
             return False
 
     def disconnect(self) -> None:
-        """Disconnect from the server and stop the listener thread."""
+        """Disconnect from the server and stop the listener thread.
+
+        Queued commands that haven't started yet are cancelled.
+        """
+        self.commands.close()
         self._stop_event.set()
-        if self._listener_thread:
-            self._listener_thread.join()
-        self.connected = False
+        self._sampler_stop.set()
+        for thread in (self._listener_thread, self._sampler_thread):
+            if thread:
+                thread.join()
+        self._listener_thread = self._sampler_thread = None
+        self._set_connected(False)
+
+        if self._read_executor:
+            self._read_executor.shutdown(wait=True)
+            self._read_executor = None
+
+        # Drop pooled sockets; a later connect() starts from a fresh pool
+        self._session.close()
+        self._session = self._make_session()
         print("Disconnected from gantry.")
 
+    def repoint(self, ip: str, port: int = 8080) -> bool:
+        """Follow the gantry to a new address without tearing down the session.
+
+        The heartbeat and sampler keep running and use the new address from
+        their next request on. The session is registered again there, and
+        nothing cached about the gantry is trusted in case it moved because it
+        rebooted. Connects from scratch if there was no live session.
+        """
+        if self.server_url == f"http://{ip}:{port}":
+            return True
+        if self._listener_thread is None or not self._listener_thread.is_alive():
+            return self.connect(ip, port)
+
+        print(f"Gantry {self.name} moved to {ip}:{port}")
+        self.server_url = f"http://{ip}:{port}"
+        self._urls = {}
+        self._forget_gantry_state()
+
+        self.breaker.reset()
+        return self._register_session()
+
+    def _forget_gantry_state(self) -> None:
+        """Drop everything known about the gantry's state, in case it rebooted."""
+        self.has_state_endpoint = None
+        self.state_cache.invalidate()
+        self.trajectory.clear()
+        self._saved.clear()
+        self.has_trajectory_endpoint = None
+        self.clock.reset()
+
+    def _register_session(self) -> bool:
+        response = self._send_request(
+            "POST", "/session", {"session_id": self.session_id}, probe=True
+        )
+        return bool(response)
+
+    def submit(self, method: str, *args, **kwargs):
+        """Queue a call to one of this interface's methods and return a Future for its result.
+
+        Queued calls run in the order they were submitted, one at a time, but
+        calls made directly don't wait for the queue; flush() first when
+        their order relative to queued commands matters.
+        """
+        future = self.commands.submit(getattr(self, method), *args, **kwargs)
+
+        def report(future):
+            # Nobody may be waiting on the result, so don't let a failure pass silently
+            if not future.cancelled() and future.exception() is not None:
+                print(f"Queued {method} on gantry {self.name} failed: {future.exception()}")
+
+        future.add_done_callback(report)
+        return future
+
+    def flush(self, timeout: float = None) -> bool:
+        """Wait for every queued command to finish. False if `timeout` passed first."""
+        return self.commands.flush(timeout)
+
+    @property
+    def queue_depth(self) -> int:
+        """Queued commands not yet finished."""
+        return self.commands.depth
+
+    def on_connection_change(self, callback) -> None:
+        """Call `callback(interface, connected)` whenever the gantry goes silent or comes back."""
+        self._connection_callbacks.append(callback)
+
+    def _set_connected(self, connected: bool) -> None:
+        if connected == self.connected:
+            return
+
+        self.connected = connected
+        for callback in self._connection_callbacks:
+            try:
+                callback(self, connected)
+            except Exception as e:
+                print(f"Connection callback failed: {e}")
+
+    @property
+    def detection_time(self) -> float:
+        """Worst-case seconds between a gantry going silent and `connected` turning False."""
+        return self.heartbeat_interval + self.MAX_HEARTBEAT_FAILURES * (
+            self.heartbeat_timeout + self.heartbeat_min_interval
+        )
+
     def _heartbeat(self) -> None:
         """Private method to continuously poll the server for heartbeats."""
-        self._stop_event.clear()
+        while not self._stop_event.wait(self._current_interval):
+            start = time.monotonic()
+            # One attempt, let through even while the breaker is open
+            response = self._send_request(
+                "GET", "/session", timeout=self.heartbeat_timeout, retry=False, probe=True
+            )
+            rtt = time.monotonic() - start
+
+            if not isinstance(response, dict) or response.get("status") != "success":
+                self.heartbeat_failure_count += 1
+                # Probe quickly so a dead gantry is confirmed in bounded time
+                self._current_interval = self.heartbeat_min_interval
+            else:
+                self.heartbeat_failure_count = 0
+                if self.rtt.is_slow(rtt):
+                    self._current_interval = self.heartbeat_min_interval
+                else:
+                    # Back off gradually towards the normal interval
+                    self._current_interval = min(
+                        self._current_interval * 2, self.heartbeat_interval
+                    )
+                self.rtt.update(rtt)
+                if "time" in response:
+                    self.clock.update(start, response["time"], start + rtt)
+
+            if self.heartbeat_failure_count >= self.MAX_HEARTBEAT_FAILURES:
+                if self.connected:
+                    print("Disconnected from gantry due to too many heartbeat failures.")
+                    self._set_connected(False)
+                # Keep probing at the normal rate in case it comes back
+                self._current_interval = self.heartbeat_interval
+            elif self.heartbeat_failure_count == 0 and not self.connected:
+                print("Gantry is responding again.")
+                # It may have been power cycled meanwhile, so re-register and
+                # don't skip writes of values it may no longer hold
+                self._forget_gantry_state()
+                if self._register_session():
+                    self._set_connected(True)
 
-        # while not self._stop_event.is_set():
-        #     response = self._send_request("GET", "/session")
+    def start_sampling(self, rate: float = None, recorder=None) -> None:
+        """Sample positions in the background, at `rate` Hz if given.
 
-        #     if not response or response.get("status") != "success":
-        #         print("Heartbeat check failed.")
-        #         self.heartbeat_failure_count += 1
-        #     else:
-        #         self.heartbeat_failure_count = 0
+        With a TelemetryRecorder, every sample is also recorded along with the
+        commanded waypoint, speed multipliers and target speed. Sampling
+        resumes after a reconnect until stop_sampling().
+        """
+        if rate:
+            self.sample_rate = rate
+        if recorder is not None:
+            self.telemetry = recorder
+        if self.connected and self._sampler_thread is None:
+            self._start_sampler()
 
-        #     if self.heartbeat_failure_count >= self.MAX_HEARTBEAT_FAILURES:
-        #         print("Disconnected from gantry due to too many heartbeat failures.")
-        #         self.connected = False
-        #         self._stop_event.set()
+    def stop_sampling(self) -> None:
+        """Stop background sampling and detach any recorder."""
+        self._sampler_stop.set()
+        if self._sampler_thread:
+            self._sampler_thread.join()
+        self._sampler_thread = None
+        self.sample_rate = 0.0
+        self.telemetry = None
 
-        #     # Wait for a few seconds before polling again
-        #     self._stop_event.wait(2)
+    def _start_sampler(self) -> None:
+        if self.sample_rate > 0:
+            self._sampler_stop.clear()
+            self._sampler_thread = Thread(target=self._sample_positions, daemon=True)
+            self._sampler_thread.start()
+
+    def _sample_positions(self) -> None:
+        """Sample position into the ring buffer at a fixed rate.
+
+        Failures are reported once when they start and once when sampling
+        recovers, not for every sample.
+        """
+        failing = False
+        period = 1.0 / self.sample_rate
+        next_sample = time.monotonic()
+        while not self._sampler_stop.is_set():
+            try:
+                self._sample_position()
+            except GantryError as e:
+                if not failing:
+                    print(f"Gantry {self.name} position sampling is failing: {e}")
+                    failing = True
+            else:
+                if failing:
+                    print(f"Gantry {self.name} position sampling has recovered")
+                    failing = False
+
+            # start_sampling() may have changed the rate while we were running
+            if self.sample_rate > 0:
+                period = 1.0 / self.sample_rate
+            # Skip ahead rather than bursting if a sample ran long
+            next_sample = max(next_sample + period, time.monotonic())
+            self._sampler_stop.wait(next_sample - time.monotonic())
+
+    def _sample_position(self) -> None:
+        """Take one sample, or raise a GantryError. The next sample is the retry."""
+        start = time.time()
+        q0 = self._get_number("/position/q0", retry=False)
+        q1 = self._get_number("/position/q1", retry=False)
+
+        timestamp = (start + time.time()) / 2
+        self.positions.append(timestamp, q0, q1)
+        recorder = self.telemetry
+        if recorder is not None:
+            cache = self.state_cache
+            recorder.record(
+                self.name,
+                timestamp,
+                q0,
+                q1,
+                self.commanded_waypoint(),
+                cache.get("/speed_multiplier/q0", math.nan),
+                cache.get("/speed_multiplier/q1", math.nan),
+                cache.get("/target_speed", math.nan),
+            )
+
+    def commanded_waypoint(self) -> int:
+        """Waypoint last sent to the gantry, taking effect now; -1 if none yet."""
+        before, after, at = self._commanded
+        return after if time.monotonic() >= at else before
 
     def set_pid_position_p_channel_0(self, value: float) -> None:
         """Set the position/p PID value on the ESP32 web server for channel 0."""
-        self._send_request("POST", "/ch0/position/p", {"value": value})
+        self._set_value("/ch0/position/p", value)
 
     def set_pid_position_p_channel_1(self, value: float) -> None:
         """Set the position/p PID value on the ESP32 web server for channel 1."""
-        self._send_request("POST", "/ch1/position/p", {"value": value})
+        self._set_value("/ch1/position/p", value)
 
     # Adding methods for all other endpoints
     # ... for channel 0
     def set_pid_position_i_channel_0(self, value: float) -> None:
-        self._send_request("POST", "/ch0/position/i", {"value": value})
+        self._set_value("/ch0/position/i", value)
 
     def set_pid_position_d_channel_0(self, value: float) -> None:
-        self._send_request("POST", "/ch0/position/d", {"value": value})
+        self._set_value("/ch0/position/d", value)
 
     def set_pid_position_lpf_channel_0(self, value: float) -> None:
-        self._send_request("POST", "/ch0/position/lpf", {"value": value})
+        self._set_value("/ch0/position/lpf", value)
 
     def set_pid_velocity_p_channel_0(self, value: float) -> None:
-        self._send_request("POST", "/ch0/velocity/p", {"value": value})
+        self._set_value("/ch0/velocity/p", value)
 
     def set_pid_velocity_i_channel_0(self, value: float) -> None:
-        self._send_request("POST", "/ch0/velocity/i", {"value": value})
+        self._set_value("/ch0/velocity/i", value)
 
     def set_pid_velocity_d_channel_0(self, value: float) -> None:
-        self._send_request("POST", "/ch0/velocity/d", {"value": value})
+        self._set_value("/ch0/velocity/d", value)
 
     def set_pid_velocity_lpf_channel_0(self, value: float) -> None:
-        self._send_request("POST", "/ch0/velocity/lpf", {"value": value})
+        self._set_value("/ch0/velocity/lpf", value)
 
     # ... for channel 1
     def set_pid_position_i_channel_1(self, value: float) -> None:
-        self._send_request("POST", "/ch1/position/i", {"value": value})
+        self._set_value("/ch1/position/i", value)
 
     def set_pid_position_d_channel_1(self, value: float) -> None:
-        self._send_request("POST", "/ch1/position/d", {"value": value})
+        self._set_value("/ch1/position/d", value)
 
     def set_pid_position_lpf_channel_1(self, value: float) -> None:
-        self._send_request("POST", "/ch1/position/lpf", {"value": value})
+        self._set_value("/ch1/position/lpf", value)
 
     def set_pid_velocity_p_channel_1(self, value: float) -> None:
-        self._send_request("POST", "/ch1/velocity/p", {"value": value})
+        self._set_value("/ch1/velocity/p", value)
 
     def set_pid_velocity_i_channel_1(self, value: float) -> None:
-        self._send_request("POST", "/ch1/velocity/i", {"value": value})
+        self._set_value("/ch1/velocity/i", value)
 
     def set_pid_velocity_d_channel_1(self, value: float) -> None:
-        self._send_request("POST", "/ch1/velocity/d", {"value": value})
+        self._set_value("/ch1/velocity/d", value)
 
     def set_pid_velocity_lpf_channel_1(self, value: float) -> None:
-        self._send_request("POST", "/ch1/velocity/lpf", {"value": value})
+        self._set_value("/ch1/velocity/lpf", value)
 
     def set_target_waypoint(self, value: int) -> None:
-        self._send_request("POST", "/target_waypoint", {"value": value})
+        self._set_value("/target_waypoint", value)
+        self._commanded = (value, value, 0.0)
+
+    def sync_clock(self, samples: int = 8) -> bool:
+        """Take `samples` clock readings now instead of waiting for heartbeats.
+
+        Returns False if the firmware doesn't report its clock.
+        """
+        for _ in range(samples):
+            sent = time.monotonic()
+            response = self._send_request(
+                "GET", "/session", timeout=self.heartbeat_timeout, retry=False
+            )
+            received = time.monotonic()
+            if not isinstance(response, dict) or "time" not in response:
+                return self.clock.synced
+            self.clock.update(sent, response["time"], received)
+        return True
+
+    def schedule_target_waypoint(self, value: int, at: float) -> bool:
+        """Have the gantry move to waypoint `value` at our time.monotonic() `at`.
+
+        The start time is translated to the gantry's clock, so it starts within
+        `clock.error` of `at` however long this request takes to arrive, as long
+        as it arrives in time. Returns False without sending anything if the
+        gantry's clock isn't known.
+        """
+        if not self.clock.synced:
+            return False
+        # The target only changes at `at`, until then the cache can't vouch for it
+        self.state_cache.invalidate("/target_waypoint")
+        response = self._send_request(
+            "POST", "/scheduled_start", {"waypoint": value, "time": self.clock.to_gantry(at)}
+        )
+        if response is None:
+            return False
+        self._commanded = (self.commanded_waypoint(), value, at)
+        return True
+
+    def start_target_waypoint_at(self, value: int, at: float) -> bool:
+        """Schedule waypoint `value` for `at`, or wait and send it then if that fails.
+
+        Returns True if the gantry was scheduled.
+        """
+        if self.schedule_target_waypoint(value, at):
+            return True
+        delay = at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.set_target_waypoint(value)
+        return False
+
+    def get_last_start(self) -> dict:
+        """When the gantry last changed its target waypoint, on our clock.
+
+        Returns {"waypoint", "time"}, or None if the firmware doesn't say or
+        its clock isn't known.
+        """
+        response = self._send_request("GET", "/scheduled_start")
+        if not isinstance(response, dict) or not response.get("started") or not self.clock.synced:
+            return None
+        started = response["started"]
+        return {"waypoint": started["waypoint"], "time": self.clock.to_local(started["time"])}
 
     def get_target_waypoint(self) -> int:
-        cur_waypoint = self._send_request("GET", "/target_waypoint")
-        return int(cur_waypoint)
+        return self._get_number("/target_waypoint", int)
 
     def set_mode(self, value: int) -> None:
-        self._send_request("POST", "/mode", {"value": value})
+        if self.state_cache.get("/mode") != value:
+            # The firmware may reset its target when switching modes
+            self.state_cache.invalidate("/target_waypoint")
+        self._set_value("/mode", value)
 
     def get_position(
         self,
+        max_age: float = None,
     ) -> tuple[float, float]:
-        position_0 = self._send_request("GET", "/position/q0")
-        position_1 = self._send_request("GET", "/position/q1")
+        """Read the current position of both axes.
+
+        If `max_age` is given and the background sampler has a sample at most
+        that many seconds old, it is returned without a request.
+        """
+        if max_age is not None:
+            sample = self.positions.latest(max_age)
+            if sample is not None:
+                return float(sample[1]), float(sample[2])
 
-        return float(position_0), float(position_1)
+        return self._get_number("/position/q0"), self._get_number("/position/q1")
 
     def add_waypoint(self) -> bool:
         response = self._send_request("GET", "/add_waypoint")
 
+        if response:
+            # The gantry stores its current position, keep our own copy so the
+            # trajectory doesn't have to be read back waypoint by waypoint
+            try:
+                self._recorded.append(*self.get_position())
+            except GantryError:
+                self._recorded.valid = False
+
         return bool(response)
 
     def save_trajectory(self) -> bool:
         response = self._send_request("GET", "/save_trajectory")
 
+        if response:
+            # The gantry starts a fresh recording after a save
+            self._saved, self._recorded = self._recorded, TrajectoryMirror()
+            self.load_trajectory()
+
         return bool(response)
 
+    def upload_trajectory(self, q0, q1, chunk_size: int = 256, max_retries: int = 5) -> bool:
+        """Replace the gantry's trajectory with the given waypoints.
+
+        Waypoints are sent in order in chunks of at most `chunk_size`. After a
+        failed chunk the gantry is asked how much it has and the upload carries
+        on from there, up to `max_retries` times in a row. Calling this again with
+        the same waypoints after it gave up also resumes rather than restarts,
+        since the upload is identified by its checksum. The gantry only swaps in
+        the new trajectory once the checksum of everything it received matches.
+        """
+        q0, q1 = array("d", q0), array("d", q1)
+        if len(q0) != len(q1):
+            raise ValueError("q0 and q1 must have the same length")
+        checksum = trajectory_checksum(q0, q1)
+        upload_id = f"{checksum:08x}-{len(q0)}"
+
+        received = None
+        failures = 0
+        while True:
+            if received is None:
+                # Start, or find out where a previous attempt got to
+                response = self._send_request(
+                    "POST",
+                    "/trajectory/upload/begin",
+                    {"upload_id": upload_id, "length": len(q0)},
+                )
+            elif received < len(q0):
+                end = min(received + chunk_size, len(q0))
+                response = self._send_request(
+                    "POST",
+                    "/trajectory/upload/chunk",
+                    {
+                        "upload_id": upload_id,
+                        "offset": received,
+                        "q0": q0[received:end].tolist(),
+                        "q1": q1[received:end].tolist(),
+                    },
+                )
+            else:
+                response = self._send_request(
+                    "POST",
+                    "/trajectory/upload/commit",
+                    {"upload_id": upload_id, "checksum": checksum},
+                )
+                if isinstance(response, dict):
+                    break
+
+            if isinstance(response, dict) and "received" in response:
+                received = int(response["received"])
+                failures = 0
+            else:
+                failures += 1
+                if failures > max_retries:
+                    print(f"Giving up on trajectory upload after {failures} failures")
+                    return False
+                received = None
+
+        # We know exactly what the gantry now holds, but not where it now targets
+        self._saved.replace(q0, q1)
+        self._recorded.clear()
+        self.state_cache.invalidate("/target_waypoint")
+        self.load_trajectory()
+        return True
+
     def set_target_speed(self, value: float) -> None:
-        self._send_request("POST", "/target_speed", {"value": value})
+        self._set_value("/target_speed", value)
 
     def set_speed_multipler(self, q0: float, q1: float) -> None:
-        self._send_request("POST", "/speed_multiplier/q0", {"value": q0})
-        self._send_request("POST", "/speed_multiplier/q1", {"value": q1})
+        self._set_value("/speed_multiplier/q0", q0)
+        self._set_value("/speed_multiplier/q1", q1)
 
     def get_next_waypoint(self) -> tuple[float, float]:
-        waypoint_0 = self._send_request("GET", "/next_waypoint/q0")
-        waypoint_1 = self._send_request("GET", "/next_waypoint/q1")
+        waypoint = self._mirrored_waypoint(1)
+        if waypoint is not None:
+            return waypoint
 
-        return float(waypoint_0), float(waypoint_1)
+        return self._get_number("/next_waypoint/q0"), self._get_number("/next_waypoint/q1")
 
     def get_previous_waypoint(self) -> tuple[float, float]:
-        waypoint_0 = self._send_request("GET", "/previous_waypoint/q0")
-        waypoint_1 = self._send_request("GET", "/previous_waypoint/q1")
+        waypoint = self._mirrored_waypoint(-1)
+        if waypoint is not None:
+            return waypoint
 
-        return float(waypoint_0), float(waypoint_1)
+        return (
+            self._get_number("/previous_waypoint/q0"),
+            self._get_number("/previous_waypoint/q1"),
+        )
 
     def get_trajectory_length(self) -> int:
-        return int(self._send_request("GET", "/trajectory_length"))
+        return self._get_number("/trajectory_length", int)
+
+    def load_trajectory(self) -> bool:
+        """Fill the local trajectory mirror and check it against the gantry.
+
+        Reads the whole trajectory from /trajectory when the firmware serves it,
+        otherwise uses the waypoints this client last saved. Returns True if the
+        mirror matches get_trajectory_length() and can be used.
+        """
+        self.trajectory.clear()
+
+        if self.has_trajectory_endpoint is not False:
+            served, response = self._optional_get("/trajectory")
+            if served is not None:
+                self.has_trajectory_endpoint = served
+            if served:
+                self.trajectory.replace(response["q0"], response["q1"])
+
+        if not self.has_trajectory_endpoint and len(self._saved):
+            self.trajectory.replace(self._saved.q0, self._saved.q1)
+
+        try:
+            length = self.get_trajectory_length()
+        except GantryError as e:
+            print(f"Could not check the local trajectory: {e}")
+            length = None
+        if length is None or len(self.trajectory) != length:
+            self.trajectory.clear()
+            return False
+
+        self.trajectory.valid = True
+
+        # Make sure our idea of next/previous matches the firmware's
+        waypoint = self._mirrored_waypoint(1)
+        if waypoint is not None:
+            try:
+                stored = (
+                    self._get_number("/next_waypoint/q0"),
+                    self._get_number("/next_waypoint/q1"),
+                )
+                matches = all(
+                    abs(mirrored - actual) <= MIRROR_TOLERANCE
+                    for mirrored, actual in zip(waypoint, stored)
+                )
+            except GantryError as e:
+                print(f"Could not check the local trajectory: {e}")
+                matches = False
+            if not matches:
+                print("Local trajectory does not match the gantry, not using it.")
+                self.trajectory.clear()
+
+        return self.trajectory.valid
+
+    def _mirrored_waypoint(self, offset: int):
+        """Waypoint `offset` steps from the current target, or None if not known locally."""
+        target = self.state_cache.get("/target_waypoint")
+        if target is None:
+            return None
+        return self.trajectory.lookup(int(target) + offset)
+
+    def _timed_get(self, endpoint: str) -> tuple[object, float]:
+        """GET an endpoint and return the response with the midpoint of the round trip."""
+        start = time.time()
+        response = self._request("GET", endpoint)
+        return response, (start + time.time()) / 2
+
+    def _optional_get(self, endpoint: str) -> tuple[bool, object]:
+        """GET an endpoint that only some firmware serves.
+
+        Returns (served, response). `served` is False only if the gantry says
+        the endpoint doesn't exist, and None if the gantry couldn't be asked.
+        """
+        try:
+            response = self._request("GET", endpoint)
+        except GantryUnavailable:
+            return None, None
+        except GantryError as e:
+            if isinstance(e, GantryHTTPError) and e.status == 404:
+                return False, None
+            print(f"Failed to send GET request to {endpoint}. Error: {e}")
+            return None, None
+        return isinstance(response, dict), response
+
+    def get_state(self) -> GantryState:
+        """Read position, next and previous waypoint as one snapshot.
+
+        Uses the combined /state endpoint when the firmware serves it, otherwise
+        issues all six per-axis reads at once. Waypoints available from the local
+        trajectory mirror are not read from the gantry.
+        """
+        if self.has_state_endpoint is not False:
+            start = time.time()
+            served, response = self._optional_get("/state")
+            timestamp = (start + time.time()) / 2
+            if served is not None:
+                self.has_state_endpoint = served
+            if served:
+                return GantryState(
+                    tuple(map(float, response["position"])),
+                    tuple(map(float, response["next_waypoint"])),
+                    tuple(map(float, response["previous_waypoint"])),
+                    timestamp,
+                    0.0,
+                )
+
+        if self._read_executor is None:
+            self._read_executor = ThreadPoolExecutor(
+                max_workers=self.pool_maxsize, thread_name_prefix="gantry-read"
+            )
+
+        values = {}
+        endpoints = dict(STATE_ENDPOINTS)
+        for name, offset in [("next_waypoint", 1), ("previous_waypoint", -1)]:
+            waypoint = self._mirrored_waypoint(offset)
+            if waypoint is not None:
+                values[name] = waypoint
+                del endpoints[name]
+
+        futures = {
+            name: [self._read_executor.submit(self._timed_get, e) for e in axis_endpoints]
+            for name, axis_endpoints in endpoints.items()
+        }
+        times = []
+        for name, axis_futures in futures.items():
+            # A failed read raises its GantryError here
+            (value_0, time_0), (value_1, time_1) = [f.result() for f in axis_futures]
+            try:
+                values[name] = (float(value_0), float(value_1))
+            except (TypeError, ValueError) as e:
+                raise GantryResponseError(self.name, name, "expected numbers") from e
+            times += [time_0, time_1]
+
+        return GantryState(
+            values["position"],
+            values["next_waypoint"],
+            values["previous_waypoint"],
+            sum(times) / len(times),
+            max(times) - min(times),
+        )
@@ -1,34 +1,116 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition
 from zeroconf import ServiceBrowser, Zeroconf
 
 
 class GantryListener:
-    def __init__(self):
+    """Live registry of the gantries announced over mDNS.
+
+    Browser callbacks only queue work: service info is resolved on a small
+    thread pool, so a burst of announcements never stalls the zeroconf thread.
+    `gantry_data` holds {name: {"addresses", "port"}} for every gantry
+    currently on the network. Callbacks registered with `on_change()` are
+    called as `callback(event, gantry_name, data)` with event "added",
+    "updated" (address or port changed) or "removed".
+    """
+
+    def __init__(self, resolve_workers: int = 4):
         self.gantry_data = {}
+        # Notified whenever a gantry is added, moves or goes away
+        self.changed = Condition()
 
-    def remove_service(self, zeroconf, type, name):
-        pass  # We don't need to handle this event
+        self._callbacks = []
+        # mDNS service name -> gantry name, and a counter per service so a late
+        # resolution can't undo a removal that came after it
+        self._services = {}
+        self._generations = {}
+        self._resolver = ThreadPoolExecutor(
+            max_workers=resolve_workers, thread_name_prefix="gantry-resolve"
+        )
+
+    def on_change(self, callback) -> None:
+        self._callbacks.append(callback)
+
+    def _notify(self, event: str, gantry_name: str, data: dict) -> None:
+        for callback in self._callbacks:
+            try:
+                callback(event, gantry_name, data)
+            except Exception as e:
+                print(f"Gantry registry callback failed: {e}")
 
     def add_service(self, zeroconf, type, name):
+        self._schedule(zeroconf, type, name)
+
+    def update_service(self, zeroconf, type, name):
+        self._schedule(zeroconf, type, name)
+
+    def remove_service(self, zeroconf, type, name):
+        with self.changed:
+            self._generations[name] = self._generations.get(name, 0) + 1
+            gantry_name = self._services.pop(name, None)
+            data = self.gantry_data.pop(gantry_name, None)
+            self.changed.notify_all()
+
+        if data is not None:
+            print(f"Gantry {gantry_name} went away")
+            self._notify("removed", gantry_name, data)
+
+    def _schedule(self, zeroconf, type, name):
+        # Check if the hostname matches our criteria
+        if "gantry" not in name.lower():
+            return
+        with self.changed:
+            generation = self._generations.get(name, 0) + 1
+            self._generations[name] = generation
+        try:
+            self._resolver.submit(self._resolve, zeroconf, type, name, generation)
+        except RuntimeError:
+            pass  # Shut down
+
+    def _resolve(self, zeroconf, type, name, generation):
         info = zeroconf.get_service_info(type, name)
-        if info:
-            # Check if the hostname matches our criteria
-            if "gantry" in name.lower():
-                # print(f"Found service {name} at {info.server}")
-                print(f"Found service")
-
-                # Get txt stored at key "gantry"
-                gantry_name = info.properties.get(b"gantry").decode("utf-8")
-                addresses = [".".join(map(str, bytes(addr))) for addr in info.addresses]
-
-                if gantry_name not in self.gantry_data:
-                    self.gantry_data[gantry_name] = {
-                        "addresses": addresses[0],
-                        "port": info.port,
-                    }
-
-                print(f"Gantry name: {gantry_name}")
-                print(f"Info: {self.gantry_data[gantry_name]}")
+        if not info or not info.addresses:
+            return
+
+        # Get txt stored at key "gantry"
+        gantry_name = (info.properties.get(b"gantry") or b"").decode("utf-8")
+        if not gantry_name:
+            return
+        addresses = [".".join(map(str, bytes(addr))) for addr in info.addresses]
+        data = {"addresses": addresses[0], "port": info.port}
+
+        with self.changed:
+            if self._generations.get(name) != generation:
+                return  # Superseded by a newer update or a removal
+            previous = self.gantry_data.get(gantry_name)
+            self._services[name] = gantry_name
+            self.gantry_data[gantry_name] = data
+            self.changed.notify_all()
+
+        if previous is None:
+            print(f"Found gantry {gantry_name} at {data['addresses']}:{data['port']}")
+            self._notify("added", gantry_name, dict(data))
+        elif previous != data:
+            self._notify("updated", gantry_name, dict(data))
+
+    def close(self) -> None:
+        self._resolver.shutdown(wait=False, cancel_futures=True)
+
+    def wait_for(self, count: int = None, names=None, timeout: float = None) -> bool:
+        """Wait until `count` gantries, or all of `names`, have been found.
+
+        With neither given, waits for the first gantry. Returns False if
+        `timeout` seconds pass first.
+        """
+        names = set(names or ())
+        count = count if count is not None else (0 if names else 1)
+
+        def found():
+            return len(self.gantry_data) >= count and names <= self.gantry_data.keys()
+
+        with self.changed:
+            return self.changed.wait_for(found, timeout)
 
     # def __len__(self):
     #     return len(self.gantry_data)
@@ -0,0 +1,97 @@
+import asyncio
+import ipaddress
+import time
+
+import aiohttp
+
+
+class GantryScanner:
+    """Finds gantries by probing every address in a subnet over HTTP.
+
+    A fallback for networks that filter multicast, where GantryListener never
+    hears an announcement. Each host is asked for /trajectory_length, which
+    every firmware serves and answers with a bare integer; anything else on
+    the port is ignored. At most `concurrency` probes are in flight, and each
+    gives up after `timeout` seconds, so a /24 takes about
+    254 / concurrency * timeout in the worst case.
+
+    Gantries are named by their /name endpoint where the firmware has one,
+    and "<address>:<port>" otherwise. Results go into `gantry_data` in the
+    same {name: {"addresses", "port"}} shape as GantryListener.gantry_data,
+    and callbacks registered with `on_change()` get ("added", name, data),
+    so FleetBringUp.on_change can be subscribed to either.
+    """
+
+    def __init__(self, concurrency: int = 256, timeout: float = 0.5):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.gantry_data = {}
+        self._callbacks = []
+
+    def on_change(self, callback) -> None:
+        self._callbacks.append(callback)
+
+    def _notify(self, event: str, gantry_name: str, data: dict) -> None:
+        for callback in self._callbacks:
+            try:
+                callback(event, gantry_name, data)
+            except Exception as e:
+                print(f"Gantry scan callback failed: {e}")
+
+    @staticmethod
+    def hosts(network: str) -> list:
+        """Addresses to probe in `network`, e.g. "192.168.0.0/24" or a single address."""
+        network = ipaddress.ip_network(network, strict=False)
+        hosts = list(network.hosts())
+        return [str(host) for host in hosts or [network.network_address]]
+
+    async def _get(self, session, url: str):
+        async with session.get(url) as response:
+            if response.status != 200:
+                return None
+            return (await response.text()).strip()
+
+    async def _probe(self, session, semaphore, ip: str, port: int):
+        async with semaphore:
+            url = f"http://{ip}:{port}"
+            try:
+                length = await self._get(session, f"{url}/trajectory_length")
+                if length is None or not length.lstrip("-").isdigit():
+                    return None
+                try:
+                    name = await self._get(session, f"{url}/name")
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    name = None
+            except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError):
+                return None
+
+        gantry_name = name or f"{ip}:{port}"
+        data = {"addresses": ip, "port": port}
+        if self.gantry_data.get(gantry_name) != data:
+            self.gantry_data[gantry_name] = data
+            print(f"Found gantry {gantry_name} at {ip}:{port}")
+            self._notify("added", gantry_name, dict(data))
+        return gantry_name
+
+    async def scan_async(self, networks, ports=(8080,)) -> dict:
+        """Probe every host in `networks` on every port in `ports`."""
+        if isinstance(networks, str):
+            networks = [networks]
+        targets = [(ip, port) for network in networks for ip in self.hosts(network) for port in ports]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        # No keep-alive: every host is asked once or twice and never again
+        connector = aiohttp.TCPConnector(limit=self.concurrency, force_close=True)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            await asyncio.gather(
+                *(self._probe(session, semaphore, ip, port) for ip, port in targets)
+            )
+        return dict(self.gantry_data)
+
+    def scan(self, networks, ports=(8080,)) -> dict:
+        """Blocking scan_async(), for callers without an event loop."""
+        start = time.monotonic()
+        found = asyncio.run(self.scan_async(networks, ports))
+        print(f"Scanned {networks} in {time.monotonic() - start:.2f} s, found {len(found)} gantries")
+        return found
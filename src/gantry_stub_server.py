@@ -0,0 +1,430 @@
+import argparse
+import json
+import random
+import socket
+import time
+import zlib
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, RLock, Thread
+
+PID_ENDPOINTS = [
+    f"/ch{channel}/{loop}/{term}"
+    for channel in (0, 1)
+    for loop in ("position", "velocity")
+    for term in ("p", "i", "d", "lpf")
+]
+
+
+class StandInGantry:
+    """State of one simulated gantry, with the same endpoints as the ESP32 firmware.
+
+    Position only changes when a test sets it; see gantry_emulator for a model
+    that actually moves. Given a `name`, it is served at /name the way newer
+    firmware identifies itself without mDNS.
+
+    Its clock runs `clock_offset` seconds ahead of time.monotonic() and gains
+    `clock_drift` seconds per second, like an ESP32's free-running timer.
+    """
+
+    def __init__(self, name: str = None, clock_offset: float = 0.0, clock_drift: float = 0.0):
+        self.name = name
+        self.clock_offset = clock_offset
+        self.clock_drift = clock_drift
+        self.lock = RLock()
+        self.mode = 0
+        self.target_speed = 0.0
+        self.target_waypoint = 0
+        self.speed_multiplier = [1.0, 1.0]
+        self.pid = {endpoint: 0.0 for endpoint in PID_ENDPOINTS}
+        self.position = [0.0, 0.0]
+
+        # Saved trajectory, and waypoints added since the last save
+        self.trajectory = []
+        self._recording = []
+
+        # Bulk upload in progress: id, expected length, and waypoints so far
+        self._upload = None
+
+        # Pending scheduled start, bumped generation cancels it, and the last
+        # time the target changed, on the gantry clock and on time.monotonic()
+        self.scheduled = None
+        self._schedule_generation = 0
+        self.started = None
+
+    def clock(self) -> float:
+        return self.clock_offset + time.monotonic() * (1 + self.clock_drift)
+
+    def schedule_start(self, data: dict):
+        """Return (status, body) for POST /scheduled_start, and arm the start."""
+        try:
+            waypoint, at = int(data["waypoint"]), float(data["time"])
+        except (KeyError, TypeError, ValueError):
+            return 400, "Expected waypoint and time"
+        with self.lock:
+            self._schedule_generation += 1
+            self.scheduled = {"waypoint": waypoint, "time": at}
+            generation = self._schedule_generation
+        Thread(target=self._start_at, args=(generation, waypoint, at), daemon=True).start()
+        return 200, "OK"
+
+    def _start_at(self, generation: int, waypoint: int, at: float) -> None:
+        deadline = (at - self.clock_offset) / (1 + self.clock_drift)
+        # Not spinning: with several stand-ins in one process a busy loop holds
+        # the GIL and makes the others fire late
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        with self.lock:
+            if generation == self._schedule_generation:
+                self.post("/target_waypoint", {"value": waypoint})
+
+    def get_scheduled_start(self) -> dict:
+        """Body of GET /scheduled_start."""
+        with self.lock:
+            started = None
+            if self.started is not None:
+                started = {"waypoint": self.started["waypoint"], "time": self.started["time"]}
+            return {"pending": self.scheduled, "started": started}
+
+    def set_position(self, q0: float, q1: float) -> None:
+        with self.lock:
+            self.position = [q0, q1]
+
+    def _waypoint(self, index: int) -> list:
+        index = max(0, min(index, len(self.trajectory) - 1))
+        return self.trajectory[index]
+
+    def get(self, path: str):
+        """Return (status, body) for a GET; dict bodies are sent as JSON."""
+        with self.lock:
+            if path == "/session":
+                return 200, {"status": "success"}
+            if path == "/name" and self.name is not None:
+                return 200, self.name
+            if path.startswith("/position/q"):
+                return 200, str(self.position[int(path[-1])])
+            if path.startswith(("/next_waypoint/q", "/previous_waypoint/q")):
+                if not self.trajectory:
+                    return 404, "No trajectory"
+                offset = 1 if path.startswith("/next") else -1
+                return 200, str(self._waypoint(self.target_waypoint + offset)[int(path[-1])])
+            if path == "/add_waypoint":
+                self._recording.append(list(self.position))
+                return 200, "OK"
+            if path == "/save_trajectory":
+                self.trajectory, self._recording = self._recording, []
+                return 200, "OK"
+            if path == "/trajectory_length":
+                return 200, str(len(self.trajectory))
+            if path == "/target_waypoint":
+                return 200, str(self.target_waypoint)
+            if path == "/mode":
+                return 200, str(self.mode)
+            if path == "/target_speed":
+                return 200, str(self.target_speed)
+            if path.startswith("/speed_multiplier/q"):
+                return 200, str(self.speed_multiplier[int(path[-1])])
+            if path in self.pid:
+                return 200, str(self.pid[path])
+        return 404, "Not found"
+
+    def get_state(self) -> dict:
+        """Body of the combined /state endpoint."""
+        with self.lock:
+            if not self.trajectory:
+                waypoints = [list(self.position)] * 2
+            else:
+                waypoints = [
+                    self._waypoint(self.target_waypoint + 1),
+                    self._waypoint(self.target_waypoint - 1),
+                ]
+            return {
+                "position": list(self.position),
+                "next_waypoint": waypoints[0],
+                "previous_waypoint": waypoints[1],
+            }
+
+    def get_trajectory(self) -> dict:
+        """Body of the whole-trajectory /trajectory endpoint."""
+        with self.lock:
+            return {
+                "q0": [waypoint[0] for waypoint in self.trajectory],
+                "q1": [waypoint[1] for waypoint in self.trajectory],
+            }
+
+    def upload(self, path: str, data: dict, max_chunk: int = 1024):
+        """Return (status, body) for the /trajectory/upload/* endpoints."""
+        with self.lock:
+            upload = self._upload
+            current = upload is not None and upload["id"] == data.get("upload_id")
+
+            if path == "/trajectory/upload/begin":
+                if not current:
+                    upload = self._upload = {
+                        "id": data.get("upload_id"),
+                        "length": int(data.get("length", 0)),
+                        "waypoints": [],
+                    }
+                return 200, {"received": len(upload["waypoints"])}
+
+            if not current:
+                return 404, "No such upload"
+            received = len(upload["waypoints"])
+
+            if path == "/trajectory/upload/chunk":
+                q0, q1 = data.get("q0", []), data.get("q1", [])
+                if len(q0) != len(q1) or len(q0) > max_chunk:
+                    return 413, "Bad chunk"
+                if data.get("offset") != received or received + len(q0) > upload["length"]:
+                    return 409, f"Expected offset {received}"
+                upload["waypoints"].extend([a, b] for a, b in zip(q0, q1))
+                return 200, {"received": len(upload["waypoints"])}
+
+            if path == "/trajectory/upload/commit":
+                waypoints = upload["waypoints"]
+                stored_q0 = array("f", [waypoint[0] for waypoint in waypoints])
+                stored_q1 = array("f", [waypoint[1] for waypoint in waypoints])
+                checksum = zlib.crc32(stored_q1.tobytes(), zlib.crc32(stored_q0.tobytes()))
+                self._upload = None
+                if received != upload["length"] or checksum != data.get("checksum"):
+                    # Start over rather than keep data we can't trust
+                    return 409, "Checksum mismatch"
+                self.trajectory = [list(waypoint) for waypoint in waypoints]
+                self.target_waypoint = 0
+                return 200, {"length": len(self.trajectory)}
+
+        return 404, "Not found"
+
+    def post(self, path: str, data: dict):
+        """Return (status, body) for a POST."""
+        value = data.get("value")
+        with self.lock:
+            if path == "/session":
+                return 200, {"status": "success"}
+            if path == "/mode":
+                self.mode = int(value)
+            elif path == "/target_speed":
+                self.target_speed = float(value)
+            elif path == "/target_waypoint":
+                self.target_waypoint = int(value)
+                # A direct command overrides any scheduled start
+                self._schedule_generation += 1
+                self.scheduled = None
+                self.started = {
+                    "waypoint": self.target_waypoint,
+                    "time": self.clock(),
+                    "local_time": time.monotonic(),
+                }
+            elif path.startswith("/speed_multiplier/q"):
+                self.speed_multiplier[int(path[-1])] = float(value)
+            elif path in self.pid:
+                self.pid[path] = float(value)
+            else:
+                return 404, "Not found"
+        return 200, "OK"
+
+
+class _GantryStubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; don't let Nagle hold the body
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+    def setup(self):
+        super().setup()
+        server = self.server
+        with server.connections_lock:
+            # Like the ESP32's httpd, refuse sockets beyond the limit
+            self.rejected = (
+                server.max_connections is not None
+                and len(server.connections) >= server.max_connections
+            )
+            if not self.rejected:
+                server.connections.add(self.connection)
+
+    def handle(self):
+        if not self.rejected:
+            try:
+                super().handle()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client gave up waiting, as it should on a hung gantry
+
+    def finish(self):
+        super().finish()
+        with self.server.connections_lock:
+            self.server.connections.discard(self.connection)
+
+    def _delay(self):
+        # A hung gantry accepts the request and then never answers, until resumed
+        self.server.responsive.wait()
+        # Half on the way in and half on the way out, drawn separately, so the
+        # two directions differ the way they do on a real network
+        server = self.server
+        delay = (server.latency + random.uniform(-server.jitter, server.jitter)) / 2
+        if delay > 0:
+            time.sleep(delay)
+
+    def _reply(self, status, body):
+        if isinstance(body, dict):
+            payload, content_type = json.dumps(body).encode("utf-8"), "application/json"
+        else:
+            payload, content_type = body.encode("utf-8"), "text/plain"
+
+        self._delay()
+        self.send_response(status)
+        self.send_header("content-type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        self._delay()
+        if self.path == "/session" and server.scheduled_start_endpoint:
+            # Firmware that can schedule starts reports its clock on every heartbeat
+            self._reply(200, {"status": "success", "time": server.gantry.clock()})
+        elif self.path == "/scheduled_start" and server.scheduled_start_endpoint:
+            self._reply(200, server.gantry.get_scheduled_start())
+        elif self.path == "/state" and server.state_endpoint:
+            self._reply(200, server.gantry.get_state())
+        elif self.path == "/trajectory" and server.trajectory_endpoint:
+            self._reply(200, server.gantry.get_trajectory())
+        else:
+            self._reply(*server.gantry.get(self.path))
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        self._delay()
+        if self.path != "/session" and random.random() < server.failure_rate:
+            self._reply(503, "Busy")
+        elif self.path == "/scheduled_start" and server.scheduled_start_endpoint:
+            self._reply(*server.gantry.schedule_start(data))
+        elif self.path.startswith("/trajectory/upload/") and server.upload_endpoint:
+            self._reply(*server.gantry.upload(self.path, data))
+        else:
+            self._reply(*server.gantry.post(self.path, data))
+
+
+class GantryStubServer:
+    """In-process stand-in for the ESP32 web server.
+
+    Serves every endpoint GantryInterface uses, backed by a StandInGantry (or
+    any object with the same get/post methods). `latency` and `jitter` add a
+    per-request delay in seconds, and `max_connections` caps open sockets the
+    way the firmware does. The optional /state, /trajectory, bulk upload and
+    scheduled start endpoints are off by default, as on current firmware.
+    `failure_rate` makes that fraction of POSTs other than /session fail with
+    503, to exercise retries, and `hang()` stops it answering at all until
+    `resume()`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        gantry=None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        max_connections: int = None,
+        state_endpoint: bool = False,
+        trajectory_endpoint: bool = False,
+        upload_endpoint: bool = False,
+        scheduled_start_endpoint: bool = False,
+        failure_rate: float = 0.0,
+    ):
+        self.gantry = gantry if gantry is not None else StandInGantry()
+
+        self._server = ThreadingHTTPServer((host, port), _GantryStubHandler)
+        self._server.daemon_threads = True
+        self._server.gantry = self.gantry
+        self._server.latency = latency
+        self._server.jitter = jitter
+        self._server.max_connections = max_connections
+        self._server.state_endpoint = state_endpoint
+        self._server.trajectory_endpoint = trajectory_endpoint
+        self._server.upload_endpoint = upload_endpoint
+        self._server.scheduled_start_endpoint = scheduled_start_endpoint
+        self._server.failure_rate = failure_rate
+        self._server.connections = set()
+        self._server.responsive = Event()
+        self._server.responsive.set()
+        self._server.connections_lock = Lock()
+        self._thread = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def hang(self) -> None:
+        """Stop answering, while still accepting connections, like a wedged ESP32."""
+        self._server.responsive.clear()
+
+    def resume(self) -> None:
+        self._server.responsive.set()
+
+    def start(self) -> None:
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self.resume()
+        self._server.shutdown()
+        self._server.server_close()
+        # Kept-alive connections outlive the listening socket, close them too
+        with self._server.connections_lock:
+            connections = list(self._server.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stand-in gantry web server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--name", default=None, help="Serve this gantry name at /name")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--max-connections", type=int, default=None)
+    parser.add_argument("--state-endpoint", action="store_true")
+    parser.add_argument("--trajectory-endpoint", action="store_true")
+    parser.add_argument("--upload-endpoint", action="store_true")
+    parser.add_argument("--scheduled-start-endpoint", action="store_true")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = GantryStubServer(
+        args.host,
+        args.port,
+        gantry=StandInGantry(args.name),
+        latency=args.latency,
+        jitter=args.jitter,
+        max_connections=args.max_connections,
+        state_endpoint=args.state_endpoint,
+        trajectory_endpoint=args.trajectory_endpoint,
+        upload_endpoint=args.upload_endpoint,
+        scheduled_start_endpoint=args.scheduled_start_endpoint,
+        failure_rate=args.failure_rate,
+    )
+    print(f"Stand-in gantry listening on {server.address[0]}:{server.address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ from prompt_toolkit.styles import Style
 from prompt_toolkit import print_formatted_text
 
 from gantry_interface import GantryInterface
+from request_stats import REQUEST_STATS
+from trajectory_file import load_trajectories, save_trajectories
 
 gantry = GantryInterface()
 
@@ -32,6 +34,21 @@ commands = {
         "help": "<b>connect</b> [ip] [port]\n\tConnects to the gantry at [ip]:[port]",
         "function": lambda args: gantry.connect(args[0], int(args[1])),
     },
+    "stats": {
+        "description": "<b>stats</b> [json [path] | reset]",
+        "help": "<b>stats</b> [json [path] | reset]\n\tPrints request latency percentiles per endpoint, dumps them to a JSON file at [path] (default request_stats.json), or clears them",
+        "function": lambda args: print_stats(*args),
+    },
+    "export_trajectory": {
+        "description": "<b>export_trajectory</b> [path]",
+        "help": "<b>export_trajectory</b> [path]\n\tSaves the gantry's trajectory to a binary trajectory file at [path]",
+        "function": lambda args: export_trajectory(*args),
+    },
+    "upload_trajectory": {
+        "description": "<b>upload_trajectory</b> [path]",
+        "help": "<b>upload_trajectory</b> [path]\n\tReplaces the gantry's trajectory with the one in the binary trajectory file at [path]",
+        "function": lambda args: upload_trajectory(*args),
+    },
     "help": {
         "description": "<b>help</b> [command]",
         "help": "<b>help</b> [command]\n\tPrints the help message for [command]",
@@ -142,6 +159,105 @@ def set_waypoint(waypoint: str) -> bool:
         return True
 
 
+def print_stats(action: str = None, path: str = None) -> bool:
+    """
+    Prints the request latency percentiles recorded for each endpoint.
+
+    Args:
+        action (str): None to print, "json" to dump to [path], "reset" to clear.
+        path (str): Output file for "json", request_stats.json by default.
+
+    Returns:
+        bool: Always True.
+    """
+    if action not in (None, "json", "reset") or (path is not None and action != "json"):
+        print_formatted_text(HTML("<red>Usage: stats [json [path] | reset]</red>"))
+        return True
+
+    if action == "reset":
+        REQUEST_STATS.reset()
+        print_formatted_text(HTML("<green>Request stats cleared</green>"))
+        return True
+
+    if action == "json":
+        path = path or "request_stats.json"
+        REQUEST_STATS.dump_json(path)
+        print_formatted_text(HTML(f"<green>Request stats written to {path}</green>"))
+        return True
+
+    rows = REQUEST_STATS.summary()
+    if not rows:
+        print_formatted_text(HTML("<red>No requests recorded yet.</red>"))
+        return True
+
+    print(
+        f"{'gantry':<16} {'method':<6} {'endpoint':<26} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'max ms':>8} {'fail':>5}"
+    )
+    for row in rows:
+        print(
+            f"{str(row['gantry']):<16} {row['method']:<6} {row['endpoint']:<26} {row['count']:>7} "
+            f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+            f"{row['max_ms']:>8.2f} {row['failures']:>5}"
+        )
+    return True
+
+
+def export_trajectory(path: str = "trajectory.gtrj") -> bool:
+    """
+    Saves the gantry's trajectory to a binary trajectory file.
+
+    Args:
+        path (str): Output file.
+
+    Returns:
+        bool: Always True.
+    """
+    if not gantry.trajectory.valid and not gantry.load_trajectory():
+        print_formatted_text(HTML("<red>Trajectory is not known locally.</red>"))
+        return True
+
+    name = gantry.name or "gantry"
+    save_trajectories(path, {name: (gantry.trajectory.q0, gantry.trajectory.q1)})
+    print_formatted_text(
+        HTML(f"<green>{len(gantry.trajectory)} waypoints written to {path}</green>")
+    )
+    return True
+
+
+def upload_trajectory(path: str = "trajectory.gtrj") -> bool:
+    """
+    Uploads a trajectory from a binary trajectory file to the gantry.
+
+    Uses the entry named after the gantry, or the only entry in the file.
+
+    Args:
+        path (str): Trajectory file.
+
+    Returns:
+        bool: Always True.
+    """
+    try:
+        trajectories = load_trajectories(path)
+    except (OSError, ValueError) as e:
+        print_formatted_text(HTML(f"<red>Could not read {path}: {e}</red>"))
+        return True
+
+    if gantry.name in trajectories:
+        q0, q1 = trajectories[gantry.name]
+    elif len(trajectories) == 1:
+        q0, q1 = next(iter(trajectories.values()))
+    else:
+        print_formatted_text(HTML(f"<red>No trajectory for this gantry in {path}.</red>"))
+        return True
+
+    if gantry.upload_trajectory(q0, q1):
+        print_formatted_text(HTML(f"<green>{len(q0)} waypoints uploaded</green>"))
+    else:
+        print_formatted_text(HTML("<red>Trajectory upload failed.</red>"))
+    return True
+
+
 def execute_command(command: str, args: List[str]) -> Optional[bool]:
     """
     Executes the given command with the provided arguments.
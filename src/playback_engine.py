@@ -0,0 +1,245 @@
+import math
+import time
+
+from trajectory_planner import MultiplierPlan, segment_multipliers
+
+
+class PlaybackReport:
+    """Timing of a continuous playback run, in seconds from the start of the run."""
+
+    def __init__(self):
+        self.segments = []
+        self.started = None
+        self.finished = None
+
+    @property
+    def cycle_time(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+    @property
+    def total_idle(self) -> float:
+        return sum(segment["idle"] for segment in self.segments)
+
+    def __repr__(self):
+        return (
+            f"PlaybackReport(segments={len(self.segments)}, "
+            f"cycle_time={self.cycle_time:.3f}s, total_idle={self.total_idle * 1000:.1f}ms)"
+        )
+
+
+class PlaybackEngine:
+    """Plays a whole trajectory on a fleet without stopping between waypoints.
+
+    While the gantries are moving towards waypoint i, the engine already knows
+    waypoint i + 1 and the multipliers for that segment. It polls position, and
+    once every gantry is predicted to arrive within `lead_time` (or is within
+    `approach_distance` of its target) it sends the next multipliers and target.
+    The command therefore lands as the current segment completes instead of a
+    full read/compute/write cycle after it. By default the lead time is how long
+    the previous fleet command took to go out and come back.
+
+    Multipliers come from `plan` if given (e.g. a retimed plan that also sets a
+    target speed per segment), otherwise from a MultiplierPlan of the fleet's
+    trajectory mirrors, and failing that from the waypoints as they are read.
+    """
+
+    def __init__(
+        self,
+        fleet,
+        approach_distance: float = 0.1,
+        lead_time: float = None,
+        poll_interval: float = 0.002,
+        segment_timeout: float = 30.0,
+        plan: MultiplierPlan = None,
+    ):
+        self.fleet = fleet
+        self.plan = plan
+        self.approach_distance = approach_distance
+        self.lead_time = lead_time
+        self.poll_interval = poll_interval
+        self.segment_timeout = segment_timeout
+
+        self._command_time = 0.02
+
+    def _read_positions(self) -> dict:
+        """{name: (timestamp, q0, q1)} for every gantry.
+
+        Gantries sampling in the background are read from their latest sample
+        while it is at most two sample periods old, the rest over the network.
+        """
+        positions, stale = {}, {}
+        for name, interface in self.fleet.interfaces.items():
+            rate = getattr(interface, "sample_rate", 0.0)
+            sample = interface.positions.latest(2.0 / rate) if rate > 0 else None
+            if sample is None:
+                stale[name] = ()
+            else:
+                positions[name] = (float(sample[0]), float(sample[1]), float(sample[2]))
+
+        if stale:
+            result = self.fleet.broadcast_each("get_position", stale)
+            if not result.ok:
+                raise RuntimeError(f"Failed to read gantry positions: {result.errors}")
+            now = time.time()
+            positions.update({name: (now, *position) for name, position in result.results.items()})
+        return positions
+
+    def _settled_positions(self) -> dict:
+        """Wait until every gantry has stopped moving and return where they are."""
+        previous = self._read_positions()
+        while True:
+            time.sleep(self.poll_interval * 5)
+            current = self._read_positions()
+            if all(
+                max(abs(current[name][axis] - previous[name][axis]) for axis in (1, 2))
+                <= self.approach_distance / 10
+                for name in current
+            ):
+                return {name: sample[1:] for name, sample in current.items()}
+            previous = current
+
+    def _waypoint(self, interface, index: int, offset: int) -> tuple[float, float]:
+        """Waypoint `index`, from the local mirror or relative to the gantry's target."""
+        waypoint = interface.trajectory.lookup(index)
+        if waypoint is not None:
+            return waypoint
+        return interface.get_next_waypoint() if offset > 0 else interface.get_previous_waypoint()
+
+    def _time_left(self, position, velocity, target) -> float:
+        """Predicted seconds until a gantry reaches `target` at its current speed."""
+        time_left = 0.0
+        for axis in (0, 1):
+            remaining = abs(target[axis] - position[axis])
+            if remaining <= self.approach_distance:
+                continue
+            speed = abs(velocity[axis])
+            time_left = max(time_left, remaining / speed if speed > 0 else math.inf)
+        return time_left
+
+    def _send_segment(self, index: int, multipliers: dict, speeds: dict = None) -> float:
+        start = time.perf_counter()
+        if speeds is not None:
+            self.fleet.broadcast_each("set_target_speed", speeds)
+        self.fleet.broadcast_each("set_speed_multipler", multipliers)
+        self.fleet.set_target_waypoint(index)
+        self._command_time = time.perf_counter() - start
+        return time.monotonic()
+
+    def run(self, trajectory_length: int, start: int = 0, end: int = None) -> PlaybackReport:
+        """Play waypoints `start`..`end` (inclusive, default to the last) and report timing."""
+        end = trajectory_length - 1 if end is None else end
+        step = 1 if end >= start else -1
+        interfaces = self.fleet.interfaces
+        report = PlaybackReport()
+
+        for interface in interfaces.values():
+            if not interface.trajectory.valid:
+                interface.load_trajectory()
+        plan = self.plan if self.plan is not None else MultiplierPlan.from_fleet(self.fleet)
+        targets = {
+            name: interface.trajectory.lookup(start) for name, interface in interfaces.items()
+        }
+
+        # Start from wherever the gantries are resting, with multipliers for that
+        # move and the plan's speed rather than whatever the last move left set
+        positions = self._read_positions()
+        multipliers = {
+            name: segment_multipliers(positions[name][1:], target)
+            for name, target in targets.items()
+            if target is not None
+        }
+        speeds = None
+        if plan is not None and end != start:
+            speeds = plan.fleet_target_speeds(start, start + step)
+        self._send_segment(start, multipliers, speeds)
+        if None in targets.values():
+            targets.update(
+                {
+                    name: position
+                    for name, position in self._settled_positions().items()
+                    if targets[name] is None
+                }
+            )
+
+        t0 = time.monotonic()
+        report.started = 0.0
+        previous_arrival = 0.0
+        for index in range(start + step, end + step, step):
+            # Work out the next segment while the current one is still moving
+            next_targets = {
+                name: self._waypoint(interface, index, step)
+                for name, interface in interfaces.items()
+            }
+            speeds = None
+            if plan is not None:
+                multipliers = plan.fleet_segment(index - step, index)
+                speeds = plan.fleet_target_speeds(index - step, index)
+            else:
+                multipliers = {
+                    name: segment_multipliers(targets[name], next_targets[name])
+                    for name in interfaces
+                }
+            lead_time = self.lead_time if self.lead_time is not None else self._command_time
+
+            # Wait until every gantry is about to reach its current target
+            positions = self._read_positions()
+            velocities = {name: (0.0, 0.0) for name in interfaces}
+            deadline = time.monotonic() + self.segment_timeout
+            arrival = None
+            while True:
+                time.sleep(self.poll_interval)
+                new_positions = self._read_positions()
+                now = time.monotonic()
+                wall_now = time.time()
+                time_left, arrived = 0.0, True
+                for name in interfaces:
+                    timestamp, *position = new_positions[name]
+                    # A background sample may not have changed since the last poll
+                    dt = timestamp - positions[name][0]
+                    if dt > 0:
+                        velocities[name] = [
+                            (position[axis] - positions[name][axis + 1]) / dt for axis in (0, 1)
+                        ]
+                    left = self._time_left(position, velocities[name], targets[name])
+                    arrived = arrived and left == 0.0
+                    # Allow for how long ago the position was taken
+                    time_left = max(time_left, left - (wall_now - timestamp))
+                positions = new_positions
+
+                if arrived and arrival is None:
+                    arrival = now - t0
+                if time_left <= lead_time:
+                    break
+                if now > deadline:
+                    raise TimeoutError(f"Gantries did not reach waypoint {index - step}")
+
+            commanded = self._send_segment(index, multipliers, speeds) - t0
+            if arrival is None:
+                # Advanced before reaching the approach distance
+                arrival = commanded
+            report.segments.append(
+                {
+                    "waypoint": index,
+                    "commanded": commanded,
+                    "previous_arrival": arrival,
+                    "idle": max(0.0, commanded - max(arrival, previous_arrival)),
+                }
+            )
+            previous_arrival = arrival
+            targets = next_targets
+
+        # Let the last segment finish
+        deadline = time.monotonic() + self.segment_timeout
+        while time.monotonic() < deadline:
+            positions = self._read_positions()
+            if all(
+                self._time_left(positions[name][1:], (0.0, 0.0), targets[name]) == 0.0
+                for name in interfaces
+            ):
+                break
+            time.sleep(self.poll_interval)
+        report.finished = time.monotonic() - t0
+
+        return report
@@ -1,12 +1,28 @@
-from gantry_interface import GantryInterface
-from gantry_listener import GantryListener
-from zeroconf import ServiceBrowser, Zeroconf
+from gantry_discovery import GantryDiscovery
+from gantry_scan import GantryScanner
+from fleet_bringup import FleetBringUp
+from gantry_fleet import GantryFleet
+from playback_engine import PlaybackEngine
+from trajectory_planner import MultiplierPlan, segment_multipliers
+from trajectory_file import fleet_trajectories, save_trajectories
+from telemetry import TelemetryRecorder
+import os
 import time
 import sys
 import tty
 import termios
 
 cur_waypoint = 0
+fleet = None
+# Multipliers for every segment of the loaded trajectory, if it is known locally
+plan = None
+# Where saved trajectories are also written as files, None to skip
+trajectory_dir = "."
+# Where playback telemetry is recorded, None to skip, and how often gantries are sampled
+telemetry_dir = None
+telemetry_rate = 100.0
+# Recorder of the playback session in progress, kept across steps
+recorder = None
 
 
 def getch():
@@ -26,7 +42,43 @@ def getch():
     return ch
 
 
+def start_telemetry():
+    """Record every gantry's telemetry, with the trajectory played, unless already recording."""
+    global recorder
+    if telemetry_dir is None or recorder is not None:
+        return
+    # Never reuse a name, another session may have started within the same second
+    stamp = time.strftime("playback_%Y%m%d_%H%M%S")
+    base = os.path.join(telemetry_dir, stamp)
+    count = 1
+    while os.path.exists(base + ".gtlm") or os.path.exists(base + ".gtrj"):
+        count += 1
+        base = os.path.join(telemetry_dir, f"{stamp}_{count}")
+    try:
+        save_trajectories(base + ".gtrj", fleet_trajectories(fleet))
+    except RuntimeError as e:
+        print(f"Played trajectory not written to a file: {e}")
+    recorder = TelemetryRecorder(base + ".gtlm")
+    fleet.start_sampling(telemetry_rate, recorder)
+    print(f"Recording telemetry to {recorder.path}")
+
+
+def stop_telemetry():
+    global recorder
+    if recorder is None:
+        return
+    fleet.stop_sampling()
+    recorder.close()
+    print(
+        f"Telemetry written to {recorder.path}: "
+        f"{recorder.rows_written} samples, {recorder.dropped} dropped"
+    )
+    recorder = None
+
+
 def record_trajectory(gantry_data: dict):
+    global plan
+
     # Print in green, entering record mode
     print("\033[92mEntering record mode\033[0m")
     print("Press space to record waypoint")
@@ -34,8 +86,7 @@ def record_trajectory(gantry_data: dict):
     print("Press q to exit")
 
     # Set mode for all gantries to 1
-    for _, gantry in gantry_data.items():
-        gantry["interface"].set_mode(1)
+    fleet.set_mode(1)
 
     while True:
         # Wait for user to press enter
@@ -48,22 +99,32 @@ def record_trajectory(gantry_data: dict):
         if button == "q":
             # If user pressed q, exit
             # Switch to mode 0
-            for _, gantry in gantry_data.items():
-                gantry["interface"].set_mode(0)
+            fleet.flush()
+            fleet.set_mode(0)
             return
 
         if button == " ":
-            # If user pressed space, record waypoint
-            for _, gantry in gantry_data.items():
-                import ipdb
-
-                gantry["interface"].add_waypoint()
+            # If user pressed space, record waypoint without waiting for the gantries
+            fleet.submit("add_waypoint")
             print("Waypoint recorded")
 
     # Print in green, saving trajectory
     print("\033[92mSaving trajectory\033[0m")
-    for _, gantry in gantry_data.items():
-        gantry["interface"].save_trajectory()
+    # Every waypoint has to be in before saving
+    fleet.flush()
+    fleet.broadcast("save_trajectory")
+    # A plan for the trajectory played before doesn't fit this one
+    plan = None
+
+    # Keep a copy on the host too, one file per recording
+    if trajectory_dir is None:
+        return
+    path = os.path.join(trajectory_dir, time.strftime("trajectory_%Y%m%d_%H%M%S.gtrj"))
+    try:
+        save_trajectories(path, fleet_trajectories(fleet))
+        print(f"Trajectory written to {path}")
+    except RuntimeError as e:
+        print(f"Trajectory not written to a file: {e}")
 
 
 def set_speed(gantry_data: dict):
@@ -75,8 +136,17 @@ def set_speed(gantry_data: dict):
     target_speed = float(target_speed)
 
     # Set target speed for all gantries
-    for _, gantry in gantry_data.items():
-        gantry["interface"].set_target_speed(target_speed)
+    fleet.set_target_speed(target_speed)
+
+
+def planned_multipliers(start: int, end: int):
+    """Multipliers for a segment from the plan, or None to read them from the gantries."""
+    if plan is None:
+        return None
+    try:
+        return plan.fleet_segment(start, end)
+    except ValueError:
+        return None
 
 
 def go_to_next(gantry_data: dict):
@@ -85,41 +155,52 @@ def go_to_next(gantry_data: dict):
     print(f"\033[92mGoing to next waypoint\033[0m")
 
     print(f"cur_waypoint: {cur_waypoint}")
-    # Set speed multipliers for all gantries
-    for _, gantry in gantry_data.items():
-        # Get current position
-        q0_pos, q1_pos = gantry["interface"].get_position()
-        # Get next waypoint
-        q0_wp, q1_wp = gantry["interface"].get_next_waypoint()
-
-        # Calculate the distance between the current position and the next waypoint
-        q0_dist = q0_wp - q0_pos
-        q1_dist = q1_wp - q1_pos
-
-        # Adjust multipliers to get both axes to reach the waypoint at the same time
-        # Fastest axis will have a multiplier of 1
-        # Slowest axis will have a multiplier of (slowest_speed / fastest_speed)
-        # Calculate the speed multiplier for each axis
-
-        q0_multiplier = abs(q0_dist) / max(abs(q0_dist), abs(q1_dist))
-        q1_multiplier = abs(q1_dist) / max(abs(q0_dist), abs(q1_dist))
-
-        # Print multipliers, waypoints, distances
-        print(f"q0_multiplier: {q0_multiplier}")
-        print(f"q1_multiplier: {q1_multiplier}")
-        print(f"q0_wp: {q0_wp}")
-        print(f"q1_wp: {q1_wp}")
-        print(f"q0_dist: {q0_dist}")
-        print(f"q1_dist: {q1_dist}")
-
-        # Set the target speed
-        gantry["interface"].set_speed_multipler(q0_multiplier, q1_multiplier)
+    multipliers = planned_multipliers(cur_waypoint, cur_waypoint + 1)
+    if multipliers is None:
+        # Not planned, read current position and next waypoint from all gantries at once,
+        # after any queued commands have moved the target
+        fleet.flush()
+        states = fleet.broadcast("get_state")
+        if not states.ok:
+            print(f"Failed to read gantry state: {states.errors}")
+            return
 
-    cur_waypoint += 1
-    # Set waypoint for all gantries
-    for _, gantry in gantry_data.items():
+        # Set speed multipliers for all gantries
+        multipliers = {}
+        for gantry_name in gantry_data:
+            q0_pos, q1_pos = states.results[gantry_name].position
+            q0_wp, q1_wp = states.results[gantry_name].next_waypoint
+
+            # Calculate the distance between the current position and the next waypoint
+            q0_dist = q0_wp - q0_pos
+            q1_dist = q1_wp - q1_pos
+
+            # Adjust multipliers to get both axes to reach the waypoint at the same time
+            # Fastest axis will have a multiplier of 1
+            # Slowest axis will have a multiplier of (slowest_speed / fastest_speed)
+            # Calculate the speed multiplier for each axis
 
-        gantry["interface"].set_target_waypoint(cur_waypoint)
+            q0_multiplier, q1_multiplier = segment_multipliers(
+                (q0_pos, q1_pos), (q0_wp, q1_wp)
+            )
+
+            # Print multipliers, waypoints, distances
+            print(f"q0_multiplier: {q0_multiplier}")
+            print(f"q1_multiplier: {q1_multiplier}")
+            print(f"q0_wp: {q0_wp}")
+            print(f"q1_wp: {q1_wp}")
+            print(f"q0_dist: {q0_dist}")
+            print(f"q1_dist: {q1_dist}")
+
+            multipliers[gantry_name] = (q0_multiplier, q1_multiplier)
+
+    # Set the target speed
+    fleet.submit_each("set_speed_multipler", multipliers)
+
+    cur_waypoint += 1
+    # Set waypoint for all gantries, starting them together where the firmware can.
+    # Queued, so the keyboard is free again while it goes out
+    fleet.submit_target_waypoint_synchronized(cur_waypoint)
 
 def go_to_previous(gantry_data: dict, waypoint_index: int):
     global cur_waypoint
@@ -128,84 +209,114 @@ def go_to_previous(gantry_data: dict, waypoint_index: int):
 
     # Print cur waypoint
     print(f"cur_waypoint: {cur_waypoint}")
-    # Set speed multipliers for all gantries
-    for _, gantry in gantry_data.items():
-        # Get current position
-        q0_pos, q1_pos = gantry["interface"].get_position()
-        # Get next waypoint
-        q0_wp, q1_wp = gantry["interface"].get_previous_waypoint()
-
-        # Calculate the distance between the current position and the next waypoint
-        q0_dist = q0_wp - q0_pos
-        q1_dist = q1_wp - q1_pos
-
-        # Adjust multipliers to get both axes to reach the waypoint at the same time
-        # Fastest axis will have a multiplier of 1
-        # Slowest axis will have a multiplier of (slowest_speed / fastest_speed)
-        # Calculate the speed multiplier for each axis
-
-        # print(f"q0_dist: {q0_dist}")
-        # print(f"q1_dist: {q1_dist}")
-
-        q0_multiplier = abs(q0_dist) / max(abs(q0_dist), abs(q1_dist))
-        q1_multiplier = abs(q1_dist) / max(abs(q0_dist), abs(q1_dist))
-        # print(f"q0_multiplier: {q0_multiplier}")
-        # print(f"q1_multiplier: {q1_multiplier}")
-        # print(f"q0_wp: {q0_wp}")
-        # print(f"q1_wp: {q1_wp}")
-        # print(f"q0_dist: {q0_dist}")
-        # print(f"q1_dist: {q1_dist}")
-
-        # Set the target speed
-        gantry["interface"].set_speed_multipler(q0_multiplier, q1_multiplier)
+    multipliers = planned_multipliers(cur_waypoint, cur_waypoint - 1)
+    if multipliers is None:
+        # Not planned, read current position and previous waypoint from all gantries at once,
+        # after any queued commands have moved the target
+        fleet.flush()
+        states = fleet.broadcast("get_state")
+        if not states.ok:
+            print(f"Failed to read gantry state: {states.errors}")
+            return
+
+        # Set speed multipliers for all gantries
+        multipliers = {}
+        for gantry_name in gantry_data:
+            q0_pos, q1_pos = states.results[gantry_name].position
+            q0_wp, q1_wp = states.results[gantry_name].previous_waypoint
+
+            # Calculate the distance between the current position and the next waypoint
+            q0_dist = q0_wp - q0_pos
+            q1_dist = q1_wp - q1_pos
+
+            # Adjust multipliers to get both axes to reach the waypoint at the same time
+            # Fastest axis will have a multiplier of 1
+            # Slowest axis will have a multiplier of (slowest_speed / fastest_speed)
+            # Calculate the speed multiplier for each axis
+
+            # print(f"q0_dist: {q0_dist}")
+            # print(f"q1_dist: {q1_dist}")
+
+            q0_multiplier, q1_multiplier = segment_multipliers(
+                (q0_pos, q1_pos), (q0_wp, q1_wp)
+            )
+            # print(f"q0_multiplier: {q0_multiplier}")
+            # print(f"q1_multiplier: {q1_multiplier}")
+            # print(f"q0_wp: {q0_wp}")
+            # print(f"q1_wp: {q1_wp}")
+            # print(f"q0_dist: {q0_dist}")
+            # print(f"q1_dist: {q1_dist}")
+
+            multipliers[gantry_name] = (q0_multiplier, q1_multiplier)
+
+    # Set the target speed
+    fleet.submit_each("set_speed_multipler", multipliers)
     cur_waypoint -= 1
 
-    # Set waypoint for all gantries
-    for _, gantry_data in gantry_data.items():
-        gantry["interface"].set_target_waypoint(cur_waypoint)
+    # Set waypoint for all gantries, starting them together where the firmware can.
+    # Queued, so the keyboard is free again while it goes out
+    fleet.submit_target_waypoint_synchronized(cur_waypoint)
 
 
 def trajectory_playback(gantry_data: dict):
-    global cur_waypoint
+    global cur_waypoint, plan
 
     # Print in green, entering playback mode
     print("\033[92mEntering playback mode\033[0m")
     print("Press d to move to next waypoint")
     print("Press a to move to previous waypoint")
+    print("Press c to play the rest of the trajectory continuously")
     print("Press q to exit")
 
 
+    # Queued commands, such as waypoints, must land before playback takes over
+    fleet.flush()
+
     cur_waypoint = 0
 
     # Set mode for all gantries to 2
-    for _, gantry in gantry_data.items():
-        gantry["interface"].set_mode(2)
-        gantry["interface"].set_target_waypoint(0)
+    fleet.set_mode(2)
+    fleet.set_target_waypoint(0)
 
 
     # Get trajectory length for all gantries, confirm they are the same and save
     # trajectory length
-    trajectory_length = None
-    for _, gantry in gantry_data.items():
-        if trajectory_length is None:
-            trajectory_length = gantry["interface"].get_trajectory_length()
-        else:
-            assert (
-                trajectory_length == gantry["interface"].get_trajectory_length()
-            ), "Trajectory lengths do not match"
+    # Keep a local copy of each trajectory so stepping doesn't re-read waypoints.
+    # Only downloaded when a mirror isn't valid, i.e. on first entry or after a
+    # save or reconnect, so coming back in after a step costs no requests
+    interfaces = fleet.interfaces
+    stale = {name: () for name, interface in interfaces.items() if not interface.trajectory.valid}
+    if stale or plan is None:
+        fleet.broadcast_each("load_trajectory", stale)
+        plan = MultiplierPlan.from_fleet(fleet)
+
+    mirrors = [interface.trajectory for interface in interfaces.values()]
+    if all(mirror.valid for mirror in mirrors):
+        lengths = {len(mirror) for mirror in mirrors}
+    else:
+        result = fleet.broadcast("get_trajectory_length")
+        assert result.ok, f"Failed to read trajectory length: {result.errors}"
+        lengths = set(result.results.values())
+    assert len(lengths) <= 1, "Trajectory lengths do not match"
+    trajectory_length = next(iter(lengths), None)
 
     print("Found trajectory of length ", trajectory_length)
+    start_telemetry()
     while True:
         print("cur_waypoint: ", cur_waypoint)
         print("trajectory_length: ", trajectory_length)
+        pending = sum(fleet.queue_depth().values())
+        if pending:
+            print(f"commands still going out: {pending}")
         button = getch()
 
         # Check if user pressed q
         if button == "q":
             # If user pressed q, exit
             # Switch to mode 0
-            for _, gantry in gantry_data.items():
-                gantry["interface"].set_mode(0)
+            fleet.flush()
+            fleet.set_mode(0)
+            stop_telemetry()
             return
 
         # Check if user pressed d
@@ -221,58 +332,98 @@ def trajectory_playback(gantry_data: dict):
                 continue
             # If user pressed a, move to previous waypoint
             go_to_previous(gantry_data, cur_waypoint)
+        elif button == "c":
+            if cur_waypoint == trajectory_length - 1:
+                print("Reached end of trajectory")
+                continue
+            # Run through to the end, sending each segment ahead of arrival
+            fleet.flush()
+            report = PlaybackEngine(fleet).run(trajectory_length, start=cur_waypoint)
+            cur_waypoint = trajectory_length - 1
+            print(report)
 
 
 def main():
-    # Set up listener
-    zeroconf = Zeroconf()
-    listener = GantryListener()
-    browser = ServiceBrowser(zeroconf, "_http._tcp.local.", listener)
-
-    # Print in green text hello
-    print(
-        "\033[92mSearching for available gantries, press enter once all gantries discovered\033[0m"
-    )
-
-    # Wait for user to press enter
-    input()
-    # Stop searching for gantries
-    zeroconf.close()
-
-    # Print in green, connecting to N gantries
-    print(
-        f"\033[92mConnecting to {len(listener.gantry_data)} gantries, press enter once all gantries connected\033[0m"
-    )
-
-    gantries = listener.gantry_data
-    for gantry_name, gantry_data in gantries.items():
-        # Create a gantry interface for each gantry
-        gantry_data["interface"] = GantryInterface()
-        # Connect to the gantry
-        gantry_data["interface"].connect(gantry_data["addresses"], gantry_data["port"])
-        gantry_data["interface"].set_mode(0)
+    global fleet
+
+    # Number of gantries to wait for can be given on the command line
+    expected = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    # and a subnet to scan when mDNS comes up short, e.g. on networks that filter multicast
+    subnet = sys.argv[2] if len(sys.argv) > 2 else None
+
+    discovery = GantryDiscovery()
+    # Each gantry is connected and put in mode 0 as soon as it is found
+    bringup = FleetBringUp(mode=0)
+    discovery.listener.on_change(bringup.on_change)
+    cached = discovery.cached()
+    if cached and (expected is None or len(cached) >= expected):
+        # Bring up the gantries seen last time straight away, and check
+        # them over mDNS in the background
+        print(f"\033[92mUsing {len(cached)} gantries from the discovery cache\033[0m")
+        for gantry_name, gantry_data in cached.items():
+            bringup.add(gantry_name, gantry_data)
+        discovery.revalidate()
+        bringup.wait_ready(names=cached)
+    else:
+        if expected is not None:
+            print(f"\033[92mSearching for {expected} gantries\033[0m")
+            found = discovery.wait(count=expected)
+        else:
+            # Print in green text hello
+            print(
+                "\033[92mSearching for available gantries, press enter once all gantries discovered\033[0m"
+            )
+            discovery.start()
+
+            # Wait for user to press enter
+            input()
+            # Take whatever has been found so far
+            found = discovery.wait(timeout=0)
+        if subnet and len(found) < (expected or 1):
+            print(f"\033[93mmDNS found {len(found)} gantries, scanning {subnet}\033[0m")
+            known = {(data["addresses"], data["port"]) for data in found.values()}
+            for gantry_name, gantry_data in GantryScanner().scan(subnet).items():
+                if (gantry_data["addresses"], gantry_data["port"]) not in known:
+                    found[gantry_name] = gantry_data
+                    bringup.add(gantry_name, gantry_data)
+        bringup.wait_ready(names=found)
+
+    gantries = bringup.gantry_data
+    print(f"\033[92mConnected to {len(gantries)} gantries\033[0m")
+    bringup.print_report()
+    # Only gantries that are still around are tried straight away next time
+    discovery.remember(gantries)
+
+    # Keep browsing, so interfaces follow gantries that change address
+    discovery.follow(gantries)
+
+    fleet = GantryFleet(gantries)
+    fleet.set_mode(0)
 
     # Enter trajectory recording mode
     record_trajectory(gantries)
 
-    while True:
+    try:
+        while True:
 
 
 
-        # Enter target speed mode
-        set_speed(gantries)
+            # Enter target speed mode
+            set_speed(gantries)
 
-        # Enter trajectory playback mode
-        trajectory_playback(gantries)
+            # Enter trajectory playback mode
+            trajectory_playback(gantries)
 
 
-        for gantry_name, gantry_data in gantries.items():
-            gantry_data["interface"].set_mode(0)
+            fleet.set_mode(0)
 
 
-        print("Idle mode")
-        print("Press enter to resume")
-        input()
+            print("Idle mode")
+            print("Press enter to resume")
+            input()
+    finally:
+        # Don't lose the end of a recording if the script is interrupted
+        stop_telemetry()
 
     # # gantry = GantryInterface()
 
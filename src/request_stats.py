@@ -0,0 +1,107 @@
+import json
+from bisect import bisect_left
+from threading import Lock
+
+# Bucket upper bounds in seconds: 100us to ~30s, roughly 10 buckets per decade
+BUCKET_BOUNDS = [1e-4 * 10 ** (i / 10) for i in range(56)]
+
+
+class LatencyHistogram:
+    """Request latencies counted into fixed, log-spaced buckets."""
+
+    def __init__(self):
+        # One extra bucket for anything slower than the last bound
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th percentile (0-100), in seconds."""
+        if not self.count:
+            return 0.0
+
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if index < len(BUCKET_BOUNDS):
+                    return min(BUCKET_BOUNDS[index], self.max)
+                return self.max
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+
+class RequestStats:
+    """Latency, failure and status-code counters keyed by (gantry, method, endpoint)."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.histograms = {}
+        self.failures = {}
+        self.status_codes = {}
+
+    def record(self, gantry: str, method: str, endpoint: str, seconds: float, status=None) -> None:
+        """Record one request. `status` is the HTTP status code, or None if it never completed."""
+        key = (gantry, method, endpoint)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram()
+                self.failures[key] = 0
+                self.status_codes[key] = {}
+            histogram.record(seconds)
+
+            if status is None:
+                self.failures[key] += 1
+            else:
+                codes = self.status_codes[key]
+                codes[status] = codes.get(status, 0) + 1
+
+    def summary(self, gantry: str = None) -> list:
+        """One dict per (gantry, method, endpoint), slowest total time first."""
+        with self._lock:
+            rows = [
+                {
+                    "gantry": key[0],
+                    "method": key[1],
+                    "endpoint": key[2],
+                    "count": histogram.count,
+                    "total_s": histogram.total,
+                    "mean_ms": histogram.mean * 1000,
+                    "p50_ms": histogram.percentile(50) * 1000,
+                    "p95_ms": histogram.percentile(95) * 1000,
+                    "p99_ms": histogram.percentile(99) * 1000,
+                    "max_ms": histogram.max * 1000,
+                    "failures": self.failures[key],
+                    "status_codes": dict(self.status_codes[key]),
+                }
+                for key, histogram in self.histograms.items()
+                if gantry is None or key[0] == gantry
+            ]
+        return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+    def dump_json(self, path: str, gantry: str = None) -> None:
+        with open(path, "w") as f:
+            json.dump(self.summary(gantry), f, indent=2)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.failures.clear()
+            self.status_codes.clear()
+
+
+# Shared by every interface in the process
+REQUEST_STATS = RequestStats()
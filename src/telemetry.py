@@ -0,0 +1,370 @@
+import math
+import mmap
+import struct
+import time
+from queue import Empty, SimpleQueue
+from threading import Condition, Lock, Thread
+from typing import Optional
+
+import numpy as np
+
+
+class PositionRingBuffer:
+    """Fixed-size ring of (timestamp, q0, q1) samples.
+
+    Every sample is written twice, at `i` and `i + capacity`, so the most recent
+    `capacity` samples always sit in one contiguous slice. That lets `window()`
+    hand back a NumPy view instead of stitching the two halves of the ring
+    together. There is a single writer; readers never block it.
+
+    Views share memory with the ring instead of copying it. A view of n rows is
+    left alone by the next `capacity - n` appends and overwritten after that,
+    so copy whatever has to outlive them.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._buffer = np.zeros((2 * capacity, 3), dtype=np.float64)
+        # Total samples ever written, bumped only after a sample is complete
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, timestamp: float, q0: float, q1: float) -> None:
+        index = self._count % self.capacity
+        buffer = self._buffer
+        buffer[index, 0] = buffer[index + self.capacity, 0] = timestamp
+        buffer[index, 1] = buffer[index + self.capacity, 1] = q0
+        buffer[index, 2] = buffer[index + self.capacity, 2] = q1
+        self._count += 1
+
+    def _span(self) -> tuple[int, int]:
+        """Start and end rows of the contiguous slice holding every live sample."""
+        count = self._count
+        end = (count - 1) % self.capacity + 1 + self.capacity if count else 0
+        return end - min(count, self.capacity), end
+
+    def latest(self, max_age: Optional[float] = None) -> Optional[np.ndarray]:
+        """Most recent sample as a read-only (timestamp, q0, q1) view.
+
+        Returns None if nothing has been sampled yet or if the sample is older
+        than `max_age` seconds.
+        """
+        if not self._count:
+            return None
+
+        _, end = self._span()
+        sample = self._buffer[end - 1]
+        if max_age is not None and time.time() - sample[0] > max_age:
+            return None
+
+        sample = sample.view()
+        sample.flags.writeable = False
+        return sample
+
+    def window(self, seconds: float) -> np.ndarray:
+        """View of the samples from the last `seconds`, oldest first, shape (n, 3).
+
+        At most `capacity - 1` samples, so the next append never lands in it.
+        """
+        start, end = self._span()
+        if start == end:
+            return self._buffer[0:0]
+        # The oldest row of a full ring is the next one to be overwritten
+        start = max(start, end - (self.capacity - 1))
+
+        times = self._buffer[start:end, 0]
+        first = start + int(np.searchsorted(times, time.time() - seconds))
+
+        view = self._buffer[first:end]
+        view.flags.writeable = False
+        return view
+
+    def clear(self) -> None:
+        self._count = 0
+
+
+# Telemetry file layout, all little-endian and append-only:
+#   header  magic, format version, column count, padded to 64 bytes
+#   chunks  one gantry each, 64-byte aligned: magic, name length, row count,
+#           UTF-8 name, then every column's rows back to back, each 64-byte aligned
+MAGIC = b"GTLM"
+CHUNK_MAGIC = b"GTCK"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+CHUNK = struct.Struct("<4sHI")
+ALIGNMENT = 64
+
+# Column names and types for format version 1. Values that weren't known when a
+# sample was taken are NaN, or -1 for the waypoint.
+COLUMNS = (
+    ("time", np.dtype("<f8")),
+    ("q0", np.dtype("<f8")),
+    ("q1", np.dtype("<f8")),
+    ("waypoint", np.dtype("<i4")),
+    ("multiplier_q0", np.dtype("<f4")),
+    ("multiplier_q1", np.dtype("<f4")),
+    ("target_speed", np.dtype("<f4")),
+)
+
+
+def _padding(offset: int) -> bytes:
+    return bytes(-offset % ALIGNMENT)
+
+
+class _Chunk:
+    """Preallocated columns for one gantry's rows until they are written out."""
+
+    def __init__(self, capacity: int):
+        self.columns = [np.empty(capacity, dtype) for _, dtype in COLUMNS]
+        self.rows = 0
+
+
+class _Stream:
+    """The chunk one gantry is filling, behind a lock of its own so gantries don't contend."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.lock = Lock()
+        self.chunk = None
+
+
+class TelemetryRecorder:
+    """Streams per-gantry samples into an append-only, chunked columnar file.
+
+    `record()` only copies a row into a preallocated chunk; full chunks are
+    handed to a writer thread, which writes each column in one go and returns
+    the chunk for reuse, so once warmed up recording allocates nothing and
+    never waits on the disk. Partly filled chunks are written every
+    `flush_interval` seconds. If the writer falls `max_pending` chunks behind,
+    new rows are dropped and counted in `dropped` rather than held up.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_rows: int = 4096,
+        max_pending: int = 64,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+
+        self.rows_written = 0
+        self.chunks_written = 0
+        self.dropped = 0
+
+        self._file = open(path, "wb")
+        header = HEADER.pack(MAGIC, VERSION, len(COLUMNS))
+        self._file.write(header + _padding(len(header)))
+        self._offset = ALIGNMENT
+
+        self._changed = Condition()
+        self._streams = {}
+        self._spare = []
+        self._pending = 0
+        self._closed = False
+        self._queue = SimpleQueue()
+        self._writer = Thread(target=self._write, name="telemetry-writer", daemon=True)
+        self._writer.start()
+
+    def record(
+        self,
+        gantry: str,
+        timestamp: float,
+        q0: float,
+        q1: float,
+        waypoint: int = -1,
+        multiplier_q0: float = math.nan,
+        multiplier_q1: float = math.nan,
+        target_speed: float = math.nan,
+    ) -> bool:
+        """Add one sample for `gantry`. False if it was dropped or the recorder is closed."""
+        stream = self._streams.get(gantry)
+        if stream is None:
+            with self._changed:
+                stream = self._streams.setdefault(gantry, _Stream(gantry))
+
+        with stream.lock:
+            # Checked under the lock, which close() waits on before writing out
+            if self._closed:
+                return False
+            chunk = stream.chunk
+            if chunk is None:
+                try:
+                    chunk = self._spare.pop()
+                except IndexError:
+                    chunk = _Chunk(self.chunk_rows)
+                stream.chunk = chunk
+
+            row = chunk.rows
+            columns = chunk.columns
+            columns[0][row] = timestamp
+            columns[1][row] = q0
+            columns[2][row] = q1
+            columns[3][row] = waypoint
+            columns[4][row] = multiplier_q0
+            columns[5][row] = multiplier_q1
+            columns[6][row] = target_speed
+            chunk.rows = row + 1
+
+            if chunk.rows == self.chunk_rows:
+                return self._hand_over(stream)
+        return True
+
+    def _hand_over(self, stream: _Stream) -> bool:
+        """Queue the stream's chunk for writing. Called with the stream's lock held.
+
+        Returns False if the writer is too far behind and the rows were dropped.
+        """
+        chunk = stream.chunk
+        with self._changed:
+            if self._pending >= self.max_pending:
+                # The disk can't keep up, lose these rows rather than stall the caller
+                self.dropped += chunk.rows
+                chunk.rows = 0
+                return False
+            self._pending += 1
+        stream.chunk = None
+        self._queue.put((stream.name, chunk))
+        return True
+
+    def _write(self) -> None:
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except Empty:
+                self.flush(wait=False)
+                continue
+            if item is None:
+                return
+
+            gantry, chunk = item
+            self._write_chunk(gantry, chunk)
+            with self._changed:
+                self.rows_written += chunk.rows
+                self.chunks_written += 1
+                chunk.rows = 0
+                self._spare.append(chunk)
+                self._pending -= 1
+                self._changed.notify_all()
+
+    def _write_chunk(self, gantry: str, chunk: _Chunk) -> None:
+        name = gantry.encode("utf-8")
+        header = CHUNK.pack(CHUNK_MAGIC, len(name), chunk.rows) + name
+        header += _padding(self._offset + len(header))
+        self._file.write(header)
+        self._offset += len(header)
+        for column in chunk.columns:
+            data = column[: chunk.rows]
+            self._file.write(data)
+            padding = _padding(self._offset + data.nbytes)
+            self._file.write(padding)
+            self._offset += data.nbytes + len(padding)
+        # A reader, or a crash, then sees whole chunks only
+        self._file.flush()
+
+    def flush(self, wait: bool = True, timeout: float = None) -> bool:
+        """Hand partly filled chunks to the writer, and wait until everything is on disk.
+
+        Returns False if `timeout` seconds pass first.
+        """
+        for stream in list(self._streams.values()):
+            with stream.lock:
+                if stream.chunk is not None and stream.chunk.rows:
+                    self._hand_over(stream)
+        if not wait:
+            return True
+        with self._changed:
+            return self._changed.wait_for(lambda: not self._pending, timeout)
+
+    def close(self) -> None:
+        """Write out everything recorded so far and close the file."""
+        if self._closed:
+            return
+        self._closed = True
+        # Let any record() already under way finish, later ones see it closed
+        for stream in list(self._streams.values()):
+            with stream.lock:
+                pass
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+
+
+class TelemetryFile:
+    """Read-only map of a telemetry file.
+
+    Every chunk's columns are NumPy views of the mapped file, so opening costs
+    a walk over the chunk headers and nothing is read until used. A chunk cut
+    short, say by a crash while recording, ends the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mapped = self._mapped
+
+        if len(mapped) < HEADER.size:
+            raise ValueError(f"{path} is not a telemetry file")
+        magic, version, count = HEADER.unpack_from(mapped, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a telemetry file")
+        if version != VERSION or count != len(COLUMNS):
+            raise ValueError(f"{path} uses unsupported telemetry format {version}")
+
+        # {gantry: [{column: view}, ...]} in recording order
+        self.chunks = {}
+        offset = ALIGNMENT
+        while offset + CHUNK.size <= len(mapped):
+            magic, name_length, rows = CHUNK.unpack_from(mapped, offset)
+            if magic != CHUNK_MAGIC:
+                break
+            start = offset + CHUNK.size
+            name = bytes(mapped[start : start + name_length]).decode("utf-8")
+            offset = start + name_length
+            offset += len(_padding(offset))
+
+            views = {}
+            for column, dtype in COLUMNS:
+                end = offset + rows * dtype.itemsize
+                if end > len(mapped):
+                    break
+                views[column] = np.frombuffer(mapped, dtype, rows, offset)
+                offset = end + len(_padding(end))
+            if len(views) != len(COLUMNS):
+                break
+            self.chunks.setdefault(name, []).append(views)
+
+    @property
+    def gantries(self) -> list:
+        return list(self.chunks)
+
+    def __len__(self):
+        return sum(len(chunk["time"]) for chunks in self.chunks.values() for chunk in chunks)
+
+    def columns(self, gantry: str) -> dict:
+        """{column: array} of everything recorded for `gantry`, oldest first.
+
+        A gantry with a single chunk gets views of the mapped file; otherwise
+        each column is joined into one array.
+        """
+        chunks = self.chunks.get(gantry)
+        if not chunks:
+            raise KeyError(gantry)
+        if len(chunks) == 1:
+            return dict(chunks[0])
+        return {
+            column: np.concatenate([chunk[column] for chunk in chunks]) for column, _ in COLUMNS
+        }
+
+
+def load_telemetry(path: str) -> dict:
+    """{gantry: {column: array}} of everything in a telemetry file."""
+    telemetry = TelemetryFile(path)
+    return {gantry: telemetry.columns(gantry) for gantry in telemetry.gantries}
@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from telemetry import TelemetryFile
+from trajectory_file import load_trajectories
+
+AXES = ("q0", "q1")
+# Per-axis metrics of every segment, in seconds or position units
+METRICS = ("arrival", "overshoot", "settling", "steady_state_error", "closest")
+
+
+def segment_tracking(columns: dict, trajectory: np.ndarray, tolerance: float = 0.05) -> dict:
+    """Per-segment tracking metrics of one gantry's telemetry against its trajectory.
+
+    `columns` are a gantry's telemetry columns and `trajectory` its waypoints
+    as an array of shape (2, N). A segment runs from the first sample with a
+    new commanded waypoint to the last one before the next. Returns arrays with
+    one row per segment, per-axis ones of shape (segments, 2):
+
+    - waypoint, start, end: the commanded waypoint and the segment's first and
+      last sample times
+    - moved: whether the axis started more than `tolerance` from the waypoint
+    - arrival: seconds until the axis first came within `tolerance`
+    - overshoot: furthest the axis went past the waypoint, 0 if it never did
+    - settling: seconds until the axis came within `tolerance` for good
+    - steady_state_error: mean signed error once settled
+    - closest: smallest distance to the waypoint over the segment
+    - axis_arrival, axis_skew: when both axes had arrived, and the gap between
+      their arrivals if both had to move
+
+    Times are only as fine as the sample rate. Metrics that a segment never
+    reached, for example because the next waypoint was commanded first, are
+    NaN. A segment already under way when recording started is measured from
+    the first sample.
+    """
+    times = np.asarray(columns["time"], dtype=np.float64)
+    waypoint = np.asarray(columns["waypoint"])
+    position = np.stack([np.asarray(columns[axis], dtype=np.float64) for axis in AXES], axis=1)
+    count = len(times)
+    trajectory = np.asarray(trajectory, dtype=np.float64)
+    if count == 0 or trajectory.shape[1] == 0:
+        return _empty_segments()
+
+    # Segments as [starts, ends) ranges that together cover every sample
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(waypoint)) + 1))
+    ends = np.append(starts[1:], count)
+    lengths = ends - starts
+
+    valid = (waypoint[starts] >= 0) & (waypoint[starts] < trajectory.shape[1])
+    targets = trajectory[:, np.clip(waypoint[starts], 0, trajectory.shape[1] - 1)].T
+    error = position - np.repeat(targets, lengths, axis=0)
+    within = np.abs(error) <= tolerance
+    index = np.arange(count)[:, None]
+    start_time = times[starts]
+
+    first_within = np.minimum.reduceat(np.where(within, index, count), starts, axis=0)
+    arrived = first_within < ends[:, None]
+    arrival = np.where(
+        arrived, times[np.minimum(first_within, count - 1)] - start_time[:, None], np.nan
+    )
+
+    # Settled from the sample after the last one outside the band, if that is in the segment
+    settle_index = np.maximum(
+        np.maximum.reduceat(np.where(within, -1, index), starts, axis=0) + 1, starts[:, None]
+    )
+    settled = settle_index < ends[:, None]
+    settling = np.where(
+        settled, times[np.minimum(settle_index, count - 1)] - start_time[:, None], np.nan
+    )
+
+    # Mean error from settling to the end of the segment, from running sums
+    sums = np.concatenate((np.zeros((1, 2)), np.cumsum(error, axis=0)))
+    axes = np.arange(2)
+    settled_sum = sums[ends[:, None], axes] - sums[settle_index, axes]
+    steady_state_error = np.where(
+        settled, settled_sum / np.maximum(ends[:, None] - settle_index, 1), np.nan
+    )
+
+    # Overshoot is error past the waypoint in the direction the axis set off in
+    offset = targets - position[starts]
+    moved = np.abs(offset) > tolerance
+    direction = np.repeat(np.sign(offset), lengths, axis=0)
+    overshoot = np.maximum(np.maximum.reduceat(error * direction, starts, axis=0), 0.0)
+    overshoot = np.where(moved, overshoot, 0.0)
+    closest = np.minimum.reduceat(np.abs(error), starts, axis=0)
+
+    # An axis that didn't have to move doesn't hold the segment up
+    axis_arrival = np.where(moved, arrival, 0.0).max(axis=1)
+    axis_arrival[np.any(moved & ~arrived, axis=1)] = np.nan
+    both = moved.all(axis=1) & arrived.all(axis=1)
+    axis_skew = np.where(both, np.abs(arrival[:, 0] - arrival[:, 1]), np.nan)
+
+    return {
+        "waypoint": waypoint[starts][valid],
+        "start": start_time[valid],
+        "end": times[ends - 1][valid],
+        "moved": moved[valid],
+        "arrival": arrival[valid],
+        "overshoot": overshoot[valid],
+        "settling": settling[valid],
+        "steady_state_error": steady_state_error[valid],
+        "closest": closest[valid],
+        "axis_arrival": axis_arrival[valid],
+        "axis_skew": axis_skew[valid],
+    }
+
+
+def _empty_segments() -> dict:
+    per_axis = np.empty((0, 2))
+    return {
+        "waypoint": np.empty(0, dtype=np.int32),
+        "start": np.empty(0),
+        "end": np.empty(0),
+        "moved": np.empty((0, 2), dtype=bool),
+        **{metric: per_axis for metric in METRICS},
+        "axis_arrival": np.empty(0),
+        "axis_skew": np.empty(0),
+    }
+
+
+def gantry_skew(segments: dict) -> np.ndarray:
+    """Spread of the gantries' arrival times, per segment.
+
+    Segments are matched across gantries by their position in each recording,
+    so every gantry should have been sent the same sequence of waypoints. A
+    segment some gantry never arrived in is NaN.
+    """
+    if not segments:
+        return np.empty(0)
+    count = min(len(s["start"]) for s in segments.values())
+    arrivals = np.stack(
+        [s["start"][:count] + s["axis_arrival"][:count] for s in segments.values()]
+    )
+    return arrivals.max(axis=0) - arrivals.min(axis=0)
+
+
+def _spread(values: np.ndarray) -> dict:
+    """Median, p95 and max of the values that aren't NaN, or NaN for all three."""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {"median": np.nan, "p95": np.nan, "max": np.nan}
+    median, p95 = np.percentile(values, (50, 95))
+    return {"median": float(median), "p95": float(p95), "max": float(values.max())}
+
+
+class TrackingReport:
+    """Tracking metrics of a recorded run, per segment and summarized per gantry and axis."""
+
+    def __init__(self, segments: dict, tolerance: float):
+        self.segments = segments
+        self.tolerance = tolerance
+        self.gantry_skew = gantry_skew(segments)
+
+    def summary(self) -> dict:
+        """Spread of each metric per gantry and axis, and of the skew between gantries.
+
+        Steady-state error is summarized by magnitude.
+        """
+        gantries = {}
+        for name, segments in self.segments.items():
+            settled = ~np.isnan(segments["settling"])
+            gantry = {
+                "segments": len(segments["start"]),
+                "unsettled": int(np.sum(~settled.all(axis=1))),
+                "axis_skew": _spread(segments["axis_skew"]),
+            }
+            for axis, label in enumerate(AXES):
+                gantry[label] = {
+                    metric: _spread(
+                        np.abs(segments[metric][:, axis])
+                        if metric == "steady_state_error"
+                        else segments[metric][:, axis]
+                    )
+                    for metric in METRICS
+                }
+            gantries[name] = gantry
+        return {"gantries": gantries, "gantry_skew": _spread(self.gantry_skew)}
+
+    def format(self) -> str:
+        """Compact text table, one line per gantry and axis."""
+        summary = self.summary()
+        lines = [
+            f"Tolerance {self.tolerance}, median/p95 except where noted",
+            f"{'gantry':<16} {'axis':<4} {'segs':>5} {'unsettled':>9} {'arrival ms':>15} "
+            f"{'overshoot max':>13} {'settling ms':>15} {'|ss error|':>19} {'axis skew ms':>15}",
+        ]
+        for name, gantry in summary["gantries"].items():
+            for label in AXES:
+                axis = gantry[label]
+                skew = gantry["axis_skew"]
+                lines.append(
+                    f"{name:<16} {label:<4} {gantry['segments']:>5} {gantry['unsettled']:>9} "
+                    f"{_pair(axis['arrival'], 1000):>15} {axis['overshoot']['max']:>13.4f} "
+                    f"{_pair(axis['settling'], 1000):>15} "
+                    f"{_pair(axis['steady_state_error'], 1, '.4f'):>19} "
+                    f"{_pair(skew, 1000):>15}"
+                )
+        skew = summary["gantry_skew"]
+        lines.append(
+            f"Gantry arrival skew ms: median {skew['median'] * 1000:.1f}, "
+            f"p95 {skew['p95'] * 1000:.1f}, max {skew['max'] * 1000:.1f}"
+        )
+        return "\n".join(lines)
+
+    def __repr__(self):
+        segments = sum(len(s["start"]) for s in self.segments.values())
+        skew = _spread(self.gantry_skew)["max"]
+        return (
+            f"TrackingReport(gantries={len(self.segments)}, segments={segments}, "
+            f"max_gantry_skew={skew * 1000:.1f}ms)"
+        )
+
+
+def _pair(spread: dict, scale: float, spec: str = ".1f") -> str:
+    return f"{spread['median'] * scale:{spec}}/{spread['p95'] * scale:{spec}}"
+
+
+def analyze(telemetry: dict, trajectories: dict, tolerance: float = 0.05) -> TrackingReport:
+    """Tracking report from {gantry: columns} and {gantry: waypoints of shape (2, N)}.
+
+    Gantries without a trajectory are left out.
+    """
+    segments = {
+        name: segment_tracking(columns, trajectories[name], tolerance)
+        for name, columns in telemetry.items()
+        if name in trajectories
+    }
+    return TrackingReport(segments, tolerance)
+
+
+def analyze_files(
+    telemetry_path: str, trajectory_path: str = None, tolerance: float = 0.05
+) -> TrackingReport:
+    """Tracking report of a telemetry file, against the trajectory file saved with it by default."""
+    if trajectory_path is None:
+        trajectory_path = os.path.splitext(telemetry_path)[0] + ".gtrj"
+    recording = TelemetryFile(telemetry_path)
+    telemetry = {name: recording.columns(name) for name in recording.gantries}
+    return analyze(telemetry, load_trajectories(trajectory_path), tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report arrival, overshoot, settling and skew of a recorded playback"
+    )
+    parser.add_argument("telemetry", help="Telemetry file (.gtlm)")
+    parser.add_argument(
+        "--trajectory", default=None, help="Trajectory file (.gtrj), default: the one saved with it"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.05)
+    parser.add_argument("--output", default=None, help="Also write the summary as JSON here")
+    args = parser.parse_args()
+
+    report = analyze_files(args.telemetry, args.trajectory, args.tolerance)
+    print(report.format())
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report.summary(), f, indent=2)
+        print(f"Summary written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import mmap
+import struct
+
+import numpy as np
+
+# File layout, all little-endian:
+#   header     magic, format version, bytes per value, gantry count
+#   directory  per gantry: name length, UTF-8 name, data offset, waypoint count
+#   data       per gantry, 64-byte aligned: all q0 values, then all q1 values
+MAGIC = b"GTRJ"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+ENTRY = struct.Struct("<QQ")
+NAME_LENGTH = struct.Struct("<H")
+ALIGNMENT = 64
+
+DTYPES = {4: np.dtype("<f4"), 8: np.dtype("<f8")}
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_trajectories(path: str, trajectories: dict, dtype=np.float64) -> None:
+    """Write {name: (q0, q1)} trajectories to a binary trajectory file.
+
+    `q0` and `q1` can be any sequences of numbers, such as the arrays of a
+    TrajectoryMirror. `dtype` is float32 or float64.
+    """
+    dtype = np.dtype(dtype).newbyteorder("<")
+    if dtype.itemsize not in DTYPES or dtype.kind != "f":
+        raise ValueError("dtype must be float32 or float64")
+
+    arrays = {}
+    for name, (q0, q1) in trajectories.items():
+        q0 = np.asarray(q0, dtype=dtype)
+        q1 = np.asarray(q1, dtype=dtype)
+        if q0.shape != q1.shape or q0.ndim != 1:
+            raise ValueError(f"{name}: q0 and q1 must be 1-D and the same length")
+        arrays[name] = (q0, q1)
+
+    names = [name.encode("utf-8") for name in arrays]
+    directory_size = sum(NAME_LENGTH.size + len(name) + ENTRY.size for name in names)
+    offset = _aligned(HEADER.size + directory_size)
+
+    directory = bytearray()
+    offsets = []
+    for name, (q0, _) in zip(names, arrays.values()):
+        directory += NAME_LENGTH.pack(len(name)) + name + ENTRY.pack(offset, len(q0))
+        offsets.append(offset)
+        offset = _aligned(offset + 2 * q0.nbytes)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, dtype.itemsize, len(arrays)))
+        f.write(directory)
+        for start, (q0, q1) in zip(offsets, arrays.values()):
+            f.seek(start)
+            f.write(q0.tobytes())
+            f.write(q1.tobytes())
+        f.truncate(offset)
+
+
+def load_trajectories(path: str) -> dict:
+    """Map a binary trajectory file and return {name: array of shape (2, N)}.
+
+    Row 0 is q0 and row 1 is q1. The arrays are read-only views of the mapped
+    file, so opening is constant time whatever the size and nothing is copied
+    until the data is used.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapped) < HEADER.size:
+        raise ValueError(f"{path} is not a trajectory file")
+    magic, version, itemsize, count = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a trajectory file")
+    if version != VERSION or itemsize not in DTYPES:
+        raise ValueError(f"{path} uses unsupported trajectory format {version}/{itemsize}")
+    dtype = DTYPES[itemsize]
+
+    trajectories = {}
+    position = HEADER.size
+    for _ in range(count):
+        (length,) = NAME_LENGTH.unpack_from(mapped, position)
+        position += NAME_LENGTH.size
+        name = bytes(mapped[position : position + length]).decode("utf-8")
+        position += length
+        offset, points = ENTRY.unpack_from(mapped, position)
+        position += ENTRY.size
+
+        if offset + 2 * points * itemsize > len(mapped):
+            raise ValueError(f"{path} is truncated")
+        trajectories[name] = np.frombuffer(
+            mapped, dtype=dtype, count=2 * points, offset=offset
+        ).reshape(2, points)
+
+    return trajectories
+
+
+def fleet_trajectories(fleet) -> dict:
+    """{name: (q0, q1)} from the fleet's trajectory mirrors, loading them if needed."""
+    trajectories = {}
+    for name, interface in fleet.interfaces.items():
+        if not interface.trajectory.valid and not interface.load_trajectory():
+            raise RuntimeError(f"Trajectory of {name} is not known locally")
+        trajectories[name] = (interface.trajectory.q0, interface.trajectory.q1)
+    return trajectories
@@ -0,0 +1,101 @@
+import numpy as np
+
+
+def segment_multipliers(start: tuple, end: tuple) -> tuple[float, float]:
+    """Speed multipliers that make both axes cover a segment in the same time.
+
+    The axis with the longer move runs at full speed (1.0) and the other is
+    slowed in proportion. A segment with no movement gets (1.0, 1.0).
+    """
+    q0_dist = abs(end[0] - start[0])
+    q1_dist = abs(end[1] - start[1])
+    longest = max(q0_dist, q1_dist)
+    if not longest > 0 or longest == float("inf"):
+        return 1.0, 1.0
+    return q0_dist / longest, q1_dist / longest
+
+
+def plan_multipliers(waypoints, min_distance: float = 1e-9) -> np.ndarray:
+    """Multipliers for every segment of one or more trajectories at once.
+
+    `waypoints` has shape (..., N, 2); the result has shape (..., N - 1, 2) and
+    row i holds the multipliers for the segment between waypoints i and i + 1.
+    The ratio doesn't depend on direction, so the same row serves i -> i + 1
+    and i + 1 -> i. Segments shorter than `min_distance`, or with non-finite
+    waypoints, get (1.0, 1.0) like segment_multipliers().
+    """
+    waypoints = np.asarray(waypoints, dtype=np.float64)
+    distances = np.abs(np.diff(waypoints, axis=-2))
+    longest = distances.max(axis=-1, keepdims=True)
+
+    usable = np.isfinite(distances).all(axis=-1, keepdims=True) & (longest > min_distance)
+    return np.where(usable, distances / np.where(usable, longest, 1.0), 1.0)
+
+
+class MultiplierPlan:
+    """Precomputed multipliers for every segment of a fleet's trajectory.
+
+    Built once from the waypoints of all gantries (shape (G, N, 2), in the
+    order of `names`), after which looking up a segment is an index into a
+    list, with no network reads during playback. Multipliers default to
+    plan_multipliers(); a retimed plan (see trajectory_retiming) passes its own
+    along with a target speed per gantry and segment.
+    """
+
+    def __init__(self, names, waypoints, multipliers=None, target_speeds=None):
+        self.names = list(names)
+        self.waypoints = np.asarray(waypoints, dtype=np.float64)
+        if self.waypoints.ndim != 3 or self.waypoints.shape[0] != len(self.names):
+            raise ValueError("waypoints must have shape (gantries, waypoints, 2)")
+
+        self.multipliers = (
+            plan_multipliers(self.waypoints) if multipliers is None else np.asarray(multipliers)
+        )
+        self.target_speeds = None if target_speeds is None else np.asarray(target_speeds)
+
+        # Plain floats per segment, ready to be sent as JSON
+        self._segments = self.multipliers.transpose(1, 0, 2).tolist()
+        self._speeds = None if target_speeds is None else self.target_speeds.T.tolist()
+
+    def __len__(self):
+        return self.waypoints.shape[1]
+
+    @classmethod
+    def from_fleet(cls, fleet):
+        """Plan from the fleet's trajectory mirrors, or None if any is unusable."""
+        mirrors = {name: interface.trajectory for name, interface in fleet.interfaces.items()}
+        if not mirrors or not all(mirror.valid for mirror in mirrors.values()):
+            return None
+        lengths = {len(mirror) for mirror in mirrors.values()}
+        if len(lengths) != 1 or lengths.pop() < 2:
+            return None
+
+        waypoints = [
+            np.stack((np.frombuffer(m.q0), np.frombuffer(m.q1)), axis=-1)
+            for m in mirrors.values()
+        ]
+        return cls(mirrors.keys(), waypoints)
+
+    def _segment_index(self, start: int, end: int) -> int:
+        if abs(end - start) != 1 or not 0 <= min(start, end) < len(self._segments):
+            raise ValueError(f"No segment between waypoints {start} and {end}")
+        return min(start, end)
+
+    def fleet_segment(self, start: int, end: int) -> dict:
+        """{name: (q0, q1)} multipliers for moving from waypoint `start` to `end`."""
+        segment = self._segments[self._segment_index(start, end)]
+        return {name: tuple(row) for name, row in zip(self.names, segment)}
+
+    def fleet_target_speeds(self, start: int, end: int):
+        """{name: (speed,)} target speeds for a segment, or None if not retimed."""
+        if self._speeds is None:
+            return None
+        speeds = self._speeds[self._segment_index(start, end)]
+        return {name: (speed,) for name, speed in zip(self.names, speeds)}
+
+    def segment(self, name: str, start: int, end: int) -> tuple[float, float]:
+        segment = self._segments[self._segment_index(start, end)]
+        return tuple(segment[self.names.index(name)])
+
+    def waypoint(self, name: str, index: int) -> tuple[float, float]:
+        return tuple(self.waypoints[self.names.index(name), index].tolist())
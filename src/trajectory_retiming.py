@@ -0,0 +1,148 @@
+import numpy as np
+
+from trajectory_planner import MultiplierPlan
+
+
+def _accel_time(speed, max_acceleration, max_jerk):
+    """Time to go from rest to `speed` with limited acceleration (and jerk)."""
+    if max_jerk is None:
+        return speed / max_acceleration
+    # Acceleration only saturates if there's time to ramp up to it
+    saturated = speed * max_jerk >= max_acceleration**2
+    return np.where(
+        saturated,
+        speed / max_acceleration + max_acceleration / max_jerk,
+        2 * np.sqrt(speed / max_jerk),
+    )
+
+
+def _peak_speed(distance, max_acceleration, max_jerk):
+    """Highest speed reachable on a rest-to-rest move of `distance`."""
+    if max_jerk is None:
+        return np.sqrt(max_acceleration * distance)
+    ratio = max_acceleration / max_jerk
+    saturated = max_acceleration * (np.sqrt(ratio**2 + 4 * distance / max_acceleration) - ratio) / 2
+    unsaturated = np.cbrt((distance * np.sqrt(max_jerk) / 2) ** 2)
+    return np.where(saturated * max_jerk >= max_acceleration**2, saturated, unsaturated)
+
+
+def move_time(distance, max_velocity, max_acceleration, max_jerk=None):
+    """Minimum time for rest-to-rest moves, element-wise.
+
+    Trapezoidal velocity profile when `max_jerk` is None, otherwise the
+    jerk-limited (double S) profile. Arguments broadcast against each other.
+    """
+    distance = np.abs(np.asarray(distance, dtype=np.float64))
+    speed = np.minimum(max_velocity, _peak_speed(distance, max_acceleration, max_jerk))
+    moving = speed > 0
+    speed = np.where(moving, speed, 1.0)
+    return np.where(moving, _accel_time(speed, max_acceleration, max_jerk) + distance / speed, 0.0)
+
+
+def cruise_speed_for(duration, distance, max_velocity, max_acceleration, max_jerk=None, iterations=30):
+    """Lowest cruise speed that still completes each move in `duration`.
+
+    With saturated acceleration the move time v / a (+ a / j) + d / v = T is a
+    quadratic in v. A jerk-limited move too short to reach full acceleration
+    takes 2 * sqrt(v / j) + d / v instead, which is solved with Newton's method
+    on whole arrays at once.
+    """
+    distance = np.abs(np.asarray(distance, dtype=np.float64))
+    duration = np.asarray(duration, dtype=np.float64)
+    moving = distance > 0
+    distance = np.where(moving, distance, 1.0)
+    duration = np.where(moving, duration, 1.0)
+
+    ramp = 0.0 if max_jerk is None else max_acceleration / max_jerk
+    shifted = duration - ramp
+    discriminant = np.maximum(shifted**2 - 4 * distance / max_acceleration, 0.0)
+    speed = max_acceleration * (shifted - np.sqrt(discriminant)) / 2
+
+    if max_jerk is not None:
+        # Start left of the root, where the move time is still above `duration`
+        root = np.sqrt(distance / duration)
+        for _ in range(iterations):
+            excess = 2 * root / np.sqrt(max_jerk) + distance / root**2 - duration
+            slope = np.minimum(2 / np.sqrt(max_jerk) - 2 * distance / root**3, -1e-12)
+            root = root - excess / slope
+        saturated = speed * max_jerk >= max_acceleration**2
+        speed = np.where(saturated, speed, root**2)
+
+    return np.where(moving, np.minimum(speed, max_velocity), 0.0)
+
+
+class Retiming:
+    """Per-segment target speeds and multipliers for a fleet's trajectory.
+
+    `durations` has one entry per segment, `target_speeds` one per gantry and
+    segment, and `multipliers` adds the axis; `cycle_time` is the predicted
+    time for the whole trajectory.
+    """
+
+    def __init__(self, waypoints, durations, target_speeds, multipliers):
+        self.waypoints = waypoints
+        self.durations = durations
+        self.target_speeds = target_speeds
+        self.multipliers = multipliers
+
+    @property
+    def cycle_time(self) -> float:
+        return float(self.durations.sum())
+
+    def plan(self, names) -> MultiplierPlan:
+        """MultiplierPlan that also sets the target speed of each segment."""
+        return MultiplierPlan(
+            names,
+            self.waypoints,
+            multipliers=self.multipliers,
+            target_speeds=self.target_speeds,
+        )
+
+
+def retime(
+    waypoints,
+    max_velocity,
+    max_acceleration,
+    max_jerk=None,
+    synchronize: bool = True,
+) -> Retiming:
+    """Time-optimal target speed and multipliers for every segment.
+
+    `waypoints` has shape (G, N, 2) for G gantries. The limits are per axis
+    and may also differ per gantry (shape (2,) or (G, 2)). Each segment takes
+    as long as its slowest axis needs at full limits, and every other axis is
+    given the lowest cruise speed that makes it arrive at the same moment. With
+    `synchronize`, a segment also takes as long as on the slowest gantry, so the
+    whole fleet arrives at each waypoint together.
+
+    The firmware runs an axis at target_speed * multiplier, so the target speed
+    of a segment is its fastest axis' cruise speed and that axis gets 1.0.
+    """
+    waypoints = np.asarray(waypoints, dtype=np.float64)
+    if waypoints.ndim != 3 or waypoints.shape[-1] != 2:
+        raise ValueError("waypoints must have shape (gantries, waypoints, 2)")
+
+    # Broadcast per-gantry limits over the segment axis: (G, 1, 2)
+    shape = (waypoints.shape[0], 2)
+    max_velocity, max_acceleration, max_jerk = [
+        None if limit is None else np.broadcast_to(np.asarray(limit, dtype=np.float64), shape)[:, None]
+        for limit in (max_velocity, max_acceleration, max_jerk)
+    ]
+
+    distances = np.abs(np.diff(waypoints, axis=1))
+    axis_times = move_time(distances, max_velocity, max_acceleration, max_jerk)
+    durations = axis_times.max(axis=-1)
+    if synchronize:
+        durations = np.broadcast_to(durations.max(axis=0), durations.shape)
+
+    speeds = cruise_speed_for(
+        durations[..., None], distances, max_velocity, max_acceleration, max_jerk
+    )
+    target_speeds = speeds.max(axis=-1)
+    moving = target_speeds > 0
+    multipliers = np.where(
+        moving[..., None], speeds / np.where(moving, target_speeds, 1.0)[..., None], 1.0
+    )
+
+    return Retiming(waypoints, durations.max(axis=0), target_speeds, multipliers)
+